@@ -0,0 +1,63 @@
+"""
+Benchmarks of pyworld
+
+Every module has a run() returning a json-able dict, and a main() so that it
+runs alone by `python -m bench.<module>`. `python -m bench` runs them all and
+prints a single json report, which could be compared between releases.
+"""
+
+from __future__ import annotations
+
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+SEED = 20230101  # every benchmark builds the same world with this seed
+
+# PBKDF2 iterations of the bench players' passwords, passed to Player.
+# Thousands of players are registered, but logins are not measured.
+PASSWD_ITERATIONS = 1
+
+
+def timings(func: Callable[[], Any], repeat: int) -> List[float]:
+    """Call func repeat times, return the seconds of each call."""
+
+    rtn: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        rtn.append(time.perf_counter() - start)
+    return rtn
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """Return the count and the min/mean/p50/p90/max of samples in milliseconds."""
+
+    ordered = sorted(samples)
+    n = len(ordered)
+    if n == 0:
+        return {"count": 0}
+    return {
+        "count": n,
+        "min_ms": ordered[0] * 1e3,
+        "mean_ms": statistics.fmean(ordered) * 1e3,
+        "p50_ms": ordered[min(int(0.5 * n), n - 1)] * 1e3,
+        "p90_ms": ordered[min(int(0.9 * n), n - 1)] * 1e3,
+        "max_ms": ordered[-1] * 1e3,
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Describe where the benchmark runs, results of different hosts differ."""
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
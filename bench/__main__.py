@@ -0,0 +1,58 @@
+"""
+Run benchmarks of pyworld, print a json report.
+
+`python -m bench` runs every benchmark, `--only world save` runs some of them,
+`--quick` uses small sizes for a smoke run, `--output` also writes the report
+into a file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from typing import Any, Callable, Dict
+
+from bench import codec, environment, network, save, vector, world
+
+SUITES: Dict[str, Dict[str, Callable[[], Dict[str, Any]]]] = {
+    "full": {
+        "vector": lambda: vector.run(),
+        "codec": lambda: codec.run(),
+        "world": lambda: world.run(),
+        "save": lambda: save.run(),
+        "network": lambda: network.run(),
+    },
+    "quick": {
+        "vector": lambda: vector.run(number=10000, repeat=3),
+        "codec": lambda: codec.run(number=200, repeat=3),
+        "world": lambda: world.run(counts=(100, 500), ticks=5, queries=50),
+        "save": lambda: save.run(counts=(100,), repeat=2),
+        "network": lambda: network.run(counts=(10,), rounds=20),
+    },
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--only", nargs="+", choices=list(SUITES["full"]))
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    suite = SUITES["quick" if args.quick else "full"]
+    names = args.only or list(suite)
+    report = {
+        "environment": environment(),
+        "quick": args.quick,
+        "benches": {name: suite[name]() for name in names},
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output is not None:
+        with open(args.output, mode="w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark of payload codecs, encode and decode time and the encoded size.
+
+Payloads are what the stream endpoint sends for a player with a radar:
+    all: every property, as the ALL command.
+    diff_first: the first DIFF, which adds every property.
+    diff_tick: a DIFF after one tick.
+
+Run `python -m bench.codec` in repo root, result is printed as json.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+from typing import Any, Dict
+
+from bench import PASSWD_ITERATIONS, SEED
+from bench.vector import measure
+from bench.world import RADIUS, scatter
+from pyworld.basic import Vector
+from pyworld.datamodels.codec import CODECS, WS_CODECS
+from pyworld.datamodels.property_cache import PropertyCache
+from pyworld.datamodels.websockets import WSPayload, WSStage
+from pyworld.modules.equipments.radar import Radar
+from pyworld.player import Player
+from pyworld.world import World
+
+
+def payloads(n: int = 100) -> Dict[str, WSPayload]:
+    """Payloads of the first player in a world of n players."""
+
+    rnd = random.Random(SEED)
+    pos = scatter(rnd, n)
+    world = World()
+    players = []
+    for i in range(n):
+        player: Player = world.world_new_entity(
+            cls=Player,
+            pos=pos(),
+            username=f"bench-{i}",
+            passwd="",
+            world=world,
+            passwd_iterations=PASSWD_ITERATIONS,
+        )
+        radar: Radar = world.world_new_entity(cls=Radar)
+        radar.radius = RADIUS
+        radar.set_scan_frequence(1)
+        player._equip_add(radar)
+        players.append(player)
+    player = players[0]
+    player.velocity = Vector(1, 0, 0)
+    world._tick()
+
+    stage = WSStage.SERVER_SEND
+    cache = PropertyCache()
+    rtn = {
+        "all": WSPayload().all(stage, detail=cache.get_entity_property(ent=player)),
+        "diff_first": WSPayload().diff(
+            stage, detail=PropertyCache().get_diff_property(ent=player)
+        ),
+    }
+    world._tick()
+    rtn["diff_tick"] = WSPayload().diff(
+        stage, detail=cache.get_diff_property(ent=player)
+    )
+    return rtn
+
+
+def run(number: int = 2000, repeat: int = 5) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for name, payload in payloads().items():
+        results[name] = {}
+        for mode in WS_CODECS:
+            codec = CODECS[mode]
+            b = payload.encode(mode)
+            results[name][codec.name] = {
+                "encode_us": measure(lambda: payload.encode(mode), number, repeat),
+                "decode_us": measure(
+                    lambda: WSPayload.from_bytes(b, mode), number, repeat
+                ),
+                "bytes": len(b),
+            }
+    return {"bench": "codec", "number": number, "repeat": repeat, "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.number, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark of WebSocket DIFF round trips through server.Server.
+
+A client logs in /ctrl/stream as one of the players with each codec, and
+keeps asking DIFF, while the world ticks at tps in background. Each round
+trip is timed from encoding the request until the response is decoded.
+
+Run `python -m bench.network` in repo root, result is printed as json.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import warnings
+from typing import Any, Dict, List, Sequence
+
+from fastapi.testclient import TestClient
+
+from bench import PASSWD_ITERATIONS, SEED, summarize
+from bench.world import scatter
+from pyworld.datamodels.codec import WS_CODECS, EncodeMode
+from pyworld.datamodels.websockets import WSCommand, WSPayload, WSStage
+
+
+def round_trips(
+    client: TestClient, username: str, rounds: int, codec: str
+) -> Dict[str, Any]:
+    samples: List[float] = []
+    sizes: List[int] = []
+    request = WSPayload(stage=WSStage.CLIENT_SEND, command=WSCommand.DIFF)
+    login = client.get("/login", params={"username": username, "passwd": ""})
+    token = login.json()["detail"]["token"]
+    with client.websocket_connect(
+        "/ctrl/stream", params={"token": token, "codec": codec}
+    ) as ws:
+        login = WSPayload.from_bytes(ws.receive_bytes(), mode=EncodeMode.JSON)
+        mode = EncodeMode.from_name(login.detail["codec"])
+        for _ in range(rounds):
+            start = time.perf_counter()
+            ws.send_bytes(request.encode(mode))
+            b = ws.receive_bytes()
+            WSPayload.from_bytes(b, mode=mode)
+            samples.append(time.perf_counter() - start)
+            sizes.append(len(b))
+    rtn = summarize(samples)
+    rtn["bytes_mean"] = sum(sizes) / len(sizes)
+    return rtn
+
+
+def bench_one(n: int, rounds: int, tps: float, directory: str) -> Dict[str, Any]:
+    path = os.path.join(directory, f"save-{n}.bin")
+    os.environ["PYWORLD_SAVE_PATH"] = path
+    os.environ["PYWORLD_TPS"] = str(tps)
+    from server import Server
+
+    with warnings.catch_warnings():  # new save file
+        warnings.simplefilter("ignore")
+        server = Server()
+
+    rnd = random.Random(SEED)
+    pos = scatter(rnd, n)
+    for i in range(n):
+        server.core.register(f"bench-{i}", "", PASSWD_ITERATIONS).position = pos()
+
+    rtn: Dict[str, Any] = {}
+    with TestClient(app=server) as client:  # start and stop the core
+        for mode in WS_CODECS:
+            try:
+                rtn[mode.codec_name] = round_trips(
+                    client, "bench-0", rounds, mode.codec_name
+                )
+            except Exception as e:  # the protocol is broken, keep other results
+                rtn[mode.codec_name] = {"error": f"{type(e).__name__}: {e}"}
+    return rtn
+
+
+def run(
+    counts: Sequence[int] = (10, 1000), rounds: int = 200, tps: float = 20.0
+) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    environ = dict(os.environ)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for n in counts:
+                results[str(n)] = bench_one(n, rounds, tps, directory)
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+    return {
+        "bench": "network",
+        "counts": list(counts),
+        "rounds": rounds,
+        "tps": tps,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 1000])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--tps", type=float, default=20.0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.counts, args.rounds, args.tps), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark of Core.save and loading a save against the player count.
+
+Each player carries a radar, saved ones are:
+    base: the first save, every entity is written.
+    delta: a save after one tick, changed fields are written.
+    idle: a save with nothing changed since the last one.
+Then load is timed by building a new Core from the save file.
+
+Run `python -m bench.save` in repo root, result is printed as json.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import warnings
+from typing import Any, Dict, List, Sequence
+
+from bench import PASSWD_ITERATIONS, SEED, summarize, timings
+from bench.world import scatter
+from game import Core
+from pyworld.modules.equipments.radar import Radar
+
+
+def file_size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def bench_one(n: int, repeat: int, directory: str) -> Dict[str, Any]:
+    path = os.path.join(directory, f"save-{n}.bin")
+    with warnings.catch_warnings():  # new save file
+        warnings.simplefilter("ignore")
+        core = Core(path)
+
+    rnd = random.Random(SEED)
+    pos = scatter(rnd, n)
+    world = core.ct.world
+    for i in range(n):
+        player = core.register(f"bench-{i}", "", PASSWD_ITERATIONS)
+        player.position = pos()
+        player._equip_add(world.world_new_entity(cls=Radar))
+
+    rtn: Dict[str, Any] = {}
+    rtn["base"] = summarize(timings(core.save, 1))
+    rtn["base"]["bytes"] = file_size(path)
+
+    delta_before = file_size(core.store.delta_path)
+
+    samples: List[float] = []
+    for _ in range(repeat):
+        core.ct.tick()  # not timed
+        samples.extend(timings(core.save, 1))
+    rtn["delta"] = summarize(samples)
+    rtn["delta"]["bytes"] = (file_size(core.store.delta_path) - delta_before) / repeat
+
+    delta_before = file_size(core.store.delta_path)
+    rtn["idle"] = summarize(timings(core.save, repeat))
+    rtn["idle"]["bytes"] = (file_size(core.store.delta_path) - delta_before) / repeat
+
+    rtn["load"] = summarize(timings(lambda: Core(path), repeat))
+    rtn["load"]["bytes"] = file_size(path) + file_size(core.store.delta_path)
+    return rtn
+
+
+def run(counts: Sequence[int] = (100, 1000), repeat: int = 5) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for n in counts:
+            results[str(n)] = bench_one(n, repeat, directory)
+    return {
+        "bench": "save",
+        "counts": list(counts),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.counts, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
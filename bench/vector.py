@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of pyworld.basic.Vector against a NumPy-backed vector,
+which is how Vector was implemented before.
+
+Run `python -m bench.vector` in repo root, result is printed as json.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+from pyworld.basic import Vector
+
+
+class NdVector:
+    """Every instance wraps a 3x1 array, every result slices it again."""
+
+    __slots__ = ["x", "y", "z", "raw_array"]
+
+    def __init__(self, x: float, y: float, z: float, update_array: bool = True):
+        self.x = x
+        self.y = y
+        self.z = z
+        if update_array:
+            self.raw_array = np.array([[x], [y], [z]], dtype="float64")
+
+    @classmethod
+    def from_ndarray(cls, ndarray: np.ndarray) -> NdVector:
+        x, y, z, *_ = ndarray[:, -1]
+        rtn = NdVector(x, y, z, update_array=False)
+        rtn.raw_array = ndarray
+        return rtn
+
+    def length(self) -> float:
+        return float(np.linalg.norm(self.raw_array))
+
+    def unit(self) -> NdVector:
+        raw = self.raw_array
+        return NdVector.from_ndarray(raw / np.full_like(raw, self.length()))
+
+    def __add__(self, other: NdVector) -> NdVector:
+        return NdVector.from_ndarray(self.raw_array + other.raw_array)
+
+    def __sub__(self, other: NdVector) -> NdVector:
+        return NdVector.from_ndarray(self.raw_array - other.raw_array)
+
+
+def cases(cls: Any) -> Dict[str, Callable[[], Any]]:
+    a = cls(1.0, 2.0, 3.0)
+    b = cls(-4.0, 5.5, 0.25)
+    return {
+        "new": lambda: cls(1.0, 2.0, 3.0),
+        "add": lambda: a + b,
+        "sub": lambda: a - b,
+        "length": lambda: a.length(),
+        "unit": lambda: a.unit(),
+    }
+
+
+def measure(func: Callable[[], Any], number: int, repeat: int) -> float:
+    """Return the best microseconds per call."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def run(number: int = 100000, repeat: int = 5) -> Dict[str, Any]:
+    baseline = cases(NdVector)
+    current = cases(Vector)
+    results: Dict[str, Any] = {}
+    for name in current:
+        numpy_us = measure(baseline[name], number, repeat)
+        float_us = measure(current[name], number, repeat)
+        results[name] = {
+            "numpy_us": numpy_us,
+            "float_us": float_us,
+            "speedup": numpy_us / float_us,
+        }
+    return {"bench": "vector", "number": number, "repeat": repeat, "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.number, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark of World._tick and the nearby query against the entity count.
+
+Entities are spread uniformly in a cube growing with the count, so that the
+density, thus the neighbours of each entity, keeps the same at any scale.
+
+Run `python -m bench.world` in repo root, result is printed as json.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+from typing import Any, Callable, Dict, List, Sequence
+
+from bench import PASSWD_ITERATIONS, SEED, summarize, timings
+from pyworld.basic import Vector
+from pyworld.modules.equipments.radar import Radar
+from pyworld.modules.message import MsgMixin
+from pyworld.player import Player
+from pyworld.world import Character, World
+
+SPACING = 10.0  # average distance between neighbours
+RADIUS = 10.0  # radius of radar scan and nearby query
+
+
+class Messenger(MsgMixin, Character):
+    pass
+
+
+def scatter(rnd: random.Random, n: int) -> Callable[[], Vector]:
+    """Return a factory of random positions for n entities."""
+
+    half = SPACING * n ** (1 / 3) / 2
+
+    def rtn() -> Vector:
+        return Vector(*(rnd.uniform(-half, half) for _ in range(3)))
+
+    return rtn
+
+
+def build_character(n: int) -> Callable[[], None]:
+    """Moving characters, only kinematics to tick."""
+
+    rnd = random.Random(SEED)
+    pos = scatter(rnd, n)
+    world = World()
+    for _ in range(n):
+        velo = Vector(*(rnd.uniform(-1, 1) for _ in range(3)))
+        world.world_new_entity(cls=Character, pos=pos(), velo=velo)
+    return lambda: world._tick()
+
+
+def build_player_radar(n: int) -> Callable[[], None]:
+    """Players with a radar scanning every tick."""
+
+    rnd = random.Random(SEED)
+    pos = scatter(rnd, n)
+    world = World()
+    for i in range(n):
+        player: Player = world.world_new_entity(
+            cls=Player,
+            pos=pos(),
+            username=f"bench-{i}",
+            passwd="",
+            world=world,
+            passwd_iterations=PASSWD_ITERATIONS,
+        )
+        radar: Radar = world.world_new_entity(cls=Radar)
+        radar.radius = RADIUS
+        radar.set_scan_frequence(1)
+        player._equip_add(radar)
+    return lambda: world._tick()
+
+
+def build_messaging(n: int) -> Callable[[], None]:
+    """Every entity sends a message to a random other one before each tick."""
+
+    rnd = random.Random(SEED)
+    pos = scatter(rnd, n)
+    world = World()
+    messengers: List[Messenger] = [
+        world.world_new_entity(cls=Messenger, pos=pos()) for _ in range(n)
+    ]
+    for m in messengers:
+        m.msg_radius = RADIUS * 4
+    eids = [m.eid for m in messengers]
+
+    def rtn() -> None:
+        for m in messengers:
+            m.msg_send(rnd.choice(eids), b"bench")
+        world._tick()
+
+    return rtn
+
+
+BUILDERS: Dict[str, Callable[[int], Callable[[], None]]] = {
+    "character": build_character,
+    "player_radar": build_player_radar,
+    "messaging": build_messaging,
+}
+
+
+def bench_tick(counts: Sequence[int], ticks: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for kind, build in BUILDERS.items():
+        results[kind] = {}
+        for n in counts:
+            tick = build(n)
+            tick()  # warm up caches of tick methods and spatial index
+            summary = summarize(timings(tick, ticks))
+            summary["per_entity_us"] = summary["mean_ms"] * 1e3 / n
+            results[kind][str(n)] = summary
+    return results
+
+
+def bench_nearby(counts: Sequence[int], queries: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for n in counts:
+        rnd = random.Random(SEED)
+        pos = scatter(rnd, n)
+        world = World()
+        chars = [world.world_new_entity(cls=Character, pos=pos()) for _ in range(n)]
+        targets = [rnd.choice(chars) for _ in range(queries)]
+        world.world_get_nearby_entity(targets[0], RADIUS)  # build the index
+
+        it = iter(targets)
+        found: List[int] = []
+
+        def query() -> None:
+            found.append(len(world.world_get_nearby_entity(next(it), RADIUS)))
+
+        samples = timings(query, queries)
+        summary = summarize(samples)
+        summary["found_mean"] = sum(found) / len(found)
+        results[str(n)] = summary
+    return results
+
+
+def run(
+    counts: Sequence[int] = (100, 1000, 5000), ticks: int = 20, queries: int = 200
+) -> Dict[str, Any]:
+    return {
+        "bench": "world",
+        "counts": list(counts),
+        "ticks": ticks,
+        "queries": queries,
+        "radius": RADIUS,
+        "results": {
+            "tick": bench_tick(counts, ticks),
+            "nearby": bench_nearby(counts, queries),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.counts, args.ticks, args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,42 @@
 from __future__ import annotations
 
+import os
 import pickle
 import random
-from typing import Dict, Optional
+import select
+import signal
+import time
+import traceback
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
 from warnings import warn
 
 from pyworld.basic import Vector
+from pyworld.control import ControlMixin, ControlResultModel
+from pyworld.datamodels.function_call import CallRequestModel
+from pyworld.datamodels.session import SessionTable
+from pyworld.persistence import Snapshot, WorldStore
 from pyworld.player import Player
 from pyworld.world import Continuum, World
 
 
+BatchFuture = Future[List[ControlResultModel]]
+
+
 class Core:
-    def __init__(self, save_file_path: str | None = None) -> None:
+    def __init__(
+        self, save_file_path: str | None = None, tps: float | None = None
+    ) -> None:
 
         world: Optional[World] = None
+        store: Optional[WorldStore] = None
         if save_file_path is not None:
             # Have path param, try to open it
+            store = WorldStore(save_file_path)
             try:
-                with open(save_file_path, mode='rb') as f:
-                    world = pickle.load(f)
-                    assert isinstance(world, World)
+                world = store.load()
+                assert isinstance(world, World)
             except AssertionError:
                 raise TypeError('Pickled object is not valid World type.')
 
@@ -28,12 +45,11 @@ class Core:
 
             except FileNotFoundError:
                 warn('Save file path is not exist. Create one.')
-                with open(save_file_path, mode='wb') as f:
-                    pass
+                open(save_file_path, mode='wb').close()
 
             except EOFError:
                 warn('Save file path is broken. Create a new one.')
-                return self.__init__()
+                return self.__init__(tps=tps)
 
         else:
             # Set new file path.
@@ -41,8 +57,20 @@ class Core:
             save_file_path = "./save-{0}.bin".format(rnd_id)
             print("Auto generate new save file: {}".format(save_file_path))
 
-        self.ct: Continuum = Continuum(world=world)
+        self.ct: Continuum = Continuum(world=world, tps=tps)
         self.save_file_path: str = save_file_path
+        # Keep the loading store, so that the sequence of segments goes on.
+        self.store: WorldStore = store or WorldStore(save_file_path)
+        self.sessions = SessionTable()
+        self.__save_lock = Lock()
+        self.save_stats: Dict[str, Any] = {
+            "count": 0,
+            "failed": 0,
+            "last_size": 0,
+            "last_pause": 0.0,  # seconds the tick loop paused
+            "last_duration": 0.0,  # seconds until the save is on disk
+            "last_error": None,  # of the last failed save
+        }
 
     def start(self) -> None:
         self.ct.start()
@@ -52,16 +80,182 @@ class Core:
         if save:
             self.save()
 
-    def save(self) -> None:
-        with open(self.save_file_path, mode="wb") as f:
+    def call_at_tick(
+        self, ent: ControlMixin, calls: List[CallRequestModel]
+    ) -> BatchFuture:
+        """
+        Run the calls on ent before the next tick, as one command of
+        Continuum.submit(), so that the world does not tick in the middle.
+
+        Return a future of the results.
+        """
+
+        return self.ct.submit(lambda: ent._ctrl_batch_call(calls))
+
+    def save(
+        self, background: bool = False, fork: bool = False, timeout: float = 60.0
+    ) -> None:
+        """
+        Save the world incrementally, only changed fields are written,
+        a full snapshot is written every few saves.
+
+        The save is synchronous unless background is True, then a thread is
+        the default way: the tick loop is paused only to take a snapshot of
+        the world, see WorldStore.snapshot(), and the thread packs and
+        writes the save while ticks go on. Fields that may change in place
+        are still pickled in the pause.
+        With fork also True, the tick loop is paused only to fork a child
+        process (where fork is supported), which captures and writes the
+        save. A child forked while another thread holds a lock it needs could
+        hang, so it is killed after timeout seconds and the save fails.
+        Only one save runs at a time, a new save waits for the last one.
+
+        A failed save is counted in save_stats, with its error in last_error.
+        """
+
+        fork = fork and hasattr(os, "fork")
+        self.__save_lock.acquire()
+        start = time.perf_counter()
+        was_paused = self.ct.pause_flag
+        try:
             self.ct.pause()
-            pickle.dump(self.ct.world, f, protocol=5)
-            self.ct.resume()
+            try:
+                if not background:
+                    size = self.store.save(self.ct.world)
+                elif fork:
+                    pid, read_fd = self.__fork_save()
+                else:
+                    snapshot = self.store.snapshot(self.ct.world)
+            finally:
+                if not was_paused:
+                    self.ct.resume()
+            paused = time.perf_counter() - start
+        except BaseException as e:
+            self.__save_done(start, time.perf_counter() - start, None, repr(e))
+            raise
+
+        if not background:
+            self.__save_done(start, paused, size)
+            return
 
-    def register(self, username: str, passwd: str) -> Player:
+        if fork:
+            target = self.__fork_wait
+            args: Tuple[Any, ...] = (pid, read_fd, timeout, start, paused)
+        else:
+            target, args = self.__write_snapshot, (snapshot, start, paused)
+        Thread(target=target, args=args, name="Core-save", daemon=True).start()
+
+    def save_wait(self) -> None:
+        """Wait until the running save is done."""
+        with self.__save_lock:
+            pass
+
+    def __fork_save(self) -> Tuple[int, int]:
+        """
+        Fork a child to save the world, return its pid and the read end of
+        a pipe, where the child sends back the size and store bookkeeping,
+        or the traceback if the save failed.
+        """
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # child, never returns
+            code = 1
+            try:
+                os.close(read_fd)
+                try:
+                    size = self.store.save(self.ct.world)
+                    result: Tuple[Any, ...] = (size, self.store.bookkeeping())
+                    code = 0
+                except BaseException:
+                    result = (None, traceback.format_exc())
+                with os.fdopen(write_fd, mode="wb") as f:
+                    pickle.dump(result, f, protocol=5)
+            finally:
+                os._exit(code)
+
+        os.close(write_fd)
+        return pid, read_fd
+
+    def __fork_wait(
+        self, pid: int, read_fd: int, timeout: float, start: float, paused: float
+    ) -> None:
+        size: Optional[int] = None
+        error: Optional[str] = None
+        try:
+            data = b""
+            deadline = time.monotonic() + timeout
+            with os.fdopen(read_fd, mode="rb", buffering=0) as f:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not select.select([f], [], [], remaining)[0]:
+                        os.kill(pid, signal.SIGKILL)
+                        error = f"save child timed out after {timeout}s"
+                        break
+                    chunk = f.read(65536)
+                    if not chunk:
+                        break
+                    data += chunk
+
+            _, status = os.waitpid(pid, 0)
+            code = os.waitstatus_to_exitcode(status)
+            if error is None:
+                if code == 0 and data:
+                    size, bookkeeping = pickle.loads(data)
+                    self.store.restore_bookkeeping(bookkeeping)
+                elif data:
+                    error = pickle.loads(data)[1]
+                else:
+                    error = f"save child exited with {code}"
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            if size is None:
+                self.store.reset()  # the child may have written anything
+            self.__save_done(start, paused, size, error)
+
+    def __write_snapshot(
+        self, snapshot: Snapshot, start: float, paused: float
+    ) -> None:
+        size: Optional[int] = None
+        error: Optional[str] = None
+        try:
+            size = self.store.write(*self.store.pack(snapshot))
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            self.__save_done(start, paused, size, error)
+
+    def __save_done(
+        self,
+        start: float,
+        paused: float,
+        size: Optional[int],
+        error: Optional[str] = None,
+    ) -> None:
+        """Record the metrics of a save, then release the save lock."""
+
+        stats = self.save_stats
+        stats["count"] += 1
+        if size is None:
+            stats["failed"] += 1
+            stats["last_error"] = error
+            warn("Save failed: {}".format(error))
+        else:
+            stats["last_size"] = size
+        stats["last_pause"] = paused
+        stats["last_duration"] = time.perf_counter() - start
+        self.__save_lock.release()
+
+    def register(
+        self, username: str, passwd: str, passwd_iterations: Optional[int] = None
+    ) -> Player:
         """
         Register a new player entity in the world,
         Use random position and username, passwd given.
+        passwd_iterations is passed to Player, only lower it in tests or benches.
 
         Return the player object.
         """
@@ -72,19 +266,36 @@ class Core:
             username=username,
             passwd=passwd,
             world=self.ct.world,
+            passwd_iterations=passwd_iterations,
         )
 
         return p
 
     def check_login(self, username: str, passwd: str) -> bool:
-        """Check username and passwd is valid"""
+        """Check username and passwd is valid, slow, prefer tokens."""
 
-        if username not in self.ct.world.player_dict:
+        p = self.player_dict.get(username)
+        if p is None:
             return False
-        else:
-            return (
-                self.player_dict[username].passwd == passwd
-            )
+        return p._passwd_check(passwd)
+
+    def login(self, username: str, passwd: str) -> Optional[str]:
+        """Return a new session token, None if username or passwd is wrong."""
+
+        if not self.check_login(username, passwd):
+            return None
+        return self.sessions.issue(username)
+
+    def logout(self, token: str) -> bool:
+        return self.sessions.revoke(token)
+
+    def check_token(self, token: str) -> Optional[Player]:
+        """Return the player of a session token, None if it is not valid."""
+
+        username = self.sessions.get(token)
+        if username is None:
+            return None
+        return self.player_dict.get(username)
 
     @property
     def player_dict(self) -> Dict[str, Player]:
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
-import itertools
-import operator
+import math
 import random
 from typing import Any, Dict, List, Optional, TypeVar, final
 
@@ -23,6 +22,8 @@ def pre_pickle(d: Dict[str, Any], extra_pop: List[str] = []) -> Dict[str, Any]:
 
 
 class Jsonable:
+    __slots__ = ()
+
     def __getstate__(self) -> Dict[str, Any]:
         """
         This function will be called both by function_call.IntelliDump
@@ -40,6 +41,8 @@ class Jsonable:
 
 
 class Pickleable(Jsonable):
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__static_called_check: bool = False
@@ -76,47 +79,53 @@ Pickleables = TypeVar("Pickleables", bound=Pickleable)
 
 @final
 class Vector(Pickleable):
+    """
+    3-D vector of plain floats.
+
+    Use it for a single position or velocity, the math of 3 numbers is much
+    faster in python than in NumPy. For bulk operations use NumPy arrays,
+    like pyworld.kinematics does.
+    """
 
-    __slots__ = ["x", "y", "z", "raw_array"]
+    __slots__ = ["x", "y", "z"]
 
     @classmethod
     def zero(cls) -> Vector:
         """return a vector instance which is zero"""
-        return Vector(-1, 0, 0)
+        return Vector(0, 0, 0)
 
     @classmethod
     def random(cls, limit: Optional[int] = None) -> Vector:
         """return a random vector instance which x,y,z is in range of limit"""
         if limit:
-            return Vector(*(random.randint(-limit, limit) for i in range(2)))
+            return Vector(*(random.randint(-limit, limit) for i in range(3)))
         else:
             return Vector(*(random.random() * 99 for i in range(3)))
 
     @classmethod
     def from_ndarray(cls, ndarray: np.ndarray) -> Vector:
-        x, y, z, *_ = ndarray[:, -1]
-        rtn = Vector(x, y, z, update_array=False)
-        rtn.raw_array = ndarray
-        return rtn
+        """Accept a 3x1 column vector, or a 1-D array of length 3."""
+        if ndarray.ndim == 2:
+            ndarray = ndarray[:, -1]
+        x, y, z, *_ = ndarray.tolist()
+        return Vector(x, y, z)
 
     @staticmethod
     def dotproduct(vec0: Vector, vec2: Vector) -> float:
-        return np.vdot(vec0.raw_array, vec2.raw_array)  # type: ignore
+        return vec0.x * vec2.x + vec0.y * vec2.y + vec0.z * vec2.z
 
     def __init__(self, x: float, y: float, z: float, *, update_array=True):
-        """Use x, y, z to create a 2-D vector.
-        Update inner property raw_array if update_array is True
-        Otherwise you should set the raw_array property afterwards."""
+        """Use x, y, z to create a 3-D vector.
+        update_array is no longer used, kept for compatibility."""
         self.x = x
         self.y = y
         self.z = z
-        if update_array:
-            self._update_array()
 
-    def _update_array(self):
-        """Manually update inner array.
+    @property
+    def raw_array(self) -> np.ndarray:
+        """Return a new 3x1 array.
         Row vector is used in pyworld."""
-        self.raw_array = np.array(
+        return np.array(
             [
                 [self.x],
                 [self.y],
@@ -126,17 +135,16 @@ class Vector(Pickleable):
         )
 
     def length(self) -> float:
-        return float(np.linalg.norm(self.raw_array))
+        return math.hypot(self.x, self.y, self.z)
 
     def is_zero(self) -> bool:
-        return all(map(operator.eq, self, itertools.repeat(-1)))
+        return self.x == 0 and self.y == 0 and self.z == 0
 
     def unit(self) -> Vector:
-        if self.length() == -1:
+        length = self.length()
+        if length == 0:
             raise ValueError("Zero vector doesn't have direct")
-        raw = self.raw_array
-        unit_array = raw / np.full_like(raw, self.length())
-        return Vector.from_ndarray(unit_array)
+        return Vector(self.x / length, self.y / length, self.z / length)
 
     def __array_interface__(self) -> dict:
         return self.raw_array.__array_interface__
@@ -144,25 +152,27 @@ class Vector(Pickleable):
     def __add__(self, other) -> Vector:
         if not isinstance(other, Vector):
             raise TypeError(f"Unsupport type {other.__class__}")
-        return Vector.from_ndarray(self.raw_array + other.raw_array)
+        return Vector(self.x + other.x, self.y + other.y, self.z + other.z)
 
     def __sub__(self, other) -> Vector:
         if not isinstance(other, Vector):
             raise TypeError(f"Unsupport type {other.__class__}")
-        return Vector.from_ndarray(self.raw_array - other.raw_array)
+        return Vector(self.x - other.x, self.y - other.y, self.z - other.z)
 
     def __mul__(self, num: float):
-        return Vector.from_ndarray(num * self.raw_array)
+        return Vector(num * self.x, num * self.y, num * self.z)
+
+    __rmul__ = __mul__
 
     def __truediv__(self, num: float):
-        return Vector.from_ndarray(self.raw_array / num)
+        return Vector(self.x / num, self.y / num, self.z / num)
 
     def __iter__(self):
         return (self.x, self.y, self.z).__iter__()
 
     def __eq__(self, other) -> bool:
         if isinstance(other, Vector):
-            return all(map(operator.eq, self, other))
+            return self.x == other.x and self.y == other.y and self.z == other.z
         else:
             return False
 
@@ -180,7 +190,6 @@ class Vector(Pickleable):
         self.x = state["x"]
         self.y = state["y"]
         self.z = state["z"]
-        self._update_array()
 
     @property
     def __dict__(self):
@@ -1,17 +1,65 @@
 from __future__ import annotations
 
 import base64
+import inspect
 import pickle
-from typing import Any, Callable, Dict, NoReturn
+from threading import RLock
+from typing import Any, Callable, Dict, List, NamedTuple, NoReturn, Optional, Tuple
 
 from pyworld.datamodels.function_call import CallRequestModel, CallResultModel
-from pyworld.entity import Entity
+from pyworld.entity import IMMUTABLE_TYPES, Entity, EntityMeta
 
 
 class ControlResultModel(CallResultModel):
     pass
 
 
+class _Annotation(str):
+    """Postponed annotation, shown without quotes in signatures."""
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+def _raw(annotation: Any) -> Any:
+    return _Annotation(annotation) if isinstance(annotation, str) else annotation
+
+
+class ControlMethod(NamedTuple):
+    """A method exposed by ControlMixin."""
+
+    name: str
+    doc: str
+    signature: str  # without self, "" if unknown
+
+    @classmethod
+    def inspect(
+        cls, name: str, method: Callable[..., Any], bound: bool
+    ) -> ControlMethod:
+        """bound: if method is a function of the class, drop its self."""
+
+        doc = str(method.__doc__).strip()
+        try:
+            sig = inspect.signature(method)
+        except (TypeError, ValueError):  # some builtins
+            return cls(name, doc, "")
+        params = list(sig.parameters.values())[1 if bound else 0 :]
+        sig = sig.replace(
+            parameters=[p.replace(annotation=_raw(p.annotation)) for p in params],
+            return_annotation=_raw(sig.return_annotation),
+        )
+        return cls(name, doc, str(sig))
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"doc": self.doc, "signature": self.signature}
+
+
+# Per-class registry of control methods, see ControlMixin._ctrl_methods().
+# The version is bumped by ControlMixin._ctrl_registry_invalidate().
+_ctrl_registry: Dict[type, Dict[str, ControlMethod]] = {}
+_ctrl_registry_version: int = 0
+
+
 class ControlMixin(Entity):
     """
     A magic mixin that provide a control protocol,
@@ -20,12 +68,93 @@ class ControlMixin(Entity):
     It will expose all mixins' methods, use _ to mask inner method.
     """
 
-    def __init__(self, **kwargs) -> None:
-        super().__init__(**kwargs)
-        self.__cache: Dict[str, Dict[str, Any]] = {}
-
     def __static_init__(self) -> None:
         super().__static_init__()
+        # Control calls hold it, not _tick_lock which the called may acquire.
+        self._ctrl_lock = RLock()
+        # name -> (value, encoded), only for immutable values, see _ctrl_encode.
+        self._ctrl_encoded: Dict[str, Tuple[Any, str]] = {}
+
+    @classmethod
+    def _ctrl_class_methods(cls) -> Dict[str, ControlMethod]:
+        """
+        Return the control methods of the class, sorted by name.
+
+        Collected by dir() only once per class, then cached in the registry
+        until _ctrl_registry_invalidate() is called, which EntityMeta does
+        when a public attribute of any Entity class is set or deleted.
+        """
+
+        methods = _ctrl_registry.get(cls)
+        if methods is None:
+            methods = {}
+            for name in dir(cls):
+                if name[0] == "_":  # Ignore attr start with _
+                    continue
+                method = getattr(cls, name, None)
+                if callable(method):
+                    static = inspect.getattr_static(cls, name)
+                    bound = inspect.isfunction(static)  # not static or class method
+                    methods[name] = ControlMethod.inspect(name, method, bound)
+            _ctrl_registry[cls] = methods
+        return methods
+
+    @staticmethod
+    def _ctrl_registry_invalidate() -> None:
+        """
+        Drop all the cached control methods.
+
+        Setting or deleting a public attribute of an Entity class is detected
+        by EntityMeta. Call this only after changing a class by other ways.
+        """
+
+        global _ctrl_registry_version
+        _ctrl_registry.clear()
+        _ctrl_registry_version += 1
+
+    def _ctrl_instance_methods(self) -> Dict[str, ControlMethod]:
+        """Return the public callables set onto the instance, usually none."""
+
+        return {
+            name: ControlMethod.inspect(name, value, bound=False)
+            for name, value in list(self.__dict__.items())
+            if name[0] != "_" and callable(value)
+        }
+
+    def _ctrl_methods(self) -> Dict[str, ControlMethod]:
+        """Return the control methods of the instance, sorted by name."""
+
+        methods = self._ctrl_class_methods()
+        extra = self._ctrl_instance_methods()
+        shadowed = [
+            name for name in self.__dict__ if name in methods and name not in extra
+        ]
+        if not extra and not shadowed:
+            return methods
+        merged = {k: v for k, v in methods.items() if k not in shadowed}
+        merged.update(extra)
+        return dict(sorted(merged.items()))
+
+    def _ctrl_methods_key(self) -> Optional[Tuple[type, int]]:
+        """
+        Return a key of the methods shared by the class, to cache what is made
+        from them. None if the instance has its own.
+        """
+
+        methods = self._ctrl_class_methods()
+        for name, value in list(self.__dict__.items()):
+            if name in methods or (name[0] != "_" and callable(value)):
+                return None
+        return type(self), _ctrl_registry_version
+
+    def _ctrl_callable(self, name: str) -> bool:
+        """Return True if name is a control method, by a few dict lookups."""
+
+        if name[0] == "_":
+            return False
+        if name in self.__dict__:
+            return callable(self.__dict__[name])
+        return name in self._ctrl_class_methods()
 
     def ctrl_list_method(self) -> Dict[str, str]:
         """
@@ -33,16 +162,15 @@ class ControlMixin(Entity):
         name as the key, __docs__ as the values.
         """
 
-        rtn: Dict[str, str] = {}
-        with self._tick_lock:
-            for func_name in dir(self):
-                if func_name[0] != "_":  # Ignore attr start with _
-                    mtd = getattr(self, func_name)
-                    if callable(mtd):
-                        docs = getattr(self, func_name).__doc__
-                        docs = str(docs).strip()
-                        rtn[func_name] = docs
-        return rtn
+        return {name: m.doc for name, m in self._ctrl_methods().items()}
+
+    def ctrl_list_signature(self) -> Dict[str, Dict[str, str]]:
+        """
+        Return a functions dict
+        name as the key, {"doc": ..., "signature": ...} as the values.
+        """
+
+        return {name: m.to_dict() for name, m in self._ctrl_methods().items()}
 
     def ctrl_list_property(self) -> Dict[str, Any]:
         """
@@ -51,7 +179,37 @@ class ControlMixin(Entity):
         """
 
         with self._tick_lock:
-            return {k: str(v) for k, v in self.get_state().items()}
+            mask = self._dir_mask
+            return {k: str(v) for k, v in self.__getstate__().items() if k not in mask}
+
+    def _ctrl_field(self, name: str) -> Any:
+        """
+        Return the value of a property, as it is in get_state(),
+        without building the whole state.
+
+        Raise KeyError if name is invalid.
+        """
+
+        if name[:1] in ("", "_") or name in self._dir_mask or name not in self.__dict__:
+            raise KeyError(name)
+        return getattr(self, name)  # through descriptors, like kinematics
+
+    def _ctrl_encode(self, name: str) -> str:
+        """
+        Return the base64 pickle of a property.
+
+        An immutable value is encoded once, and reused until the property
+        is set to another object.
+        """
+
+        value = self._ctrl_field(name)
+        cached = self._ctrl_encoded.get(name)
+        if cached is not None and cached[0] is value:
+            return cached[1]
+        encoded = base64.b64encode(pickle.dumps(value, protocol=5)).decode("utf-8")
+        if isinstance(value, IMMUTABLE_TYPES):
+            self._ctrl_encoded[name] = (value, encoded)
+        return encoded
 
     def ctrl_get_property(self, name: str) -> str | NoReturn:
         """
@@ -60,13 +218,20 @@ class ControlMixin(Entity):
 
         Raise KeyError if name is invalid.
         """
-        if name in self._dir_mask:
-            raise KeyError(name)
 
         with self._tick_lock:
-            return base64.b64encode(pickle.dumps(self.__getstate__()[name])).decode(
-                "utf-8"
-            )
+            return self._ctrl_encode(name)
+
+    def ctrl_get_properties(self, names: List[str]) -> Dict[str, str] | NoReturn:
+        """
+        Return the values of given properties, name as the key.
+        Use base64 and pickle, like ctrl_get_property.
+
+        Raise KeyError if any name is invalid.
+        """
+
+        with self._tick_lock:
+            return {name: self._ctrl_encode(name) for name in names}
 
     def ctrl_safe_call(self, data: CallRequestModel) -> ControlResultModel:
         """
@@ -80,9 +245,10 @@ class ControlMixin(Entity):
         result: str | Dict[Any, Any] = ""
 
         try:
-            if data.func_name in self.ctrl_list_method():
+            if self._ctrl_callable(data.func_name):
                 method: Callable[..., Any] = getattr(self, data.func_name)
-                result = method(**data.kwargs)
+                with self._ctrl_lock:
+                    result = method(**data.kwargs)
                 if isinstance(result, dict):
                     rtn.success(message=result)
                 else:
@@ -91,3 +257,25 @@ class ControlMixin(Entity):
             rtn.fail(detail=str(result), e=e)
         finally:
             return rtn
+
+    def _ctrl_batch_call(
+        self, calls: List[CallRequestModel]
+    ) -> List[ControlResultModel]:
+        """
+        Run ctrl_safe_call for every call in order, no other control call
+        could run between them. A failed call does not stop the rest.
+
+        To keep the world from ticking between them either, run this in the
+        tick thread, like Core.call_at_tick() does.
+        """
+
+        with self._ctrl_lock:
+            return [self.ctrl_safe_call(data) for data in calls]
+
+
+def _ctrl_patched(name: str) -> None:
+    if name[0] != "_":
+        ControlMixin._ctrl_registry_invalidate()
+
+
+EntityMeta.patch_hooks.append(_ctrl_patched)
@@ -0,0 +1,437 @@
+"""
+Wire codecs of payloads
+
+A codec turns a tree of plain values into bytes and back.
+Plain values are None, bool, int, float, str, bytes, list and dict,
+a tuple is sent as a list, an Enum as its value, a pydantic model as its dict.
+
+Codecs are registered by EncodeMode, register_codec() replaces the codec of
+a mode, e.g. with a faster JSON library.
+
+The binary format is MessagePack(https://msgpack.org) without timestamps.
+An int beyond 64 bits, like uuid, is an ext of type 1 with its signed
+little-endian bytes.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import pickle
+import struct
+from enum import Enum
+from typing import Any, ClassVar, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+try:  # optional, a faster codec of the same binary format
+    import msgpack  # type: ignore[import]
+except ImportError:
+    msgpack = None
+
+
+class EncodeMode(Enum):
+    B64_PICKLE_BYTES = 0x0
+    JSON = 0x1
+    BINARY = 0x2
+
+    def __len__(self):
+        return 3
+
+    @property
+    def codec_name(self) -> str:
+        """Name used in codec negotiation."""
+        return self.name.lower()
+
+    @classmethod
+    def from_name(cls, name: str) -> EncodeMode:
+        """Raise ValueError if name is unknown."""
+        try:
+            return cls[name.upper()]
+        except KeyError:
+            raise ValueError(f"Unknown codec name: {name}")
+
+
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">I")
+_U64 = struct.Struct(">Q")
+_I32 = struct.Struct(">i")
+_I64 = struct.Struct(">q")
+_F64 = struct.Struct(">d")
+
+# MessagePack tag: (unpack_from, size) of fixed size values
+_FIXED: Dict[int, Tuple[Any, int]] = {
+    0xCA: (struct.Struct(">f").unpack_from, 4),
+    0xCB: (_F64.unpack_from, 8),
+    0xCC: (struct.Struct(">B").unpack_from, 1),
+    0xCD: (_U16.unpack_from, 2),
+    0xCE: (_U32.unpack_from, 4),
+    0xCF: (_U64.unpack_from, 8),
+    0xD0: (struct.Struct(">b").unpack_from, 1),
+    0xD1: (struct.Struct(">h").unpack_from, 2),
+    0xD2: (_I32.unpack_from, 4),
+    0xD3: (_I64.unpack_from, 8),
+}
+# MessagePack tag: (kind, unpack_from, size) of the length of sized values
+_SIZED: Dict[int, Tuple[str, Any, int]] = {}
+for _kind, _first in (("bin", 0xC4), ("ext", 0xC7), ("str", 0xD9)):
+    for _unpack, _n in (
+        (struct.Struct(">B").unpack_from, 1),
+        (_U16.unpack_from, 2),
+        (_U32.unpack_from, 4),
+    ):
+        _SIZED[_first] = (_kind, _unpack, _n)
+        _first += 1
+_SIZED[0xDC] = ("array", _U16.unpack_from, 2)
+_SIZED[0xDD] = ("array", _U32.unpack_from, 4)
+_SIZED[0xDE] = ("map", _U16.unpack_from, 2)
+_SIZED[0xDF] = ("map", _U32.unpack_from, 4)
+# MessagePack tag: data size of fixext 1, 2, 4, 8, 16, which have no length
+_FIXEXT: Dict[int, int] = {0xD4 + i: 1 << i for i in range(5)}
+_FIXEXT_TAG: Dict[int, int] = {n: tag for tag, n in _FIXEXT.items()}
+
+
+def to_plain(obj: Any) -> Any:
+    """Convert the values that are not plain, used by codecs as fallback."""
+
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not encodable.")
+
+
+class Codec:
+    """
+    Interface of codec.
+
+    decode() raise ValueError if the bytes are broken.
+    """
+
+    mode: ClassVar[EncodeMode]
+
+    @property
+    def name(self) -> str:
+        return self.mode.codec_name
+
+    def encode(self, obj: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, b: bytes) -> Any:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    """Compact utf-8 JSON, bytes is sent as a base64 str."""
+
+    mode = EncodeMode.JSON
+
+    def __init__(self) -> None:
+        self.__encoder = json.JSONEncoder(
+            separators=(",", ":"), ensure_ascii=False, default=self.__default
+        )
+
+    @staticmethod
+    def __default(obj: Any) -> Any:
+        if isinstance(obj, (bytes, bytearray, memoryview)):
+            return base64.b64encode(obj).decode("ascii")
+        return to_plain(obj)
+
+    def encode(self, obj: Any) -> bytes:
+        return self.__encoder.encode(obj).encode("utf8")
+
+    def decode(self, b: bytes) -> Any:
+        return json.loads(b)  # JSONDecodeError is a ValueError
+
+
+class PickleCodec(Codec):
+    """
+    Base64 of pickle, how payloads were sent before.
+
+    Decoding runs arbitrary code, never decode bytes from a peer not trusted.
+    """
+
+    mode = EncodeMode.B64_PICKLE_BYTES
+
+    def encode(self, obj: Any) -> bytes:
+        return base64.b64encode(pickle.dumps(obj))
+
+    def decode(self, b: bytes) -> Any:
+        try:
+            return pickle.loads(base64.b64decode(b))
+        except pickle.UnpicklingError as e:
+            raise ValueError(str(e))
+
+
+class BinaryCodec(Codec):
+    """
+    MessagePack, see module doc.
+
+    Pure python, so that no dependency is needed. Any MessagePack library is
+    able to read it, and could be registered instead for a faster one.
+    """
+
+    mode = EncodeMode.BINARY
+
+    BIGINT_EXT = 1  # ext type of int beyond 64 bits, signed little-endian
+
+    def encode(self, obj: Any) -> bytes:
+        out = bytearray()
+        append = out.append
+        extend = out.extend
+        fix_max_16 = {0x80: 0xDE, 0x90: 0xDC}  # map16, array16
+
+        def sized(n: int, fix: int, fix_max: int, tag8: int) -> None:
+            """Write the header of str/bin/array/map of length n."""
+            if n < fix_max:
+                append(fix | n)
+            elif tag8 and n < 0x100:
+                append(tag8)
+                append(n)
+            elif n < 0x10000:
+                append(tag8 + 1 if tag8 else fix_max_16[fix])
+                extend(_U16.pack(n))
+            else:
+                append(tag8 + 2 if tag8 else fix_max_16[fix] + 1)
+                extend(_U32.pack(n))
+
+        def enc_int(obj: int) -> None:
+            if 0 <= obj < 0x80:
+                append(obj)
+            elif -0x20 <= obj < 0:
+                append(obj & 0xFF)
+            elif -0x80000000 <= obj < 0x80000000:
+                append(0xD2)
+                extend(_I32.pack(obj))
+            elif -0x8000000000000000 <= obj < 0x8000000000000000:
+                append(0xD3)
+                extend(_I64.pack(obj))
+            elif 0 <= obj < 0x10000000000000000:
+                append(0xCF)
+                extend(_U64.pack(obj))
+            else:
+                data = obj.to_bytes((obj.bit_length() + 8) // 8, "little", signed=True)
+                fixext = _FIXEXT_TAG.get(len(data))
+                if fixext is not None:  # as msgpack does
+                    append(fixext)
+                else:
+                    sized(len(data), 0, 0, 0xC7)  # ext8, ext16, ext32
+                append(self.BIGINT_EXT)
+                extend(data)
+
+        def enc(obj: Any) -> None:
+            t = type(obj)
+            if t is str:
+                data = obj.encode("utf8")
+                sized(len(data), 0xA0, 0x20, 0xD9)
+                extend(data)
+            elif t is int:
+                enc_int(obj)
+            elif t is dict:
+                sized(len(obj), 0x80, 0x10, 0)
+                for key, value in obj.items():
+                    enc(key)
+                    enc(value)
+            elif t is list or t is tuple:
+                sized(len(obj), 0x90, 0x10, 0)
+                for item in obj:
+                    enc(item)
+            elif obj is None:
+                append(0xC0)
+            elif t is bool:
+                append(0xC3 if obj else 0xC2)
+            elif t is float:
+                append(0xCB)
+                extend(_F64.pack(obj))
+            elif t is bytes or t is bytearray or t is memoryview:
+                data = bytes(obj)
+                sized(len(data), 0, 0, 0xC4)
+                extend(data)
+            elif isinstance(obj, Enum):  # before int, IntEnum is an int
+                enc(obj.value)
+            elif isinstance(obj, dict):
+                enc(dict(obj))
+            elif isinstance(obj, (list, tuple)):
+                enc(list(obj))
+            elif isinstance(obj, str):
+                enc(str(obj))
+            elif isinstance(obj, int):
+                enc_int(int(obj))
+            elif isinstance(obj, float):
+                enc(float(obj))
+            else:
+                enc(to_plain(obj))
+
+        enc(obj)
+        return bytes(out)
+
+    def decode(self, b: bytes) -> Any:
+        b = bytes(b)
+        size = len(b)
+
+        def data(pos: int, n: int) -> Tuple[bytes, int]:
+            end = pos + n
+            if end > size:
+                raise IndexError("data out of range")
+            return b[pos:end], end
+
+        # Counts come from the untrusted header, check them before allocating,
+        # every element takes at least one byte.
+        def array(pos: int, n: int) -> Tuple[List[Any], int]:
+            if n > size - pos:
+                raise IndexError("array length out of range")
+            items: List[Any] = [None] * n
+            for i in range(n):
+                items[i], pos = read(pos)
+            return items, pos
+
+        def mapping(pos: int, n: int) -> Tuple[Dict[Any, Any], int]:
+            if 2 * n > size - pos:
+                raise IndexError("map length out of range")
+            d: Dict[Any, Any] = {}
+            for _ in range(n):
+                key, pos = read(pos)
+                if type(key) is list:  # a tuple key
+                    key = tuple(key)
+                d[key], pos = read(pos)
+            return d, pos
+
+        def ext(pos: int, n: int) -> Tuple[Any, int]:
+            ext_type = b[pos]
+            raw, pos = data(pos + 1, n)
+            if ext_type == self.BIGINT_EXT:
+                return int.from_bytes(raw, "little", signed=True), pos
+            raise ValueError(f"Unknown ext type: {ext_type}")
+
+        def read(pos: int) -> Tuple[Any, int]:
+            tag = b[pos]
+            pos += 1
+            if tag < 0x80:  # positive fixint
+                return tag, pos
+            if tag >= 0xE0:  # negative fixint
+                return tag - 0x100, pos
+            if 0xA0 <= tag < 0xC0:  # fixstr
+                raw, pos = data(pos, tag & 0x1F)
+                return raw.decode("utf8"), pos
+            if tag < 0x90:  # fixmap
+                return mapping(pos, tag & 0x0F)
+            if tag < 0xA0:  # fixarray
+                return array(pos, tag & 0x0F)
+            if tag == 0xC0:
+                return None, pos
+            if tag == 0xC2:
+                return False, pos
+            if tag == 0xC3:
+                return True, pos
+            if tag in _FIXED:
+                unpack, n = _FIXED[tag]
+                return unpack(b, pos)[0], pos + n
+            if tag in _SIZED:
+                kind, unpack, n = _SIZED[tag]
+                length = unpack(b, pos)[0]
+                pos += n
+                if kind == "str":
+                    raw, pos = data(pos, length)
+                    return raw.decode("utf8"), pos
+                if kind == "bin":
+                    return data(pos, length)
+                if kind == "array":
+                    return array(pos, length)
+                if kind == "map":
+                    return mapping(pos, length)
+                return ext(pos, length)
+            if tag in _FIXEXT:
+                return ext(pos, _FIXEXT[tag])
+            raise ValueError(f"Unsupported tag: {tag:#x}")
+
+        try:
+            obj, pos = read(0)
+        except (
+            struct.error,
+            IndexError,
+            UnicodeDecodeError,
+            RecursionError,
+        ) as e:
+            raise ValueError(f"Broken binary payload: {e}")
+        if pos != size:
+            raise ValueError("Broken binary payload: trailing bytes.")
+        return obj
+
+
+class MsgpackCodec(BinaryCodec):
+    """BinaryCodec by the msgpack library, used if it is installed."""
+
+    def __default(self, obj: Any) -> Any:
+        if isinstance(obj, int) and not isinstance(obj, Enum):  # beyond 64 bits
+            data = obj.to_bytes((obj.bit_length() + 8) // 8, "little", signed=True)
+            return msgpack.ExtType(self.BIGINT_EXT, data)
+        return to_plain(obj)
+
+    def __ext_hook(self, code: int, data: bytes) -> int:
+        if code == self.BIGINT_EXT:
+            return int.from_bytes(data, "little", signed=True)
+        raise ValueError(f"Unknown ext type: {code}")
+
+    def encode(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=self.__default)
+
+    def decode(self, b: bytes) -> Any:
+        # every error of unpackb is a ValueError
+        return msgpack.unpackb(b, ext_hook=self.__ext_hook, strict_map_key=False)
+
+
+CODECS: Dict[EncodeMode, Codec] = {}
+
+# Pickle is not listed, decoding it from clients would run their code.
+WS_CODECS: Tuple[EncodeMode, ...] = (EncodeMode.BINARY, EncodeMode.JSON)
+
+
+def register_codec(codec: Codec) -> Codec:
+    """Use codec for its mode, replace the one registered before."""
+    CODECS[codec.mode] = codec
+    return codec
+
+
+def get_codec(mode: EncodeMode | str) -> Codec:
+    """
+    Return the codec of a mode, or of a mode name.
+
+    Raise ValueError if the name is unknown, NotImplementedError if no codec.
+    """
+
+    if not isinstance(mode, EncodeMode):
+        mode = EncodeMode.from_name(mode)
+    try:
+        return CODECS[mode]
+    except KeyError:
+        raise NotImplementedError(f"Unsupported EncodeMode: {mode}")
+
+
+def negotiate(
+    offer: Optional[str], allowed: Iterable[EncodeMode] = WS_CODECS
+) -> Codec:
+    """
+    Pick a codec from a comma separated offer of names, in the peer's order
+    of preference. Names unknown or not allowed are skipped, JSON is picked
+    if nothing is left.
+    """
+
+    allowed = tuple(allowed)
+    for name in (offer or "").split(","):
+        try:
+            mode = EncodeMode.from_name(name.strip())
+        except ValueError:
+            continue
+        if mode in allowed and mode in CODECS:
+            return CODECS[mode]
+    return get_codec(EncodeMode.JSON)
+
+
+for _codec in (
+    JsonCodec(),
+    PickleCodec(),
+    BinaryCodec() if msgpack is None else MsgpackCodec(),
+):
+    register_codec(_codec)
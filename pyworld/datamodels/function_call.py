@@ -3,7 +3,7 @@ from __future__ import annotations
 import base64
 import json
 from enum import Enum
-from typing import TYPE_CHECKING, Any, Dict, Optional, Self, overload
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Self, overload
 
 # from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
@@ -55,6 +55,15 @@ class CallRequestModel(BaseModel):
     kwargs: Dict[str, Any]
 
 
+class CallBatchRequestModel(BaseModel):
+    """
+    calls: run in order between two ticks, see ControlMixin._ctrl_batch_call
+        and Continuum.submit().
+    """
+
+    calls: List[CallRequestModel]
+
+
 class CallResultModel(BaseModel):
     """
     Easy way to create function safe call result return.
@@ -130,3 +139,6 @@ class ServerResultModel(CallResultModel):
 
     def passwd_check_fail(self) -> Self:
         return self.fail("Password check not pass.")
+
+    def token_not_valid(self) -> Self:
+        return self.fail("Token is not valid or expired.")
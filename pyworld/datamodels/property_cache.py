@@ -1,8 +1,18 @@
-from typing import Any, Dict, List
+from __future__ import annotations
+
+from collections import deque
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, NamedTuple, Optional, Tuple
 
 import dictdiffer  # type: ignore[import]
 
 from pyworld.control import ControlMixin
+from pyworld.datamodels.codec import EncodeMode
+from pyworld.datamodels.websockets import WSPayload, WSStage
+from pyworld.entity import DirtyMixin, DirtyStamp
+
+if TYPE_CHECKING:
+    from pyworld.world import Continuum
 
 
 class PropertyCache(Dict[int, Dict[str, Any]]):
@@ -31,3 +41,178 @@ class PropertyCache(Dict[int, Dict[str, Any]]):
         diff: List[Any] = list(dictdiffer.diff(self[ent.uuid], raw))
         self[ent.uuid] = raw
         return {"diff": diff}
+
+
+class Frame(NamedTuple):
+    """
+    Diff of an entity's properties from the state at age since to age.
+
+    since is None if the diff starts from an empty state.
+    """
+
+    since: Optional[int]
+    age: int
+    diff: List[Any]
+
+    def detail(self) -> Dict[str, Any]:
+        return {"diff": self.diff, "age": self.age, "since": self.since}
+
+
+class _Tracked:
+    __slots__ = [
+        "ent",
+        "refs",
+        "age",
+        "stamp",
+        "props",
+        "base",
+        "history",
+        "encoded",
+    ]
+
+    def __init__(self, ent: ControlMixin, age: int, history_size: int) -> None:
+        self.ent = ent
+        self.refs = 0  # watchers
+        self.age = age  # age of props
+        self.stamp: Optional[DirtyStamp] = None  # of props, if ent is DirtyMixin
+        if isinstance(ent, DirtyMixin):  # taken first, a racing write is seen later
+            self.stamp = ent._dirty_stamp()
+        self.props: Dict[str, Any] = ent.ctrl_list_property()
+        self.base = age  # oldest age that history could diff from
+        self.history: Deque[Tuple[int, List[Any]]] = deque(maxlen=history_size)
+        self.encoded: Dict[Tuple[Optional[int], int, EncodeMode], bytes] = {}
+
+    def read(self) -> Tuple[Dict[str, Any], List[Any]]:
+        """
+        Return the current properties and the diff from props.
+
+        Only the written fields are read and compared if ent is a DirtyMixin.
+        """
+
+        ent = self.ent
+        if not isinstance(ent, DirtyMixin):
+            props = ent.ctrl_list_property()
+            return props, list(dictdiffer.diff(self.props, props))
+
+        self.stamp, names = ent._dirty_since(self.stamp)
+        props = self.props.copy()
+        old: Dict[str, Any] = {}
+        new: Dict[str, Any] = {}
+        with ent._tick_lock:
+            for name in names - ent._dir_mask:
+                if name in self.props:
+                    old[name] = self.props[name]
+                if name in ent.__dict__:
+                    new[name] = props[name] = str(getattr(ent, name))
+                else:
+                    props.pop(name, None)
+        return props, list(dictdiffer.diff(old, new))
+
+
+class ChangeTracker:
+    """
+    Diff the properties of watched entities once per tick,
+    shared by every watcher, instead of a PropertyCache for each.
+
+    Updated by a tick listener of the Continuum, after the world ticked.
+    A watcher remembers the age it has sent last, the diffs since then are
+    merged from a short history, and encoded once for each codec. Watchers
+    asking at the same time from the same age get the same bytes.
+    """
+
+    history_size: int = 64
+
+    def __init__(self, ct: Continuum) -> None:
+        self.ct = ct
+        self.__tracked: Dict[int, _Tracked] = {}
+        self.__lock = Lock()
+        ct.add_tick_listener(self.__update)
+
+    def stop(self) -> None:
+        self.ct.remove_tick_listener(self.__update)
+
+    def watch(self, ent: ControlMixin) -> None:
+        """Start tracking ent, every watch should be paired with an unwatch."""
+        with self.__lock:
+            tracked = self.__tracked.get(ent.eid)
+            if tracked is None:
+                tracked = _Tracked(ent, self.ct.world.age, self.history_size)
+                self.__tracked[ent.eid] = tracked
+            tracked.refs += 1
+
+    def unwatch(self, ent: ControlMixin) -> None:
+        with self.__lock:
+            tracked = self.__tracked.get(ent.eid)
+            if tracked is None:
+                return
+            tracked.refs -= 1
+            if tracked.refs <= 0:
+                del self.__tracked[ent.eid]
+
+    def __get(self, ent: ControlMixin) -> _Tracked:
+        """Raise KeyError if ent is not watched."""
+        return self.__tracked[ent.eid]
+
+    def age(self, ent: ControlMixin) -> int:
+        """Return the age of the last tracked state of ent."""
+        with self.__lock:
+            return self.__get(ent).age
+
+    def snapshot(self, ent: ControlMixin) -> Tuple[int, Dict[str, Any]]:
+        """Return the age and the properties of the last tracked state."""
+        with self.__lock:
+            tracked = self.__get(ent)
+            return tracked.age, tracked.props
+
+    def delta(self, ent: ControlMixin, since: Optional[int]) -> Frame:
+        """
+        Return the diff from the state at age since to the last tracked one.
+
+        If since is None, or too old for the history, the diff starts from
+        an empty state.
+        """
+
+        with self.__lock:
+            tracked = self.__get(ent)
+            if since is None or since < tracked.base:
+                diff = list(dictdiffer.diff({}, tracked.props))
+                return Frame(None, tracked.age, diff)
+            diff = []
+            for age, changes in tracked.history:
+                if age > since:
+                    diff.extend(changes)
+            return Frame(since, tracked.age, diff)
+
+    def encoded(
+        self, ent: ControlMixin, since: Optional[int], mode: EncodeMode
+    ) -> Tuple[Frame, bytes]:
+        """Return delta() and it encoded as a DIFF payload in mode."""
+
+        frame = self.delta(ent, since)
+        key = (frame.since, frame.age, mode)
+        with self.__lock:
+            tracked = self.__get(ent)
+            b = tracked.encoded.get(key)
+        if b is None:
+            payload = WSPayload().diff(WSStage.SERVER_SEND, detail=frame.detail())
+            b = payload.encode(mode)
+            with self.__lock:
+                if tracked.age == frame.age:  # still the last state
+                    tracked.encoded[key] = b
+        return frame, b
+
+    def __update(self, age: int) -> None:
+        """Diff every watched entity, in the tick thread."""
+
+        with self.__lock:
+            targets = list(self.__tracked.values())
+        for tracked in targets:
+            props, diff = tracked.read()
+            with self.__lock:
+                if diff:
+                    if len(tracked.history) == tracked.history.maxlen:
+                        tracked.base = tracked.history[0][0]
+                    tracked.history.append((age, diff))
+                    tracked.props = props
+                tracked.age = age
+                tracked.encoded = {}
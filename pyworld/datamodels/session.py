@@ -0,0 +1,126 @@
+"""
+Password hashes and session tokens.
+
+A password is stored as a salted PBKDF2 hash, which is slow on purpose, so
+it is verified only at login. The login issues an opaque token kept in a
+SessionTable, later requests carry the token instead of the password.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple, Optional
+
+HASH_NAME = "pbkdf2_sha256"
+PBKDF2_ITERATIONS = 100_000  # of new hashes, old hashes keep their own
+
+
+def hash_passwd(passwd: str, iterations: Optional[int] = None) -> str:
+    """Return "pbkdf2_sha256$iterations$salt$hash" of passwd."""
+
+    iterations = iterations or PBKDF2_ITERATIONS
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", passwd.encode(), salt, iterations)
+    return f"{HASH_NAME}${iterations}${salt.hex()}${digest.hex()}"
+
+
+def is_passwd_hash(stored: str) -> bool:
+    return stored.startswith(HASH_NAME + "$")
+
+
+def verify_passwd(stored: str, passwd: str) -> bool:
+    """
+    Check passwd against a hash by hash_passwd().
+
+    A stored value not looks like a hash is taken as a plain password,
+    which is in the saves of older versions.
+    """
+
+    if not is_passwd_hash(stored):
+        return hmac.compare_digest(stored.encode(), passwd.encode())
+    try:
+        _, iterations, salt, digest = stored.split("$")
+        expect = bytes.fromhex(digest)
+        got = hashlib.pbkdf2_hmac(
+            "sha256", passwd.encode(), bytes.fromhex(salt), int(iterations)
+        )
+    except ValueError:  # broken hash
+        return False
+    return hmac.compare_digest(expect, got)
+
+
+class Session(NamedTuple):
+    username: str
+    expires: float  # time.monotonic() deadline
+
+
+class SessionTable:
+    """
+    In-memory table of session tokens.
+
+    A token expires ttl seconds after it is last used. If the table is full,
+    the least recently used token is dropped for the new one.
+    """
+
+    def __init__(self, ttl: float = 3600.0, max_size: int = 10000) -> None:
+        if ttl <= 0 or max_size < 1:
+            raise ValueError("ttl and max_size must be positive.")
+        self.ttl = ttl
+        self.max_size = max_size
+        self.__sessions: OrderedDict[str, Session] = OrderedDict()
+        self.__lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.__sessions)
+
+    def issue(self, username: str) -> str:
+        """Return a new token of username."""
+
+        token = secrets.token_urlsafe(32)
+        with self.__lock:
+            self.__sessions[token] = Session(username, time.monotonic() + self.ttl)
+            while len(self.__sessions) > self.max_size:
+                self.__sessions.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> Optional[str]:
+        """Return the username of token, None if it is unknown or expired."""
+
+        now = time.monotonic()
+        with self.__lock:
+            session = self.__sessions.get(token)
+            if session is None:
+                return None
+            if session.expires <= now:
+                del self.__sessions[token]
+                return None
+            self.__sessions[token] = Session(session.username, now + self.ttl)
+            self.__sessions.move_to_end(token)
+            return session.username
+
+    def revoke(self, token: str) -> bool:
+        """Drop token, return False if it is not in the table."""
+        with self.__lock:
+            return self.__sessions.pop(token, None) is not None
+
+    def revoke_user(self, username: str) -> int:
+        """Drop every token of username, return how many are dropped."""
+        with self.__lock:
+            tokens = [t for t, s in self.__sessions.items() if s.username == username]
+            for token in tokens:
+                del self.__sessions[token]
+        return len(tokens)
+
+    def purge(self) -> int:
+        """Drop the expired tokens, return how many are dropped."""
+        now = time.monotonic()
+        with self.__lock:
+            tokens = [t for t, s in self.__sessions.items() if s.expires <= now]
+            for token in tokens:
+                del self.__sessions[token]
+        return len(tokens)
@@ -1,80 +1,59 @@
 from __future__ import annotations
 
-import base64
-import json
-import pickle
 from enum import Enum
-from typing import Any, Dict, Optional, overload, List, Self
+from typing import Any, Dict, List, Optional, Self, Tuple, overload
+
 from fastapi import WebSocket
 from pydantic import BaseModel
 
-from pyworld.datamodels.function_call import CallRequestModel, ExceptionModel
 from pyworld.control import ControlResultModel
-
-
-class EncodeMode(Enum):
-    B64_PICKLE_BYTES = 0x0
-    JSON = 0x1
-
-    def __len__(self):
-        return 2
+from pyworld.datamodels.codec import EncodeMode, get_codec
+from pyworld.datamodels.function_call import CallRequestModel, ExceptionModel
 
 
 class Payload(BaseModel):
     """
     Receive data container.
 
-    # TODO: Test needed
+    Encoded by the codec of a EncodeMode, default_encode itself is not sent.
     """
 
     default_encode: EncodeMode = EncodeMode.JSON
 
-    @property
-    def as_bytes(self, encode: Optional[EncodeMode] = None) -> bytes:
+    def to_dict(self) -> Dict[str, Any]:
+        """Shallow dict of the fields to send, codecs convert the rest."""
+        return {k: getattr(self, k) for k in self.__fields__ if k != "default_encode"}
+
+    def encode(self, encode: Optional[EncodeMode] = None) -> bytes:
         if encode is None:
             encode = self.default_encode
+        return get_codec(encode).encode(self.to_dict())
 
-        if encode is EncodeMode.B64_PICKLE_BYTES:
-            return base64.b64encode(pickle.dumps(self.dict()))
-        elif encode is EncodeMode.JSON:
-            return str(self.dict()).encode("utf8")
-        else:
-            raise NotImplementedError("Unsupported encode.")
+    @property
+    def as_bytes(self) -> bytes:
+        return self.encode()
 
     @property
     def length(self) -> int:
         return len(self.as_bytes)
 
-    @staticmethod
-    def from_dict(d: Dict[str, Any]) -> Payload:
-        rtn: Payload = Payload()
-        for key in d:
-            setattr(rtn, key, d[key])
-        return rtn
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> Self:  # type: ignore[valid-type]
+        """Raise ValueError(pydantic ValidationError) if d is not valid."""
+        return cls.parse_obj(d)
 
     @classmethod
     def from_bytes(
         cls, b: bytes, mode: EncodeMode | str
     ) -> Self:  # type: ignore[valid-type]
+        """
+        Decode b with the codec of mode, or of a mode name.
+
+        Raise ValueError if b is broken or not a valid payload,
+        NotImplementedError if no codec of mode.
+        """
         # TODO: mypy do not recognize Self annotation
-        if type(mode) == EncodeMode:
-            pass
-        else:
-            try:
-                mode = EncodeMode(mode)
-            except TypeError as e:
-                raise TypeError(f"Unsupported EncodeMode str.[{str(e)}]")
-
-        rtn: Self  # type: ignore[valid-type]
-        match mode:
-            case EncodeMode.B64_PICKLE_BYTES:
-                rtn = pickle.loads(base64.b64decode(b))
-            case EncodeMode.JSON:
-                rtn = Payload.from_dict(json.loads(b.decode("utf8")))
-            case other:
-                raise NotImplementedError(f"Unsupported EncodeMode: {str(other)}")
-
-        return rtn
+        return cls.from_dict(get_codec(mode).decode(b))
 
 
 class WSStage(Enum):
@@ -99,18 +78,33 @@ class WSCommand(Enum):
     0. Just a simple States Machine
 
     INIT
-    1. client send the GET request with credentials to ws uri,
+    1. client send the GET request with a session token from /login to ws uri,
     2. a ws created,
     LOGIN
-    2.1. server check the credentials, if invalid -> (CLOSE, {})
+    2.1. server check the token, if invalid -> (CLOSE, {})
+    2.1.1. if the client offered codecs in the query, like codec=binary,json,
+        server picks the first one it supports and send (PING, {"codec": name})
+        in JSON, all the payloads after are in that codec.
+        Without an offer, JSON is used and nothing is sent.
     LOOP
     2.2. server send (CMD, {})
     CLIENT_PREPARE
     CLIENT_SEND
-    2.3. client send CMD | ALL | DIFF | CLOSE
+    2.3. client send CMD | ALL | DIFF | CLOSE | SUBSCRIBE
     SERVER_PREPARE
     SERVER_SEND
     2.4. server do the right response with correct WSCommand
+    2.5. DIFF detail is {"diff": ..., "age": ..., "since": ...}, the diff
+        from the state at age since to the state at age, since is None if
+        the diff starts from an empty state.
+    2.6. after (SUBSCRIBE, {"interval": N, "on_change": bool}), the server
+        also pushes DIFF whenever the age passes a multiple of N, empty diffs
+        are not pushed if on_change. A slow client gets the diffs due
+        meanwhile merged into one. Interval 0 stops pushing.
+    2.7. (BATCH, {"calls": [CMD detail, ...]}) runs the calls in order, the
+        server replies (BATCH, {"results": [CMD result, ...]}).
+    2.8. CMD and BATCH run at the next tick boundary, the world does not tick
+        in the middle of a BATCH.
     """
 
     PING = 0x00  # Server/Client, the peer should send the PING either.
@@ -118,11 +112,14 @@ class WSCommand(Enum):
     CMD = 0x02  # S: ready for CMD | C: Call function, using **detail as kwargs
     ALL = 0x03  # C: need all info about the player entity
     DIFF = 0x04  # C: need diff info about the player entity
+    SUBSCRIBE = 0x05  # C: push DIFF every detail["interval"] ticks
+    BATCH = 0x06  # C: Call functions in order, detail["calls"] are CMD details
 
 
 class WSPayload(Payload):
     """
-    Override: WebSocket use JSON to exchange data by force.
+    Override: WebSocket use JSON by default, other codec could be negotiated
+    when login, see WSCommand.
     Properties:
         stage: Record the stage for assert and debug use.
         command: the Command slot, mostly used by client, used to order the peer.
@@ -137,9 +134,18 @@ class WSPayload(Payload):
 
     default_encode: EncodeMode = EncodeMode.JSON
 
-    @staticmethod
-    async def from_read_ws(ws: WebSocket) -> WSPayload:
-        return WSPayload.from_bytes(await ws.receive_bytes(), mode=EncodeMode.JSON)
+    @classmethod
+    async def from_read_ws(
+        cls, ws: WebSocket, mode: EncodeMode = EncodeMode.JSON
+    ) -> WSPayload:
+        return cls.from_bytes(await ws.receive_bytes(), mode=mode)
+
+    def login(self, codec_name: str) -> WSPayload:
+        """Tell the client which codec is picked."""
+        self.stage = WSStage.LOGIN
+        self.command = WSCommand.PING
+        self.detail = {"codec": codec_name}
+        return self
 
     def ping(self, stage: WSStage) -> WSPayload:
         self.stage = stage
@@ -171,6 +177,27 @@ class WSPayload(Payload):
         self.detail = detail
         return self
 
+    @staticmethod
+    def subscribe_options(detail: Dict[str, Any]) -> Tuple[int, bool]:
+        """
+        Return interval and on_change of a SUBSCRIBE detail.
+
+        Raise ValueError if they are not valid.
+        """
+        interval = detail.get("interval", 1)
+        on_change = detail.get("on_change", True)
+        if type(interval) is not int or interval < 0:
+            raise ValueError(f"interval should be an int >= 0, got {interval!r}")
+        if type(on_change) is not bool:
+            raise ValueError(f"on_change should be a bool, got {on_change!r}")
+        return interval, on_change
+
+    def subscribe(self, stage: WSStage, interval: int, on_change: bool) -> WSPayload:
+        self.stage = stage
+        self.command = WSCommand.SUBSCRIBE
+        self.detail = {"interval": interval, "on_change": on_change}
+        return self
+
     @overload
     def cmd(self, *, server_resp: ControlResultModel) -> WSPayload:
         """For server to send the result"""
@@ -183,17 +210,21 @@ class WSPayload(Payload):
 
     def cmd(self, **kwargs) -> WSPayload:
         self.command = WSCommand.CMD
-        k = list(kwargs.keys())[0]  # HACK: Use more pythonic way.
-        v = list(kwargs.values())[0]
-        match k:
-            case ["server_resp"]:
-                self.stage = WSStage.SERVER_PREPARE
-                self.detail = v["detail"]
-            case ["client_req"]:
-                self.stage = WSStage.CLIENT_PREPARE
-                patch: CallRequestModel = v["req_patch"]
-                self.detail = patch.dict()
+        if "server_resp" in kwargs:
+            self.stage = WSStage.SERVER_PREPARE
+            resp: ControlResultModel = kwargs["server_resp"]
+            self.detail = resp.to_dict()
+        elif "client_req" in kwargs:
+            self.stage = WSStage.CLIENT_PREPARE
+            patch: CallRequestModel = kwargs["client_req"]
+            self.detail = patch.dict()
+        return self
+
+    def batch(self, stage: WSStage, results: List[ControlResultModel]) -> WSPayload:
+        self.stage = stage
+        self.command = WSCommand.BATCH
+        self.detail = {"results": [result.to_dict() for result in results]}
         return self
 
-    async def send_ws(self, ws: WebSocket) -> None:
-        await ws.send_bytes(self.as_bytes)
+    async def send_ws(self, ws: WebSocket, mode: Optional[EncodeMode] = None) -> None:
+        await ws.send_bytes(self.encode(mode))
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import itertools
 import pickle
+import time
+import traceback
 import uuid
 from _thread import LockType
-from concurrent.futures import Future, ThreadPoolExecutor
+from abc import ABCMeta
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from enum import Enum
 from functools import wraps
 from threading import Lock
 from typing import (
@@ -11,8 +17,10 @@ from typing import (
     Any,
     Callable,
     Concatenate,
+    Deque,
     Dict,
     List,
+    NamedTuple,
     Optional,
     ParamSpec,
     Protocol,
@@ -26,10 +34,8 @@ from typing import (
 )
 
 from objprint import op
-from pydantic import BaseModel
 
 from pyworld.basic import Pickleable, pre_pickle
-from pyworld.datamodels.function_call import ExceptionModel
 from pyworld.datamodels.status_code import CallStatus
 
 if TYPE_CHECKING:
@@ -78,22 +84,74 @@ def with_instance_lock(lock_name: str, debug: bool = False):
     return run_with_lock
 
 
-class TickLogModel(BaseModel):
+TICK_SUFFIX = "_tick"
+
+# Per-class registry of tick method names, see Entity._tick_names().
+# The version is bumped by Entity._tick_registry_invalidate() so that every
+# class and instance cache built before is rebuilt at its next tick.
+_tick_registry: Dict[type, Tuple[str, ...]] = {}
+_tick_registry_version: int = 0
+
+
+def is_tick_name(name: str) -> bool:
+    """Return True if name is a (suffix) _tick method name, but not _tick itself."""
+    return len(name) > len(TICK_SUFFIX) and name.endswith(TICK_SUFFIX)
+
+
+class EntityMeta(ABCMeta):
+    """
+    Invalidate the method registries when an attribute of a class is patched.
+
+    Every registry built from dir() of the classes, like the tick and the
+    control methods, adds a hook to patch_hooks, called with the name set or
+    deleted. Only class writes are hooked, instance writes cost nothing.
+
+    Based on ABCMeta, so that an Entity could also be a Mapping or other ABC.
+    """
+
+    patch_hooks: List[Callable[[str], None]] = []
+
+    def __setattr__(cls, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        for hook in EntityMeta.patch_hooks:
+            hook(name)
+
+    def __delattr__(cls, name: str) -> None:
+        super().__delattr__(name)
+        for hook in EntityMeta.patch_hooks:
+            hook(name)
+
+
+class TickLogRecord(NamedTuple):
+    """
+    Log of one tick.
+
+    Only created when the tick fails or the entity's _log_flag is set.
+    """
+
     age: int
-    status: CallStatus = CallStatus.INIT
-    exception_info: Optional[ExceptionModel] = None
+    status: CallStatus = CallStatus.SUCCESS
+    exception_name: str = ""
+    exception_detail: str = ""
+    traceback: str = ""
 
-    def exception(self, e: Exception) -> Self:
-        self.status = CallStatus.FAIL
-        self.exception_info = ExceptionModel.from_exception(e)
-        return self
+    @classmethod
+    def from_exception(cls, age: int, e: Exception) -> TickLogRecord:
+        return cls(
+            age,
+            CallStatus.FAIL,
+            e.__class__.__name__,
+            str(e),
+            "".join(traceback.format_exception(e)),
+        )
 
-    def success(self) -> Self:
-        self.status = CallStatus.SUCCESS
-        return self
+    def to_dict(self) -> Dict[str, Any]:
+        rtn = self._asdict()
+        rtn["status"] = self.status.name
+        return rtn
 
 
-class Entity(Pickleable):
+class Entity(Pickleable, metaclass=EntityMeta):
     """
     Being
 
@@ -104,8 +162,13 @@ class Entity(Pickleable):
     Subclasses:
         World
         Character
+
+    Properties:
+        tick_log_size: max length of tick_log.
     """
 
+    tick_log_size: int = 64
+
     def __init__(self, *, eid: int = -1) -> None:
         """Entity only accept kwargs arguments."""
         super().__init__()
@@ -113,8 +176,15 @@ class Entity(Pickleable):
         self.age = 0
         self.uuid: int = uuid.uuid4().int
 
-        self.tick_log: List[Dict[str, Any]] = []
-        self.last_tick_log: Optional[Dict[str, Any]] = None
+        # Ring buffer of recent failed ticks, and every tick if _log_flag.
+        self.tick_log: Deque[TickLogRecord] = deque(maxlen=self.tick_log_size)
+        # Record of the last tick, None if it succeeded without _log_flag.
+        self.last_tick_log: Optional[TickLogRecord] = None
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        super().__setstate__(state)
+        if not isinstance(self.tick_log, deque):  # list in old saves
+            self.tick_log = deque(self.tick_log, maxlen=self.tick_log_size)
 
     def __static_init__(self) -> None:
 
@@ -128,6 +198,10 @@ class Entity(Pickleable):
         # name of additional attrs that wouldn't show to user.
         self._dir_mask: Set[str] = set()
 
+        # Bound tick methods cache, see _tick_methods().
+        self._tick_methods_cache: Tuple[Callable[[Optional[World]], None], ...] = ()
+        self._tick_methods_stamp: int = -1  # registry version, -1 is stale
+
         return super().__static_init__()
 
     def get_state(self) -> Dict[str, Any]:
@@ -143,6 +217,63 @@ class Entity(Pickleable):
 
         return pickle.dumps(self)
 
+    @classmethod
+    def _tick_names(cls) -> Tuple[str, ...]:
+        """
+        Return the sorted names of every (suffix) _tick method of the class.
+
+        The names are collected by dir() only once per class, then cached
+        in the registry until _tick_registry_invalidate() is called, which
+        EntityMeta does when a tick method of any Entity class is set or
+        deleted.
+        """
+
+        names = _tick_registry.get(cls)
+        if names is None:
+            names = tuple(
+                name
+                for name in dir(cls)
+                if is_tick_name(name) and callable(getattr(cls, name, None))
+            )
+            _tick_registry[cls] = names
+        return names
+
+    @staticmethod
+    def _tick_registry_invalidate() -> None:
+        """
+        Drop all the cached tick methods.
+
+        Setting or deleting a (suffix) _tick method of an Entity class is
+        detected by EntityMeta. Call this after setting or deleting one of
+        an instance, or changing a class by other ways, e.g. patching a plain
+        mixin not an Entity.
+        """
+
+        global _tick_registry_version
+        _tick_registry.clear()
+        _tick_registry_version += 1
+
+    def _tick_methods(self) -> Tuple[Callable[[Optional[World]], None], ...]:
+        """
+        Return the bound (suffix) _tick methods in the same order as dir().
+
+        The tuple is cached on the instance, and rebuilt with the (suffix)
+        _tick callables of the instance __dict__ when the registry is
+        invalidated.
+        """
+
+        stamp = _tick_registry_version
+        if stamp != self._tick_methods_stamp:
+            names = set(self._tick_names())
+            names.update(
+                name
+                for name, value in self.__dict__.items()
+                if is_tick_name(name) and callable(value)
+            )
+            self._tick_methods_cache = tuple(getattr(self, n) for n in sorted(names))
+            self._tick_methods_stamp = stamp
+        return self._tick_methods_cache
+
     def _tick_first(self, belong: Optional[World]) -> None:
         """
         Will do before _tick
@@ -172,35 +303,36 @@ class Entity(Pickleable):
         Will auto call entity's every (suffix) _tick method.
         """
 
-        self._world = belong
-        log = TickLogModel(
-            age=self.age,
-        )
+        if self._world is not belong:  # spare a __setattr__ of DirtyMixin
+            self._world = belong
         try:
             # BEFORE
             self._tick_first(belong)
 
             # MAIN::Call every function named after _tick of class
-            for func in dir(
-                self
-            ):  # dir() could show all instance method and properties;
-                # __dict__ only returns properties.
-                if len(func) > 5:  # not _tick itself
-                    if func[-5:] == "_tick":  # named after _tick
-                        target: Callable[[Optional[Entity]], None] = getattr(self, func)
-                        if callable(target):
-                            target(belong)
+            for target in self._tick_methods():
+                target(belong)
             # AFTER
             self._tick_last(belong)
-            self.last_tick_log = log.success().dict()
+            if self._log_flag:
+                self._tick_log_add(TickLogRecord(self.age))
+            elif self.last_tick_log is not None:
+                # The last tick succeeded, so an old failure is no longer last.
+                self.last_tick_log = None
 
         except Exception as e:
-            self.last_tick_log = log.exception(e).dict()
+            self._tick_log_add(TickLogRecord.from_exception(self.age, e))
         finally:
-            if self._log_flag:
-                self.tick_log.append(log.dict())
             self.age += 1
 
+    def _tick_log_add(self, record: TickLogRecord) -> None:
+        """Keep the record in tick_log, and spill it to the world's log file."""
+
+        self.tick_log.append(record)
+        self.last_tick_log = record
+        if self._world is not None:
+            self._world._tick_log_spill(self, record)
+
     def _report_tick(self, belong: World) -> None:
         """Report self, for logging or debugging usage."""
         if not self._report_flag:
@@ -224,6 +356,14 @@ class Entity(Pickleable):
         return f"{self.__class__.__name__}<{self.uuid}>"
 
 
+def _tick_patched(name: str) -> None:
+    if is_tick_name(name):
+        Entity._tick_registry_invalidate()
+
+
+EntityMeta.patch_hooks.append(_tick_patched)
+
+
 FutureTick: TypeAlias = Callable[[Entity, Optional[Entity]], None]
 # Tick Method Type that would be called in future.
 
@@ -238,11 +378,27 @@ class ConcurrentMixin(Entity):
     Add the ability that Entity could running concurrent ticks.
     Module will run every FutureTick in self.__concurrent_pending after
     other tick is done.
+
+    The pending ticks are split into chunks, one future per chunk, and run
+    in a long-lived thread pool owned by the instance.
+    Call _concurrent_shutdown() to release the pool.
+
+    Properties:
+        concurrent_max_workers: max threads in pool, also the max chunks.
+        concurrent_chunk_min: min ticks in one chunk. If all pending ticks
+            fit into one chunk, they run in current thread without the pool.
     """
 
+    concurrent_max_workers: int = 16
+    concurrent_chunk_min: int = 64
+
     def __static_init__(self) -> None:
         super().__static_init__()
         self.__pending: List[Tuple[FutureTick, Entity]] = []
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__executor_lock = Lock()
+        self._concurrent_queue_depth: int = 0  # pending ticks of last tick
+        self._concurrent_chunk_times: List[float] = []  # seconds of each chunk
 
     def _concurrent_tick_add(self, owner: Entity, method: FutureTick) -> None:
         """
@@ -253,6 +409,80 @@ class ConcurrentMixin(Entity):
 
         self.__pending.append((method, owner))
 
+    def concurrent_configure(
+        self, max_workers: Optional[int] = None, chunk_min: Optional[int] = None
+    ) -> None:
+        """
+        Change the pool size or the min chunk size.
+
+        The running pool is shut down if max_workers changed,
+        a new one will be created at next tick.
+        """
+
+        if chunk_min is not None:
+            if chunk_min < 1:
+                raise ValueError("chunk_min must be positive.")
+            self.concurrent_chunk_min = chunk_min
+
+        if max_workers is not None and max_workers != self.concurrent_max_workers:
+            if max_workers < 1:
+                raise ValueError("max_workers must be positive.")
+            self._concurrent_shutdown()
+            self.concurrent_max_workers = max_workers
+
+    def concurrent_stats(self) -> Dict[str, Any]:
+        """Return the queue depth and chunk timing of last tick."""
+
+        chunk_times = self._concurrent_chunk_times
+        return {
+            "queue_depth": self._concurrent_queue_depth,
+            "chunks": len(chunk_times),
+            "chunk_time_max": max(chunk_times, default=0.0),
+            "chunk_time_total": sum(chunk_times),
+        }
+
+    def _concurrent_executor(self) -> ThreadPoolExecutor:
+        """Return the pool, create it if not exists."""
+
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=self.concurrent_max_workers,
+                    thread_name_prefix=f"{self.__class__.__name__}-concurrent",
+                )
+            return self.__executor
+
+    def _concurrent_shutdown(self) -> None:
+        """Wait for running chunks and release the pool threads."""
+
+        with self.__executor_lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=True)
+                self.__executor = None
+
+    @staticmethod
+    def _concurrent_run_chunk(
+        chunk: List[Tuple[FutureTick, Entity]], belong: Optional[Entity]
+    ) -> float:
+        """
+        Run every tick in chunk, return the seconds it takes.
+
+        A failed tick won't stop the rest of the chunk,
+        the first exception is raised after the chunk is done.
+        """
+
+        start = time.perf_counter()
+        error: Optional[Exception] = None
+        for method, owner in chunk:
+            try:
+                method(owner, belong)
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+        return time.perf_counter() - start
+
     def _tick_last(self, belong: Optional[World] = None) -> None:
         """
         Override the Entity._tick_last method.
@@ -263,20 +493,198 @@ class ConcurrentMixin(Entity):
 
         super()._tick_last(belong)
 
+        pending = self.__pending
+        self.__pending = []  # clear up
+        self._concurrent_queue_depth = len(pending)
+
         # If no pending, just pass.
-        if self.__pending == []:
+        if pending == []:
+            self._concurrent_chunk_times = []
             return
 
-        # Else, run every pending tick in pool
-        with ThreadPoolExecutor(max_workers=16) as exe:
-            future_list: list[Future[None]] = [
-                exe.submit(*tick, belong) for tick in self.__pending
-            ]
+        chunk_num = min(
+            self.concurrent_max_workers,
+            -(-len(pending) // self.concurrent_chunk_min),  # ceil
+        )
 
-        self.__pending = []  # clear up
+        # One chunk is not worth a thread switch, run it here.
+        if chunk_num <= 1:
+            self._concurrent_chunk_times = [
+                self._concurrent_run_chunk(pending, belong)
+            ]
+            return
 
+        # Else, run every chunk in pool
+        chunk_size = -(-len(pending) // chunk_num)
+        exe = self._concurrent_executor()
+        future_list: List[Future[float]] = [
+            exe.submit(
+                self._concurrent_run_chunk,
+                pending[i : i + chunk_size],
+                belong,
+            )
+            for i in range(0, len(pending), chunk_size)
+        ]
+
+        # wait for every future is done, then raise the first exception.
+        wait(future_list)
+        self._concurrent_chunk_times = [
+            future.result() for future in future_list if future.exception() is None
+        ]
         for future in future_list:
-            future.result()  # wait for every future is done
+            future.result()
+
+
+DirtyStamp: TypeAlias = Tuple[int, int]
+# (epoch, clock) of a DirtyMixin, see DirtyMixin._dirty_since().
+
+# Values of these types could only be changed by assignment.
+IMMUTABLE_TYPES: Tuple[type, ...] = (
+    type(None),
+    bool,
+    int,
+    float,
+    complex,
+    str,
+    bytes,
+    Enum,
+)
+
+_dirty_epochs = itertools.count(1)
+
+
+class _DirtyLog:
+    """
+    Write clock of the public fields of a DirtyMixin.
+
+    stamps is ordered by stamp, the last written field is the last one.
+    """
+
+    __slots__ = ["epoch", "clock", "flushed", "stamps", "mutable", "refs"]
+
+    def __init__(self) -> None:
+        self.epoch = next(_dirty_epochs)  # new for every life of the entity
+        self.clock = 0
+        self.flushed = 0
+        self.stamps: Dict[str, int] = {}
+        self.mutable: Set[str] = set()  # fields holding a mutable value
+        self.refs: Set[str] = set()  # fields holding an entity
+
+    def touch(self, name: str) -> None:
+        self.clock += 1
+        self.stamps.pop(name, None)
+        self.stamps[name] = self.clock
+
+    def write(self, name: str, value: Any) -> None:
+        self.touch(name)
+        if isinstance(value, IMMUTABLE_TYPES):
+            self.mutable.discard(name)
+            self.refs.discard(name)
+        elif isinstance(value, Entity):
+            self.mutable.discard(name)
+            self.refs.add(name)
+        else:
+            self.mutable.add(name)
+            self.refs.discard(name)
+
+    def discard(self, name: str) -> None:
+        self.touch(name)
+        self.mutable.discard(name)
+        self.refs.discard(name)
+
+    def since(self, clock: int) -> Set[str]:
+        names = set(self.mutable)
+        for name, stamp in reversed(self.stamps.items()):
+            if stamp <= clock:
+                break
+            names.add(name)
+        return names
+
+
+class DirtyMixin(Entity):
+    """
+    Opt-in tracking of which public fields were written.
+
+    Every assignment or deletion of a public attribute is stamped by a clock
+    of the instance, so that diffs, saves and streams could ask what changed
+    since their last look instead of dumping and comparing the whole state.
+
+    __setattr__ can't see an in-place change, like appending to a list,
+    so a field holding a mutable value is always reported as changed.
+    So is a field holding an entity, unless the caller tells it is saved
+    by reference, see _dirty_since().
+    Call _dirty_mark() after changing an immutable field by other ways,
+    e.g. writing __dict__ directly.
+
+    The clock is not pickled, a loaded entity starts with every field dirty.
+    """
+
+    def __static_init__(self) -> None:
+        super().__static_init__()
+        log = _DirtyLog()
+        for name, value in self.__dict__.items():
+            if name[0] != "_":
+                log.write(name, value)
+        self._dirty_log = log
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name[0] != "_":
+            log: Optional[_DirtyLog] = self.__dict__.get("_dirty_log")
+            if log is not None:
+                log.write(name, value)
+
+    def __delattr__(self, name: str) -> None:
+        super().__delattr__(name)
+        if name[0] != "_":
+            self._dirty_log.discard(name)
+
+    def _dirty_mark(self, *names: str) -> None:
+        """Mark fields as written."""
+        for name in names:
+            self._dirty_log.touch(name)
+
+    def _dirty_stamp(self) -> DirtyStamp:
+        log = self._dirty_log
+        return log.epoch, log.clock
+
+    def _dirty_since(
+        self,
+        stamp: Optional[DirtyStamp],
+        by_ref: Optional[Callable[[Entity], bool]] = None,
+    ) -> Tuple[DirtyStamp, Set[str]]:
+        """
+        Return the current stamp, and the fields may have changed after the
+        given stamp, including the deleted ones.
+
+        Every field is returned if stamp is None, or taken before the entity
+        was pickled.
+
+        A field holding an entity is returned only after assignment if
+        by_ref(entity) is True, i.e. the caller keeps the entity by
+        reference and tracks it by itself. Otherwise it is always returned.
+        """
+
+        log = self._dirty_log
+        clock = 0 if stamp is None or stamp[0] != log.epoch else stamp[1]
+        return (log.epoch, log.clock), self.__dirty_names(clock, by_ref)
+
+    def _dirty_flush(self) -> Set[str]:
+        """Return the fields may have changed since the last flush."""
+        log = self._dirty_log
+        names = self.__dirty_names(log.flushed)
+        log.flushed = log.clock
+        return names
+
+    def __dirty_names(
+        self, clock: int, by_ref: Optional[Callable[[Entity], bool]] = None
+    ) -> Set[str]:
+        log = self._dirty_log
+        names = log.since(clock)
+        for name in log.refs:
+            if by_ref is None or not by_ref(self.__dict__.get(name)):
+                names.add(name)
+        return names
 
 
 @runtime_checkable
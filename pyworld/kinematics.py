@@ -0,0 +1,165 @@
+"""
+Kinematics store
+
+Keep the position, velocity and acceleration of all the characters in a world
+as contiguous N x 3 float64 arrays, so that a tick could integrate all of them
+by a few NumPy operations instead of one Vector allocation per character.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+import numpy as np
+
+from pyworld.basic import Vector
+
+if TYPE_CHECKING:
+    from pyworld.world import Character
+
+
+class KinematicsField:
+    """
+    Descriptor of a kinematics property of Character.
+
+    The value is read from the store which the character is attached to.
+    The last read or written Vector is kept in instance __dict__ with the same
+    name, which is used when the character is not attached, and is also what
+    __getstate__ pickles.
+    """
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, obj: Optional[Character], objtype: Any = None) -> Any:
+        if obj is None:
+            return self
+
+        cached: Vector = obj.__dict__[self.name]
+        store: Optional[Kinematics] = obj._kin_store
+        if store is None:
+            return cached
+
+        x, y, z = store.read(self.name, obj._kin_slot)
+        if cached.x != x or cached.y != y or cached.z != z:  # changed by store
+            cached = Vector(x, y, z)
+            obj.__dict__[self.name] = cached
+        return cached
+
+    def __set__(self, obj: Character, value: Vector) -> None:
+        obj.__dict__[self.name] = value
+        store: Optional[Kinematics] = obj._kin_store
+        if store is not None:
+            store.write(self.name, obj._kin_slot, value)
+
+
+class Kinematics:
+    """
+    Structure-of-arrays store of movable characters.
+
+    Row i of every array belongs to self.owners[i], rows in [0, len(self))
+    are always alive. Removing a character moves the last row into its place.
+
+    Properties:
+        position, velocity, acceleration: N x 3 float64 arrays.
+        owners: the character of each row.
+        version: increased whenever any position is changed, used by spatial
+            index to know whether it is out of date.
+    """
+
+    FIELDS: Tuple[str, ...] = ("position", "velocity", "acceleration")
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.size = 0
+        self.version = 0
+        self.owners: List[Character] = []
+        self.position = np.zeros((capacity, 3), dtype="float64")
+        self.velocity = np.zeros((capacity, 3), dtype="float64")
+        self.acceleration = np.zeros((capacity, 3), dtype="float64")
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def capacity(self) -> int:
+        return self.position.shape[0]
+
+    def __grow(self) -> None:
+        """Double the capacity of every array."""
+        capacity = max(self.capacity * 2, 1)
+        for name in self.FIELDS:
+            old: np.ndarray = getattr(self, name)
+            new = np.zeros((capacity, 3), dtype="float64")
+            new[: self.size] = old[: self.size]
+            setattr(self, name, new)
+
+    def read(self, name: str, slot: int) -> Tuple[float, float, float]:
+        x, y, z = getattr(self, name)[slot].tolist()
+        return x, y, z
+
+    def write(self, name: str, slot: int, value: Vector) -> None:
+        getattr(self, name)[slot] = (value.x, value.y, value.z)
+        if name == "position":
+            self.version += 1
+
+    def attach(self, char: Character) -> None:
+        """Move the kinematics state of char into the store."""
+
+        if char._kin_store is self:
+            return
+        if char._kin_store is not None:
+            char._kin_store.detach(char)
+
+        if self.size == self.capacity:
+            self.__grow()
+
+        slot = self.size
+        for name in self.FIELDS:
+            self.write(name, slot, char.__dict__[name])
+        self.owners.append(char)
+        self.size += 1
+
+        char._kin_store = self
+        char._kin_slot = slot
+
+    def detach(self, char: Character) -> None:
+        """Move the kinematics state of char back to itself."""
+
+        if char._kin_store is not self:
+            return
+
+        char._kinematics_sync()
+        slot = char._kin_slot
+        last = self.size - 1
+        if slot != last:  # fill the hole with the last row
+            for name in self.FIELDS:
+                array: np.ndarray = getattr(self, name)
+                array[slot] = array[last]
+            moved = self.owners[last]
+            self.owners[slot] = moved
+            moved._kin_slot = slot
+        self.owners.pop()
+        self.size -= 1
+        self.version += 1
+
+        char._kin_store = None
+        char._kin_slot = -1
+
+    def integrate(self) -> None:
+        """
+        Move every character one tick.
+
+        Acceleration will set to 0 after a accelerate,
+        velocity will keep changing the position.
+        """
+
+        n = self.size
+        if n == 0:
+            return
+        acceleration = self.acceleration[:n]
+        velocity = self.velocity[:n]
+        velocity += acceleration
+        acceleration.fill(0)
+        if velocity.any():
+            self.position[:n] += velocity
+            self.version += 1
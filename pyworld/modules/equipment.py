@@ -3,14 +3,14 @@ from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, cast
 
 from pyworld.control import ControlMixin
 from pyworld.datamodels.status_code import EquipStatus
-from pyworld.entity import Entity, with_instance_lock
+from pyworld.entity import DirtyMixin, Entity, with_instance_lock
 from pyworld.world import World
 
 
 Requirement = TypeVar("Requirement")
 
 
-class Equipment(Generic[Requirement], ControlMixin, Entity):
+class Equipment(Generic[Requirement], ControlMixin, DirtyMixin, Entity):
     require_module: Optional[Type[Requirement]] = None
     limit_num: int = 1
 
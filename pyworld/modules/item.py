@@ -10,7 +10,17 @@ from __future__ import annotations
 from collections import UserDict
 from dataclasses import dataclass, field
 from threading import Lock
-from typing import Any, ClassVar, Dict, Generic, Optional, Self, Type, TypeVar
+from typing import (
+    Any,
+    ClassVar,
+    Dict,
+    Generic,
+    Mapping,
+    Optional,
+    Self,
+    Type,
+    TypeVar,
+)
 
 from pyworld.control import ControlMixin, ControlResultModel
 from pyworld.datamodels.function_call import CallRequestModel
@@ -37,7 +47,7 @@ class Item:
     Methods: See docs below.
     """
 
-    all_items: ClassVar[Dict[str, Any]]
+    all_items: ClassVar[Dict[str, Any]] = {}
     # all_items storage all singleton of item
 
     mass: int = field(default=0, init=False)
@@ -78,10 +88,20 @@ class ItemStack(Generic[Items]):
         name: return first item's name in data list
         mass: return summary mass of all item in data list
 
+    Change num of a stack in cargo only by _gather and _split,
+    which keep the totals of the cargo.
     """
 
     item: Items
     num: int = 1
+    _cargo: Optional[Cargo[Items]] = field(
+        default=None, init=False, repr=False, compare=False
+    )  # The cargo holding self, set by Cargo
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop("_cargo", None)  # linked again by the cargo
+        return state
 
     @property
     def name(self) -> str:  # Return the Item type name
@@ -96,8 +116,13 @@ class ItemStack(Generic[Items]):
             raise TypeError(
                 f"Cannot add two different[{self.item}, {o.item}] ItemStack."
             )
-        self.num += o.num
+        num = o.num
+        self.num += num
         o.num = 0
+        if self._cargo is not None:
+            self._cargo._totals_add(num, num * self.item.mass)
+        if o._cargo is not None:
+            o._cargo._totals_add(-num, -num * o.item.mass)
         return self
 
     def _split(self, num: int) -> ItemStack[Items]:
@@ -105,6 +130,8 @@ class ItemStack(Generic[Items]):
             return ItemStack(item=self.item, num=0)
         else:
             self.num -= num
+            if self._cargo is not None:
+                self._cargo._totals_add(-num, -num * self.item.mass)
             return ItemStack(item=self.item, num=num)
 
 
@@ -119,6 +146,10 @@ class Cargo(ControlMixin, UserDict[str, ItemStack[Items]]):
     Properties:
         data: dict for inner data.
         mass: total mass include all thing in self
+        count: total num of items in self
+
+    mass and count are running totals, kept by setting or deleting a stack,
+    and by _gather or _split of a stack in self.
 
     Methods:
         append: add new thing into cargo
@@ -135,13 +166,56 @@ class Cargo(ControlMixin, UserDict[str, ItemStack[Items]]):
         for i in thing:
             self._append(i)
 
+    def __static_init__(self) -> None:
+        super().__static_init__()
+        self._count = 0
+        self._mass = 0
+        for stack in self.data.values():  # after loading from pickle
+            self.__link(stack)
+
     @property
     def mass(self) -> int:
-        return sum((stack.mass for stack in self.data.values()))
+        return self._mass
 
     @property
     def count(self) -> int:
-        return sum((i.num for i in self.values()))
+        return self._count
+
+    def __setitem__(self, key: str, stack: ItemStack[Items]) -> None:
+        old = self.data.get(key)
+        if old is not None:
+            self.__unlink(old)
+        self.data[key] = stack
+        self.__link(stack)
+
+    def __delitem__(self, key: str) -> None:
+        self.__unlink(self.data.pop(key))
+
+    def __link(self, stack: ItemStack[Items]) -> None:
+        stack._cargo = self
+        self._totals_add(stack.num, stack.mass)
+
+    def __unlink(self, stack: ItemStack[Items]) -> None:
+        stack._cargo = None
+        self._totals_add(-stack.num, -stack.mass)
+
+    def _totals_add(self, count: int, mass: int) -> None:
+        self._count += count
+        self._mass += mass
+
+    def _totals_check(self) -> None:
+        """Raise AssertionError if the totals differ from a full sum."""
+
+        count = sum(stack.num for stack in self.data.values())
+        mass = sum(stack.mass for stack in self.data.values())
+        if (count, mass) != (self._count, self._mass):
+            raise AssertionError(
+                f"Totals (count={self._count}, mass={self._mass}) of cargo differ "
+                f"from the sum (count={count}, mass={mass})."
+            )
+        for key, stack in self.data.items():
+            if stack._cargo is not self:
+                raise AssertionError(f"ItemStack {key} is not linked to the cargo.")
 
     def _append(self, o: ItemStack[Items]) -> None:
         if o.name in self.data:
@@ -150,11 +224,11 @@ class Cargo(ControlMixin, UserDict[str, ItemStack[Items]]):
             return
 
         # else: Cargo not yet has the same-named ItemStack
-        self.data[o.name] = o
+        self[o.name] = o
         return
 
     def _pop(self, key: str) -> Optional[ItemStack[Items]]:
-        return self.data.pop(key, None)
+        return self.pop(key, None)
 
 
 class CargoMixin(Character, Generic[Items]):
@@ -224,6 +298,41 @@ class CargoMixin(Character, Generic[Items]):
             stack = self.cargo._pop(name)
             return stack
 
+    def _cargo_transfer(self, to: CargoMixin[Items], items: Mapping[str, int]) -> bool:
+        """
+        Move items, {name: num}, from self's cargo to the cargo of `to`.
+
+        All or nothing, return False and move nothing if any stack lacks
+        the num, or `to` has not enough empty slots.
+        Both cargo locks are held, the lock of the smaller uuid first,
+        so two transfers in opposite directions never deadlock.
+        """
+
+        if to is self:
+            raise ValueError("Cannot transfer items to the cargo itself.")
+        first, second = sorted((self, to), key=lambda ent: ent.uuid)
+        with first.__cargo_lock, second.__cargo_lock:
+            for name, num in items.items():
+                stack = self.cargo.get(name)
+                if num < 0 or stack is None or num > stack.num:
+                    return False
+            new_slots = sum(
+                1 for name, num in items.items() if num > 0 and name not in to.cargo
+            )
+            if 0 <= to.cargo_max_slots < len(to.cargo) + new_slots:
+                return False
+
+            for name, num in items.items():
+                if num == 0:
+                    continue
+                stack = self.cargo[name]
+                if num == stack.num:
+                    moved = self.cargo._pop(name)
+                else:
+                    moved = stack._split(num)
+                to.cargo._append(moved)  # type:ignore
+            return True
+
     def _cargo_tick(self, belong: World):
         """Tick every itemstack and item."""
         with self.__cargo_lock:
@@ -1,13 +1,22 @@
 from __future__ import annotations
 
-import uuid
-from dataclasses import dataclass, field
-from enum import Enum
+import base64
+import heapq
+from collections import OrderedDict
 from threading import Lock
-from typing import List, TypeGuard
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from objprint import op  # type:ignore
 
+from pyworld.msgbus import (
+    MSG_BROADCAST,
+    MsgDrop,
+    MsgEntry,
+    MsgInbox,
+    MsgPayload,
+    MsgReceipt,
+    MsgStatus,
+)
 from pyworld.world import Character, Entity, World
 
 # TODO: Use Metaclass to regulate those generate of Mixin module.
@@ -32,54 +41,73 @@ class MsgInboxMixin(Character):
     Or, like a duck type, if an entity have msg_inbox property, it could receive msg.
 
     A entity whit MsgInbox must have an position, or msg sent to it will always failure.
-    """
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.msg_inbox: List[bytes] = []
+    The inbox is hidden from the property list, clients drain it by msg_read()
+    and msg_ack() instead.
 
+    Properties:
+        msg_inbox_size: max messages kept in inbox.
+        msg_inbox_drop: which message is dropped when inbox is full.
+    """
 
-class MsgStatus(Enum):
-    """Enum of MsgStatus"""
-
-    PENDING = "Msg is in outbox and waiting for next msg_tick."
-    SENT = "Msg is successfully sent to target."
-    NO_INBOX = "Target is found in send-radius, \
-        but target does not have property msg_inbox."
-    NOT_FOUND = "Target is not found in send radius. Ensure your target_id is correct."
-    ENSURE = "Msg is marked as ensure, will always try to send at every tick, \
-        until set to SENT."
+    msg_inbox_size: int = 64
+    msg_inbox_drop: MsgDrop = MsgDrop.OLDEST
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.msg_inbox = MsgInbox(self.msg_inbox_size, self.msg_inbox_drop)
+        self.msg_channels: Set[str] = set()  # channels of multicast to receive
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        super().__setstate__(state)
+        if "msg_channels" not in self.__dict__:  # old saves
+            self.msg_channels = set()
+        if not isinstance(self.msg_inbox, MsgInbox):  # list of bytes in old saves
+            inbox = MsgInbox(self.msg_inbox_size, self.msg_inbox_drop)
+            inbox.extend(MsgEntry(0, -1, content) for content in self.msg_inbox)
+            self.msg_inbox = inbox
+
+    def __static_init__(self) -> None:
+        super().__static_init__()
+        self._dir_mask.add("msg_inbox")
 
-@dataclass(eq=False)
-class MsgPayload:
-    """MsgPayload is the entry of  msg.outbox list
-    it contains some necessary info about the message it self.
-    """
+    def msg_read(self, n: int = 16) -> Dict[str, Any]:
+        """
+        Return at most n oldest messages in inbox, the content is base64.
 
-    target_eid: int  # Receiver of the message
-    content: bytes  # Content of the message
-    radius: float  # Broadcast radius
-    result: MsgStatus = MsgStatus.PENDING  # The send status set by MsgMixin
-    try_times: int = field(
-        default=0, init=False
-    )  # Send times, it is helpful for ENSURE message
-    msg_id: int = field(init=False)  # Msg ID, which is an UUID4().int
+        Messages are kept until msg_ack() is called with the last msg_id.
+        """
 
-    def __post_init__(self):
-        self.msg_id = uuid.uuid4().int
+        return {
+            "messages": [
+                {
+                    "msg_id": entry.msg_id,
+                    "sender_eid": entry.sender_eid,
+                    "content": base64.b64encode(entry.content).decode(),
+                }
+                for entry in self.msg_inbox.read(n)
+            ],
+            "unread": len(self.msg_inbox),
+            "dropped": self.msg_inbox.dropped,
+        }
+
+    def msg_ack(self, msg_id: int) -> int:
+        """
+        Drop the message of msg_id and every older message from inbox.
 
-    def status_update(self, status: MsgStatus):
-        self.result = status
+        Return how many are dropped.
+        """
+        return self.msg_inbox.ack(msg_id)
 
-    def __hash__(self) -> int:
-        return self.msg_id
+    def msg_subscribe(self, channel: str) -> List[str]:
+        """Receive multicast of channel, return the channels subscribed."""
+        self.msg_channels = self.msg_channels | {channel}
+        return sorted(self.msg_channels)
 
-    def __eq__(self, other: object) -> bool:
-        if isinstance(other, MsgPayload):
-            return self.msg_id == other.msg_id
-        else:
-            return False
+    def msg_unsubscribe(self, channel: str) -> List[str]:
+        """Stop receiving multicast of channel, return the channels subscribed."""
+        self.msg_channels = self.msg_channels - {channel}
+        return sorted(self.msg_channels)
 
 
 class MsgMixin(MsgInboxMixin, Character):
@@ -89,16 +117,40 @@ class MsgMixin(MsgInboxMixin, Character):
 
     It provides a basic level control of send & receive msg.
     Extra limits and restricts should be implemented on higher level class.
+
+    New payloads wait in msg_outbox for the next route. An undelivered
+    ENSURE payload waits in msg_retry, (due world age, msg_id, payload) as
+    a heap, the delay doubles every try up to msg_retry_max ticks.
+    Other payloads are retired into msg_receipts after their route.
+
+    Properties:
+        msg_receipt_size: max receipts kept, the oldest is dropped first.
+        msg_retry_max: max ticks between two tries of an ENSURE payload.
     """
 
+    msg_receipt_size: int = 256
+    msg_retry_max: int = 64
+
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
         self.msg_outbox: List[MsgPayload] = []
+        self.msg_retry: List[Tuple[int, int, MsgPayload]] = []
+        self.msg_receipts: OrderedDict[int, MsgReceipt] = OrderedDict()
         self.msg_radius: float = 100.0
 
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        super().__setstate__(state)
+        if "msg_retry" not in self.__dict__:  # every payload in outbox in old saves
+            outbox = self.msg_outbox
+            self.msg_outbox = []
+            self.msg_retry = []
+            self.msg_receipts = OrderedDict()
+            self._msg_settle(0, outbox)
+
     def __static_init__(self):
         self.__msg_outbox_lock = Lock()
         super().__static_init__()
+        self._dir_mask.add("msg_receipts")
 
     def msg_send(self, target_eid: int, content: bytes) -> int:
         """Send message to other entity with target_eid,
@@ -115,6 +167,37 @@ class MsgMixin(MsgInboxMixin, Character):
             self.msg_outbox.append(payload)
         return payload.msg_id
 
+    def msg_broadcast(self, content: bytes, radius: Optional[float] = None) -> int:
+        """
+        Send the message to every entity with inbox in radius, no more than
+        msg_radius, which is also the default.
+
+        Return the msg_id, which is the same in every inbox.
+        """
+        return self.__msg_post(MSG_BROADCAST, content, radius, None)
+
+    def msg_multicast(
+        self, channel: str, content: bytes, radius: Optional[float] = None
+    ) -> int:
+        """Like msg_broadcast, but only to the entities subscribed channel."""
+        return self.__msg_post(MSG_BROADCAST, content, radius, channel)
+
+    def __msg_post(
+        self,
+        target_eid: int,
+        content: bytes,
+        radius: Optional[float],
+        channel: Optional[str],
+    ) -> int:
+        if radius is None or radius > self.msg_radius:
+            radius = self.msg_radius
+        payload = MsgPayload(
+            target_eid=target_eid, content=content, radius=radius, channel=channel
+        )
+        with self.__msg_outbox_lock:
+            self.msg_outbox.append(payload)
+        return payload.msg_id
+
     def msg_send_ensure(self, target_eid: int, content: bytes):
         """Send the msg every tick until sent successfully."""
         payload = MsgPayload(
@@ -127,49 +210,51 @@ class MsgMixin(MsgInboxMixin, Character):
             self.msg_outbox.append(payload)
         return payload.msg_id
 
-    @classmethod
-    def _msg_target_has_inbox(cls, target: Entity) -> TypeGuard[MsgInboxMixin]:
-        """Check target character has inbox"""
-        return hasattr(target, "msg_inbox")
+    def msg_receipt(self, msg_id: int) -> Dict[str, Any]:
+        """
+        Return the status of a message sent by self.
+
+        Receipts of old messages may be dropped, KeyError is raised for them.
+        """
 
-    def _msg_tick(self, belong: World) -> None:
-        """Automatically send messages from outbox to target.inbox"""
         with self.__msg_outbox_lock:
-            for p in self.msg_outbox:
-                p.try_times += 1
-                if p.result is MsgStatus.PENDING:
-                    """Case PENDING"""
-                    if belong.world_get_entity(
-                        eid=p.target_eid
-                    ):  # Entity in World.entity_dict is always a Character
-                        """Check target exists silent"""
-                        dis = belong.world_get_natural_distance(p.target_eid, self)
-
-                        if dis is None:
-                            p.status_update(MsgStatus.NOT_FOUND)
-                            return
-
-                        if dis <= p.radius:
-                            """Only send msg in radius"""
-                            target: Entity = belong.entity_dict[p.target_eid]
-                            if self._msg_target_has_inbox(target):  # duck type
-                                target.msg_inbox.append(p.content)
-                                p.status_update(MsgStatus.SENT)
-                            else:
-                                p.status_update(MsgStatus.NO_INBOX)
-                        else:
-                            p.status_update(MsgStatus.NOT_FOUND)
-                    else:
-                        p.status_update(MsgStatus.NOT_FOUND)
-                elif p.result is MsgStatus.ENSURE:
-                    """Case ENSURE"""
-                    if belong.world_get_entity(eid=p.target_eid):
-                        dis = belong.world_get_natural_distance(p.target_eid, self)
-                        if dis:
-                            if dis <= p.radius:
-                                target = belong.entity_dict[p.target_eid]
-                                if self._msg_target_has_inbox(target):
-                                    target.msg_inbox.append(p.content)
-                                    # Only this case would set status to sent
-                                    p.status_update(MsgStatus.SENT)
-                    return
+            receipt = self.msg_receipts.get(msg_id)
+            if receipt is None:
+                waiting = self.msg_outbox + [p for _, _, p in self.msg_retry]
+                p = next((p for p in waiting if p.msg_id == msg_id), None)
+                if p is None:
+                    raise KeyError(f"No receipt of message {msg_id}.")
+                receipt = MsgReceipt.of(p)
+        return receipt.to_dict()
+
+    def _msg_collect(self, now: int) -> List[MsgPayload]:
+        """Take the payloads in outbox and the retries due at world age now."""
+
+        with self.__msg_outbox_lock:
+            payloads = self.msg_outbox
+            self.msg_outbox = []
+            retry = self.msg_retry
+            while retry and retry[0][0] <= now:
+                payloads.append(heapq.heappop(retry)[2])
+            return payloads
+
+    def _msg_settle(self, now: int, payloads: List[MsgPayload]) -> None:
+        """Put the routed payloads back to retry queue or into receipts."""
+
+        with self.__msg_outbox_lock:
+            for p in payloads:
+                if p.result is MsgStatus.ENSURE:
+                    delay = min(2 ** max(p.try_times - 1, 0), self.msg_retry_max)
+                    heapq.heappush(self.msg_retry, (now + delay, p.msg_id, p))
+                elif p.result is MsgStatus.PENDING:  # not routed yet
+                    self.msg_outbox.append(p)
+                else:
+                    self.msg_receipts[p.msg_id] = MsgReceipt.of(p)
+            while len(self.msg_receipts) > self.msg_receipt_size:
+                self.msg_receipts.popitem(last=False)
+
+    def _msg_tick(self, belong: World) -> None:
+        """Post self to the message bus of world if anything is due."""
+        retry = self.msg_retry
+        if self.msg_outbox or (retry and retry[0][0] <= belong.age):
+            belong._msg_bus.post(self)
@@ -0,0 +1,344 @@
+"""
+Message bus
+
+Route the outboxes of every MsgMixin in a world once per tick. Senders post
+themselves to the bus in their _msg_tick, and the world routes all the
+posted payloads in its _tick_last, resolving every target and distance by
+one batched query, then delivers to each inbox by a single extend.
+
+A delivered message is kept as a MsgEntry in the MsgInbox of the target,
+which holds the content bytes of the payload itself, not a copy.
+"""
+
+from __future__ import annotations
+
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+from enum import Enum
+from itertools import islice
+from threading import Lock
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+if TYPE_CHECKING:
+    from pyworld.entity import Entity
+    from pyworld.modules.message import MsgMixin
+    from pyworld.world import World
+
+
+class MsgStatus(Enum):
+    """Enum of MsgStatus"""
+
+    PENDING = "Msg is in outbox and waiting for next msg_tick."
+    SENT = "Msg is successfully sent to target."
+    NO_INBOX = "Target is found in send-radius, \
+        but target does not have property msg_inbox."
+    NOT_FOUND = "Target is not found in send radius. Ensure your target_id is correct."
+    ENSURE = "Msg is marked as ensure, will always try to send at every tick, \
+        until set to SENT."
+
+
+MSG_BROADCAST = -1  # target_eid of a payload to every inbox in radius
+
+
+@dataclass(eq=False)
+class MsgPayload:
+    """MsgPayload is the entry of  msg.outbox list
+    it contains some necessary info about the message it self.
+    """
+
+    target_eid: int  # Receiver of the message
+    content: bytes  # Content of the message
+    radius: float  # Broadcast radius
+    result: MsgStatus = MsgStatus.PENDING  # The send status set by MsgMixin
+    try_times: int = field(
+        default=0, init=False
+    )  # Send times, it is helpful for ENSURE message
+    msg_id: int = field(init=False)  # Msg ID, which is an UUID4().int
+    channel: Optional[str] = None  # Only for broadcast, recipients subscribed
+    delivered: int = field(default=0, init=False)  # Inboxes reached
+
+    def __post_init__(self):
+        self.msg_id = uuid.uuid4().int
+
+    def status_update(self, status: MsgStatus):
+        self.result = status
+
+    def __hash__(self) -> int:
+        return self.msg_id
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, MsgPayload):
+            return self.msg_id == other.msg_id
+        else:
+            return False
+
+
+class MsgEntry(NamedTuple):
+    msg_id: int
+    sender_eid: int
+    content: bytes
+
+
+class MsgReceipt(NamedTuple):
+    """What is left of a payload after it is retired from outbox."""
+
+    msg_id: int
+    target_eid: int
+    result: MsgStatus
+    try_times: int
+    delivered: int
+
+    @classmethod
+    def of(cls, p: MsgPayload) -> MsgReceipt:
+        return cls(p.msg_id, p.target_eid, p.result, p.try_times, p.delivered)
+
+    def to_dict(self) -> Dict[str, Any]:
+        rtn = self._asdict()
+        rtn["result"] = self.result.name
+        return rtn
+
+
+class MsgDrop(Enum):
+    """What a full MsgInbox drops for a new message."""
+
+    OLDEST = "oldest"  # drop the oldest unread message
+    NEWEST = "newest"  # drop the new message
+
+
+class MsgInbox:
+    """
+    Bounded inbox of MsgEntry, the oldest first.
+
+    Read messages stay in the inbox until they are acked,
+    so a client could read again after a lost response.
+    """
+
+    def __init__(self, capacity: int = 64, drop: MsgDrop = MsgDrop.OLDEST) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive.")
+        self.capacity = capacity
+        self.drop = drop
+        self.dropped = 0  # messages dropped in total
+        self.__entries: Deque[MsgEntry] = deque()
+        self.__lock = Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        with self.__lock:
+            return {
+                "capacity": self.capacity,
+                "drop": self.drop,
+                "dropped": self.dropped,
+                "entries": list(self.__entries),
+            }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["capacity"], state["drop"])  # type:ignore
+        self.dropped = state["dropped"]
+        self.__entries.extend(state["entries"])
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __iter__(self) -> Iterator[MsgEntry]:
+        return iter(list(self.__entries))
+
+    def extend(self, entries: Iterable[MsgEntry]) -> None:
+        """Put entries into inbox, drop by self.drop when it is full."""
+
+        with self.__lock:
+            for entry in entries:
+                if len(self.__entries) >= self.capacity:
+                    self.dropped += 1
+                    if self.drop is MsgDrop.NEWEST:
+                        continue
+                    self.__entries.popleft()
+                self.__entries.append(entry)
+
+    def read(self, n: int) -> List[MsgEntry]:
+        """Return at most n oldest entries, they are kept until acked."""
+        with self.__lock:
+            return list(islice(self.__entries, max(n, 0)))
+
+    def ack(self, msg_id: int) -> int:
+        """
+        Drop the entry of msg_id and every entry older than it.
+
+        Return how many are dropped, 0 if msg_id is not in inbox.
+        """
+
+        with self.__lock:
+            for i, entry in enumerate(self.__entries):
+                if entry.msg_id == msg_id:
+                    for _ in range(i + 1):
+                        self.__entries.popleft()
+                    return i + 1
+            return 0
+
+
+class MsgBus:
+    """
+    Per-world router of messages.
+
+    A PENDING payload is routed once, it is SENT, NO_INBOX or NOT_FOUND after.
+    An ENSURE payload stays ENSURE until it is delivered, the sender decides
+    when it is routed again.
+    The latency of a delivered payload is its try_times, in ticks.
+    """
+
+    def __init__(self) -> None:
+        self.__posted: List[MsgMixin] = []
+        self.__lock = Lock()
+        self._routed: int = 0  # payloads of last route
+        self._route_time: float = 0.0  # seconds of last route
+        self._counts: Counter[str] = Counter()  # MsgStatus name -> total
+        self._delivered: int = 0  # inbox entries in total
+        self._latency_total: int = 0
+        self._latency_max: int = 0
+
+    def post(self, sender: MsgMixin) -> None:
+        """Route the outbox of sender at the end of this tick."""
+        with self.__lock:
+            self.__posted.append(sender)
+
+    def route(self, world: World) -> None:
+        """Route every payload posted since last route."""
+
+        with self.__lock:
+            senders = self.__posted
+            self.__posted = []
+
+        start = time.perf_counter()
+        now = world.age
+        outboxes = [(sender, sender._msg_collect(now)) for sender in senders]
+        deliveries: Dict[Entity, List[MsgEntry]] = defaultdict(list)
+        routed = self.__route_unicast(world, outboxes, deliveries)
+        routed += self.__route_broadcast(world, outboxes, deliveries)
+
+        for target, entries in deliveries.items():
+            target.msg_inbox.extend(entries)  # type:ignore
+            self._delivered += len(entries)
+        for sender, payloads in outboxes:
+            sender._msg_settle(now, payloads)
+
+        self._routed = routed
+        self._route_time = time.perf_counter() - start
+
+    def __route_unicast(
+        self,
+        world: World,
+        outboxes: List[Tuple[MsgMixin, List[MsgPayload]]],
+        deliveries: Dict[Entity, List[MsgEntry]],
+    ) -> int:
+        """Resolve all the targets by one batched distance query."""
+
+        batch = [
+            (sender, p)
+            for sender, payloads in outboxes
+            for p in payloads
+            if p.target_eid != MSG_BROADCAST
+        ]
+        distances = world.world_get_natural_distances(
+            [(p.target_eid, sender) for sender, p in batch]
+        )
+
+        for (sender, p), dis in zip(batch, distances):
+            p.try_times += 1
+            target = None
+            if dis is not None and dis <= p.radius:
+                target = world.entity_dict.get(p.target_eid)
+
+            if target is not None and hasattr(target, "msg_inbox"):  # duck type
+                deliveries[target].append(MsgEntry(p.msg_id, sender.eid, p.content))
+                p.delivered = 1
+                self.__count(p, MsgStatus.SENT)
+            elif p.result is MsgStatus.ENSURE:
+                self.__count(p, MsgStatus.ENSURE)  # try again later
+            elif target is not None:
+                self.__count(p, MsgStatus.NO_INBOX)
+            else:
+                self.__count(p, MsgStatus.NOT_FOUND)
+        return len(batch)
+
+    def __route_broadcast(
+        self,
+        world: World,
+        outboxes: List[Tuple[MsgMixin, List[MsgPayload]]],
+        deliveries: Dict[Entity, List[MsgEntry]],
+    ) -> int:
+        """
+        Resolve the recipients of each sender by one radius query,
+        every recipient shares the same content bytes.
+        """
+
+        routed = 0
+        for sender, payloads in outboxes:
+            batch = [p for p in payloads if p.target_eid == MSG_BROADCAST]
+            if batch == []:
+                continue
+            routed += len(batch)
+
+            radius = max(p.radius for p in batch)
+            nearby = [
+                ent
+                for ent in world.world_get_nearby_entity(sender, radius)
+                if hasattr(ent, "msg_inbox")
+            ]
+            distances: List[Optional[float]] = []
+            if any(p.radius < radius for p in batch):
+                distances = world.world_get_natural_distances(
+                    [(ent, sender) for ent in nearby]
+                )
+
+            for p in batch:
+                p.try_times += 1
+                entry = MsgEntry(p.msg_id, sender.eid, p.content)
+                for i, ent in enumerate(nearby):
+                    if p.channel is not None and p.channel not in getattr(
+                        ent, "msg_channels", ()
+                    ):
+                        continue
+                    if p.radius < radius:
+                        dis = distances[i]
+                        if dis is None or dis >= p.radius:
+                            continue
+                    deliveries[ent].append(entry)
+                    p.delivered += 1
+                self.__count(p, MsgStatus.SENT if p.delivered else MsgStatus.NOT_FOUND)
+        return routed
+
+    def __count(self, p: MsgPayload, status: MsgStatus) -> None:
+        p.status_update(status)
+        self._counts[status.name] += 1
+        if status is MsgStatus.SENT:
+            self._latency_total += p.try_times
+            self._latency_max = max(self._latency_max, p.try_times)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the payloads and seconds of last route, the total count of
+        each routed status and of inbox entries delivered, and the latency
+        in ticks of delivered payloads.
+        """
+
+        sent = self._counts[MsgStatus.SENT.name]
+        return {
+            "routed": self._routed,
+            "route_time": self._route_time,
+            "counts": dict(self._counts),
+            "delivered": self._delivered,
+            "latency_mean": self._latency_total / sent if sent else 0.0,
+            "latency_max": self._latency_max,
+        }
@@ -0,0 +1,421 @@
+"""
+Incremental persistence of a World
+
+A save is a base file plus an append-only delta file next to it.
+Both files are a sequence of pickled segments, each segment records the
+fields of entities which changed since the segment before.
+
+Every field is pickled on its own, any reference to an entity of the world
+inside a field is replaced by the entity's eid (the world itself is eid 0),
+so that shared entities keep their identity after loading.
+
+The base file written by older versions, which is a single pickled World,
+is still loadable.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import pickle
+from collections import OrderedDict, deque
+from enum import Enum
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from pyworld.basic import Vector
+from pyworld.entity import DirtyMixin, DirtyStamp, Entity
+from pyworld.world import World
+
+Segment = Dict[str, Any]
+# Keys of a segment:
+#     seq: increasing number of the segment.
+#     base: True if the segment contains every entity.
+#     new: {eid: class} entities created since last segment.
+#     removed: [eid] entities deleted since last segment.
+#     fields: {eid: {name: pickled bytes}} changed fields.
+#     dropped: {eid: [name]} fields that no longer exist.
+
+WORLD_EID = 0
+ENTITY_ORDER = "entity_dict"  # the world's field, saved as the list of eids
+
+Bookkeeping = Tuple[int, int, Dict[int, Dict[str, bytes]], Dict[int, DirtyStamp]]
+# seq, saves since compact, digests of fields, dirty stamps of DirtyMixins
+
+# Values that never change in place, a snapshot keeps them as they are.
+_SCALARS = (type(None), bool, int, float, complex, str, bytes)
+_LIVE = object()  # returned by _freeze() for a value it could not copy
+
+
+def _freeze(value: Any, eids: Dict[int, int]) -> Any:
+    """
+    Return a copy of value which ticks could not change, sharing what never
+    changes in place, or _LIVE if value is not made of known types.
+
+    The copy pickles to the same bytes as value, unless value holds the same
+    mutable object twice, or a set copied in another order. Then the field
+    is only saved again.
+    """
+
+    t = type(value)
+    if t in _SCALARS or isinstance(value, Enum):
+        return value
+    if t is Vector:
+        return Vector(value.x, value.y, value.z)
+    if isinstance(value, Entity):
+        return value if id(value) in eids else _LIVE  # pickled by reference
+    if t is list or t is deque or isinstance(value, tuple):
+        items = [_freeze(item, eids) for item in value]
+        if any(item is _LIVE for item in items):
+            return _LIVE
+        if t is list:
+            return items
+        if t is deque:
+            return deque(items, maxlen=value.maxlen)
+        if all(a is b for a, b in zip(items, value)):
+            return value  # a tuple of items never change
+        return _LIVE
+    if t is set:  # items are hashable, but could change in place
+        if any(_freeze(item, eids) is not item for item in value):
+            return _LIVE
+        return set(value)
+    if t is dict or t is OrderedDict:
+        frozen = t((key, _freeze(item, eids)) for key, item in value.items())
+        if any(item is _LIVE for item in frozen.values()):
+            return _LIVE
+        if any(_freeze(key, eids) is not key for key in frozen):
+            return _LIVE
+        return frozen
+    return _LIVE
+
+
+class _EntitySnapshot(NamedTuple):
+    eid: int
+    digests: Dict[str, bytes]  # of the fields not written since last save
+    pickled: Dict[str, bytes]  # fields pickled in the snapshot
+    frozen: Dict[str, Any]  # fields copied by _freeze(), pickled later
+
+
+class Snapshot(NamedTuple):
+    """What a save needs from the world, see WorldStore.snapshot()."""
+
+    segment: Segment  # without fields and dropped yet
+    entities: List[_EntitySnapshot]
+    eids: Dict[int, int]  # id(entity) -> eid
+
+
+class _EntityPickler(pickle.Pickler):
+    def __init__(self, file: BinaryIO, eids: Dict[int, int]) -> None:
+        super().__init__(file, protocol=5)
+        self.eids = eids  # id(entity) -> eid
+
+    def persistent_id(self, obj: Any) -> Optional[int]:
+        if isinstance(obj, Entity):
+            return self.eids.get(id(obj))
+        return None
+
+
+class _EntityUnpickler(pickle.Unpickler):
+    def __init__(self, file: BinaryIO, shells: Dict[int, Entity]) -> None:
+        super().__init__(file)
+        self.shells = shells  # eid -> entity
+
+    def persistent_load(self, pid: Any) -> Entity:
+        return self.shells[pid]
+
+
+class WorldStore:
+    """
+    Save and load a World at path.
+
+    save() writes a full base segment every compact_every saves, and only
+    the changed fields in between. Changes are found by comparing the digest
+    of each pickled field with the one of last save. For a DirtyMixin,
+    only the fields it reports as written since last save are pickled.
+    """
+
+    def __init__(self, path: str, compact_every: int = 20) -> None:
+        self.path = path
+        self.delta_path = path + ".delta"
+        self.compact_every = compact_every
+        self.__seq = 0
+        self.__since_compact = 0
+        self.__digests: Dict[int, Dict[str, bytes]] = {}
+        self.__stamps: Dict[int, DirtyStamp] = {}
+
+    @staticmethod
+    def __iter_segments(f: BinaryIO) -> Iterator[Any]:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+    def load(self) -> World:
+        """
+        Rebuild the world by replaying the base and the deltas.
+
+        Raise FileNotFoundError if no base file, EOFError if base file is empty.
+        """
+
+        with open(self.path, mode="rb") as f:
+            first = pickle.load(f)
+            if isinstance(first, World):  # single pickled World
+                return first
+            segments: List[Segment] = [first]
+            segments.extend(self.__iter_segments(f))
+
+        base_seq = segments[-1]["seq"]
+        if os.path.exists(self.delta_path):
+            with open(self.delta_path, mode="rb") as f:
+                try:
+                    for segment in self.__iter_segments(f):
+                        if segment["seq"] > base_seq:
+                            segments.append(segment)
+                except pickle.UnpicklingError:
+                    pass  # the last segment is not fully written
+
+        shells: Dict[int, Entity] = {}
+        states: Dict[int, Dict[str, Any]] = {}
+        for segment in segments:
+            if segment["base"]:
+                shells.clear()
+                states.clear()
+            for eid in segment["removed"]:
+                shells.pop(eid, None)
+                states.pop(eid, None)
+            for eid, cls in segment["new"].items():
+                shells[eid] = cls.__new__(cls)
+                states[eid] = {}
+            for eid, fields in segment["fields"].items():
+                state = states[eid]
+                for name, b in fields.items():
+                    state[name] = _EntityUnpickler(io.BytesIO(b), shells).load()
+            for eid, names in segment["dropped"].items():
+                for name in names:
+                    states[eid].pop(name, None)
+            self.__seq = segment["seq"]
+
+        world = shells.pop(WORLD_EID)
+        world_state = states.pop(WORLD_EID)
+        world_state[ENTITY_ORDER] = {
+            eid: shells[eid] for eid in world_state[ENTITY_ORDER]
+        }
+        for eid, ent in shells.items():
+            ent.__setstate__(states[eid])
+        world.__setstate__(world_state)
+        assert isinstance(world, World)
+        return world
+
+    def save(self, world: World) -> int:
+        """
+        Save the world, return the bytes written.
+
+        The world should not tick while saving.
+        """
+
+        return self.write(*self.capture(world))
+
+    def compact(self, world: World) -> int:
+        """Write a full base segment, then drop the deltas."""
+
+        self.reset()
+        return self.save(world)
+
+    def reset(self) -> None:
+        """Forget what is saved, the next save writes a full base."""
+        self.__digests = {}
+        self.__stamps = {}
+
+    def capture(self, world: World) -> Tuple[bytes, bool]:
+        """
+        Pickle the next segment, return it and whether it is a base.
+
+        The world should not tick while capturing, but the result could be
+        written by write() later in any thread.
+        """
+
+        return self.pack(self.snapshot(world))
+
+    def snapshot(self, world: World) -> Snapshot:
+        """
+        Take what the next segment needs from the world.
+
+        The world should not tick while taking it. Changed fields made of
+        scalars, vectors, entities of the world, and lists, tuples, deques,
+        sets and dicts of them are copied, the other ones are pickled here.
+        Pickling the copies, hashing and building the segment are left to
+        pack(), which could run in any thread later.
+        A snapshot must be packed before the next one is taken.
+        If anything fails, the next save writes a full base.
+        """
+
+        base = not self.__digests or self.__since_compact >= self.compact_every
+        if base:
+            self.reset()
+        try:
+            return self.__snapshot(world, base=base)
+        except BaseException:
+            self.reset()
+            raise
+
+    def pack(self, snapshot: Snapshot) -> Tuple[bytes, bool]:
+        """Pickle the segment of a snapshot, return it and whether it is a base."""
+        try:
+            segment = self.__segment(snapshot)
+            return pickle.dumps(segment, protocol=5), segment["base"]
+        except BaseException:
+            self.reset()
+            raise
+
+    def write(self, data: bytes, base: bool) -> int:
+        """
+        Write a captured segment and fsync it, return the bytes written.
+
+        A base is written to a temp file then renamed into place.
+        If anything fails, the next save writes a full base.
+        """
+
+        try:
+            if base:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, mode="wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self.__fsync_dir()
+                if os.path.exists(self.delta_path):
+                    # deltas older than base are skipped anyway
+                    os.remove(self.delta_path)
+                self.__since_compact = 0
+            else:
+                with open(self.delta_path, mode="ab") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.__since_compact += 1
+        except BaseException:
+            self.reset()
+            raise
+        return len(data)
+
+    def __fsync_dir(self) -> None:
+        """Make the rename durable, not every platform supports it."""
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def bookkeeping(self) -> Bookkeeping:
+        """Return what the store remembers about the saved segments."""
+        return self.__seq, self.__since_compact, self.__digests, self.__stamps
+
+    def restore_bookkeeping(self, bookkeeping: Bookkeeping) -> None:
+        """Take over the bookkeeping of a store saved in another process."""
+        self.__seq, self.__since_compact, self.__digests, self.__stamps = bookkeeping
+
+    def __snapshot(self, world: World, base: bool) -> Snapshot:
+        self.__seq += 1
+        segment: Segment = {
+            "seq": self.__seq,
+            "base": base,
+            "new": {},
+            "removed": [],
+            "fields": {},
+            "dropped": {},
+        }
+        snapshots: List[_EntitySnapshot] = []
+
+        entities: Dict[int, Entity] = {WORLD_EID: world}
+        entities.update(world.entity_dict)
+        eids = {id(ent): eid for eid, ent in entities.items()}
+        buffer = io.BytesIO()
+        pickler = _EntityPickler(buffer, eids)  # one for all fields
+
+        for eid in list(self.__digests):
+            if eid not in entities:
+                segment["removed"].append(eid)
+                del self.__digests[eid]
+                self.__stamps.pop(eid, None)
+
+        for eid, ent in entities.items():
+            state = ent.__getstate__()
+            if eid == WORLD_EID:
+                state[ENTITY_ORDER] = list(world.entity_dict.keys())
+
+            old_digests = self.__digests.get(eid)
+            if old_digests is None:
+                segment["new"][eid] = type(ent)
+                old_digests = {}
+
+            written: Optional[Set[str]] = None  # None if unknown
+            if isinstance(ent, DirtyMixin):
+                stamp, written = ent._dirty_since(
+                    self.__stamps.get(eid), lambda ref: id(ref) in eids
+                )
+                self.__stamps[eid] = stamp
+
+            snapshot = _EntitySnapshot(eid, {}, {}, {})
+            for name, value in state.items():
+                if written is not None and name not in written:
+                    old_digest = old_digests.get(name)
+                    if old_digest is not None:
+                        snapshot.digests[name] = old_digest
+                        continue
+                frozen = _freeze(value, eids)
+                if frozen is not _LIVE:
+                    snapshot.frozen[name] = frozen
+                    continue
+                buffer.seek(0)
+                buffer.truncate()
+                pickler.clear_memo()
+                pickler.dump(value)
+                snapshot.pickled[name] = buffer.getvalue()
+            snapshots.append(snapshot)
+
+        return Snapshot(segment, snapshots, eids)
+
+    def __segment(self, snapshot: Snapshot) -> Segment:
+        segment = snapshot.segment
+        buffer = io.BytesIO()
+        pickler = _EntityPickler(buffer, snapshot.eids)
+        for eid, digests, pickled, frozen in snapshot.entities:
+            old_digests = self.__digests.get(eid, {})
+            fields: Dict[str, bytes] = {}
+            for name, value in frozen.items():
+                buffer.seek(0)
+                buffer.truncate()
+                pickler.clear_memo()
+                pickler.dump(value)
+                pickled[name] = buffer.getvalue()
+            for name, b in pickled.items():
+                digest = hashlib.blake2b(b, digest_size=16).digest()
+                if old_digests.get(name) != digest:
+                    fields[name] = b
+                digests[name] = digest
+
+            if fields:
+                segment["fields"][eid] = fields
+            dropped = [name for name in old_digests if name not in digests]
+            if dropped:
+                segment["dropped"][eid] = dropped
+            self.__digests[eid] = digests
+
+        return segment
@@ -1,14 +1,49 @@
+from typing import Optional
+
 from pyworld.control import ControlMixin
+from pyworld.datamodels.session import hash_passwd, is_passwd_hash, verify_passwd
 from pyworld.modules import CargoMixin, MsgMixin, StructMixin
 from pyworld.modules.equipment import EquipmentMixin
 from pyworld.world import Character, World
 
 
 class Player(
-    EquipmentMixin, MsgMixin, StructMixin, CargoMixin, ControlMixin, Character
+    EquipmentMixin,
+    MsgMixin,
+    StructMixin,
+    CargoMixin,
+    ControlMixin,
+    Character,
 ):
-    def __init__(self, *, username: str, passwd: str, world: World, **kwargs):
+    def __init__(
+        self,
+        *,
+        username: str,
+        passwd: str,
+        world: World,
+        passwd_iterations: Optional[int] = None,
+        **kwargs,
+    ):
+        """passwd_iterations: PBKDF2 iterations of the hash, the default if None."""
         super().__init__(**kwargs)
         self.username = username
-        self.passwd = passwd
+        # salted hash, see _passwd_check()
+        self.passwd = hash_passwd(passwd, passwd_iterations)
         world.player_dict[username] = self
+
+    def __static_init__(self) -> None:
+        super().__static_init__()
+        self._dir_mask.add("passwd")  # the hash is never sent to clients
+
+    def _passwd_check(self, passwd: str) -> bool:
+        """
+        Check passwd, slow on purpose, only use it at login.
+
+        A plain password of an old save is replaced by its hash once checked.
+        """
+
+        if not verify_passwd(self.passwd, passwd):
+            return False
+        if not is_passwd_hash(self.passwd):
+            self.passwd = hash_passwd(passwd)
+        return True
@@ -0,0 +1,188 @@
+"""
+Spatial index
+
+Answer radius and nearest queries over the positions of a Kinematics store.
+An index rebuilds itself lazily at the first query after any position in the
+store changed, so integrating a tick only costs a version increase.
+
+SpatialIndex is the interface, BruteForceIndex scans every row,
+GridIndex buckets the rows into uniform cubic cells.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import List
+
+import numpy as np
+
+from pyworld.kinematics import Kinematics
+
+Rows = np.ndarray  # 1-D int array of row index in Kinematics
+
+
+class SpatialIndex:
+    """
+    Interface of spatial index.
+
+    All distance is the natural distance. Radius queries return rows whose
+    distance to the center is strictly less than the radius, in any order.
+    """
+
+    def __init__(self, store: Kinematics) -> None:
+        self.store = store
+        self._version = -1  # store version that the index is built with
+
+    def _refresh(self) -> None:
+        if self._version != self.store.version:
+            self._rebuild()
+            self._version = self.store.version
+
+    def _rebuild(self) -> None:
+        """Rebuild inner data from self.store."""
+        pass
+
+    def _distance(self, rows: Rows, center: np.ndarray) -> np.ndarray:
+        diff = self.store.position[rows] - center
+        return np.sqrt(np.einsum("ij,ij->i", diff, diff))
+
+    def _brute_radius(self, center: np.ndarray, radius: float) -> Rows:
+        rows = np.arange(len(self.store))
+        return rows[self._distance(rows, center) < radius]
+
+    def query_radius(self, center: np.ndarray, radius: float) -> Rows:
+        """Return rows within(not include) the radius of center."""
+        raise NotImplementedError
+
+    def query_radius_many(self, centers: np.ndarray, radius: float) -> List[Rows]:
+        """Return rows within the radius of each center in M x 3 array."""
+        return [self.query_radius(center, radius) for center in centers]
+
+    def query_nearest(self, center: np.ndarray, k: int) -> Rows:
+        """Return at most k rows nearest to center, sorted by distance."""
+        raise NotImplementedError
+
+
+class BruteForceIndex(SpatialIndex):
+    """Compare with every row, no inner data to maintain."""
+
+    def query_radius(self, center: np.ndarray, radius: float) -> Rows:
+        return self._brute_radius(center, radius)
+
+    def query_radius_many(self, centers: np.ndarray, radius: float) -> List[Rows]:
+        n = len(self.store)
+        position = self.store.position[:n]
+        rtn: List[Rows] = []
+        for center in centers:
+            diff = position - center
+            dis = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+            rtn.append(np.flatnonzero(dis < radius))
+        return rtn
+
+    def query_nearest(self, center: np.ndarray, k: int) -> Rows:
+        rows = np.arange(len(self.store))
+        dis = self._distance(rows, center)
+        if k < len(rows):
+            part = np.argpartition(dis, k)[:k]
+            return part[np.argsort(dis[part], kind="stable")]
+        return np.argsort(dis, kind="stable")
+
+
+class GridIndex(SpatialIndex):
+    """
+    Uniform grid with cubic cells of cell_size.
+
+    Rows are sorted by the key of their cell, a cell is found by binary search.
+    Queries covering more cells than rows fall back to brute force.
+    """
+
+    KEY_BITS = 21  # bits of each axis in a cell key
+    KEY_MASK = (1 << KEY_BITS) - 1
+
+    def __init__(self, store: Kinematics, cell_size: float = 16.0) -> None:
+        super().__init__(store)
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive.")
+        self.cell_size = cell_size
+        self.__keys: np.ndarray = np.empty(0, dtype=np.int64)
+        self.__rows: Rows = np.empty(0, dtype=np.intp)
+
+    @classmethod
+    def _cell_key(cls, cells: np.ndarray) -> np.ndarray:
+        """
+        Pack N x 3 int cells into N int keys.
+
+        Cells far away may share a key, it only adds candidates,
+        which will be filtered by the exact distance.
+        """
+        cells = cells & cls.KEY_MASK
+        return (
+            (cells[:, 0] << (2 * cls.KEY_BITS))
+            | (cells[:, 1] << cls.KEY_BITS)
+            | cells[:, 2]
+        )
+
+    def _cells(self, position: np.ndarray) -> np.ndarray:
+        return np.floor(position / self.cell_size).astype(np.int64)
+
+    def _rebuild(self) -> None:
+        position = self.store.position[: len(self.store)]
+        keys = self._cell_key(self._cells(position))
+        order = np.argsort(keys, kind="stable")
+        self.__keys = keys[order]
+        self.__rows = order
+
+    def _candidates(self, center: np.ndarray, radius: float) -> Rows:
+        """Return rows in every cell touched by the sphere."""
+
+        span = math.ceil(radius / self.cell_size)
+        offset = np.arange(-span, span + 1)
+        grid = np.stack(np.meshgrid(offset, offset, offset), axis=-1).reshape(-1, 3)
+        query_keys = np.unique(
+            self._cell_key(grid + self._cells(center[np.newaxis, :]))
+        )
+
+        left = np.searchsorted(self.__keys, query_keys, side="left")
+        right = np.searchsorted(self.__keys, query_keys, side="right")
+        hit = right > left
+        if not hit.any():
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate(
+            [self.__rows[lo:hi] for lo, hi in zip(left[hit], right[hit])]
+        )
+
+    def _too_large(self, radius: float) -> bool:
+        """Whether a query visits more cells than the rows."""
+        span = 2 * math.ceil(radius / self.cell_size) + 1
+        return span**3 > len(self.store)
+
+    def query_radius(self, center: np.ndarray, radius: float) -> Rows:
+        self._refresh()
+        if radius <= 0:
+            return np.empty(0, dtype=np.intp)
+        if self._too_large(radius):
+            return self._brute_radius(center, radius)
+
+        rows = self._candidates(center, radius)
+        return rows[self._distance(rows, center) < radius]
+
+    def query_nearest(self, center: np.ndarray, k: int) -> Rows:
+        self._refresh()
+        n = len(self.store)
+        if k <= 0 or n == 0:
+            return np.empty(0, dtype=np.intp)
+
+        # Grow the radius until k rows are found inside it,
+        # then the k nearest rows must be all inside.
+        radius = self.cell_size
+        while not self._too_large(radius):
+            rows = self.query_radius(center, radius)
+            if len(rows) >= k:
+                break
+            radius *= 2
+        else:
+            rows = np.arange(n)
+
+        dis = self._distance(rows, center)
+        order = np.argsort(dis, kind="stable")[:k]
+        return rows[order]
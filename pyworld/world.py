@@ -1,31 +1,51 @@
 from __future__ import annotations
 
+import json
+import math
+import time
+from collections import deque
+from concurrent.futures import Future
 from functools import wraps
-from threading import Lock, Thread
+from threading import Condition, Lock, Thread
 from typing import (
     TYPE_CHECKING,
     Any,
     Callable,
+    Deque,
     Dict,
     Iterator,
     List,
     Literal,
     Optional,
     Protocol,
+    Sequence,
+    TextIO,
+    Tuple,
     Type,
     TypeGuard,
+    TypeVar,
     cast,
     runtime_checkable,
 )
+from warnings import warn
+
+import numpy as np
 
 from pyworld.basic import Vector
 from pyworld.entity import (
     ConcurrentMixin,
+    DirtyMixin,
     Entities,
     Entity,
     FutureTick,
+    TickLogRecord,
     with_instance_lock,
 )
+from pyworld.kinematics import Kinematics, KinematicsField
+from pyworld.msgbus import MsgBus
+from pyworld.spatial import GridIndex, SpatialIndex
+
+T = TypeVar("T")
 
 if TYPE_CHECKING:
     from pyworld.player import Player
@@ -64,13 +84,23 @@ class Movable(Positional, Protocol):
     acceleration: Vector
 
 
-class Character(Entity):
+class Character(DirtyMixin, Entity):
     """Stand for every character, belongs to a world
 
     Character has position, velocity and acceleration.
     All the entity in the world is instance of character.
+
+    Once created by World.world_new_entity(), those three properties are stored
+    in the world's Kinematics and integrated in batch after every world tick.
+
+    Writes to fields are tracked by DirtyMixin, so that a save skips the
+    fields not written since the last one.
     """
 
+    position = KinematicsField()
+    velocity = KinematicsField()
+    acceleration = KinematicsField()
+
     @staticmethod
     def check(ent: Any) -> TypeGuard[Character]:
         return isinstance(ent, Movable)
@@ -83,6 +113,20 @@ class Character(Entity):
         self.velocity = velo
         self.acceleration = Vector(0, 0, 0)
 
+    def __static_init__(self) -> None:
+        super().__static_init__()
+        self._kin_store: Optional[Kinematics] = None
+        self._kin_slot: int = -1
+
+    def __getstate__(self) -> Dict[str, Any]:
+        self._kinematics_sync()
+        return super().__getstate__()
+
+    def _kinematics_sync(self) -> None:
+        """Refresh the Vectors in __dict__ from the kinematics store."""
+        for name in Kinematics.FIELDS:
+            getattr(self, name)
+
     def _tick(self, belong: Optional[World] = None) -> None:
 
         assert belong is not None, ValueError(
@@ -92,15 +136,20 @@ class Character(Entity):
 
         super()._tick(belong=belong)
 
-    @mark_isolate
     def _position_tick(self, belong: Optional[World]) -> None:
+        # Character in a kinematics store is integrated by the store.
+        if self._kin_store is None:
+            self._position_integrate(belong)
+
+    @mark_isolate
+    def _position_integrate(self, belong: Optional[World]) -> None:
         # Acceleration will set to 0 after a accelerate
         # if you want to continue accelerate a entity,
         # KEEP A FORCE ON IT.
 
         if not self.acceleration.is_zero():
             self.velocity += self.acceleration
-            self.acceleration: Vector = Vector.zero()
+            self.acceleration = Vector.zero()
 
         # Velocity will keep changing the position of a entity
         if not self.velocity.is_zero():
@@ -112,8 +161,14 @@ class World(ConcurrentMixin, Entity):
     The container of a set of entity.
 
     Entity inner the world must be Character.
+
+    Properties:
+        spatial_index: the SpatialIndex type used by nearby queries,
+            override it in subclass to change the index.
     """
 
+    spatial_index: Type[SpatialIndex] = GridIndex
+
     def __init__(self) -> None:
         super().__init__(eid=0)
         self.entity_count = 0  # entity in total when the world created
@@ -125,6 +180,57 @@ class World(ConcurrentMixin, Entity):
         self._world: Literal[None] = None
         self.__entity_count_lock = Lock()
         self.__entity_dict_lock = Lock()
+        self.__tick_log_lock = Lock()
+        self._tick_log_file: Optional[TextIO] = None
+
+        # Rebuild the kinematics store after loading from pickle.
+        self._kinematics = Kinematics()
+        self._loose: Dict[int, Entity] = {}  # positional but not Character
+        for ent in self.__dict__.get("entity_dict", {}).values():
+            if isinstance(ent, Character):
+                self._kinematics.attach(ent)
+            elif isinstance(ent, Positional):
+                self._loose[ent.eid] = ent
+        self._spatial: SpatialIndex = self.spatial_index(self._kinematics)
+        self._msg_bus = MsgBus()
+
+    def _tick_last(self, belong: Optional[World] = None) -> None:
+        """
+        Route the messages and integrate all the characters
+        after concurrent ticks are done.
+        """
+        super()._tick_last(belong)
+        self._msg_bus.route(self)
+        self._kinematics.integrate()
+
+    @with_instance_lock("_World__tick_log_lock")
+    def world_tick_log_open(self, path: str) -> None:
+        """
+        Spill the tick logs of the world and every entity in it into the file,
+        one json per line.
+        """
+
+        if self._tick_log_file is not None:
+            self._tick_log_file.close()
+        self._tick_log_file = open(path, mode="a", encoding="utf-8")
+
+    @with_instance_lock("_World__tick_log_lock")
+    def world_tick_log_close(self) -> None:
+        if self._tick_log_file is not None:
+            self._tick_log_file.close()
+            self._tick_log_file = None
+
+    def _tick_log_add(self, record: TickLogRecord) -> None:
+        super()._tick_log_add(record)
+        self._tick_log_spill(self, record)
+
+    def _tick_log_spill(self, ent: Entity, record: TickLogRecord) -> None:
+        if self._tick_log_file is None:
+            return
+        line = json.dumps({"eid": ent.eid, **record.to_dict()})
+        with self.__tick_log_lock:
+            if self._tick_log_file is not None:
+                self._tick_log_file.write(line + "\n")
 
     def _world_tick(self, belong: Literal[None] = None) -> None:
         for ent in self.entity_dict.values():
@@ -150,6 +256,10 @@ class World(ConcurrentMixin, Entity):
             eid = self._world_entity_plus()
             new_e: Entities = cls(eid=eid, **kwargs)
             new_e._world = self  # before next tick, the _world property is set.
+            if isinstance(new_e, Character):
+                self._kinematics.attach(new_e)
+            elif isinstance(new_e, Positional):
+                self._loose[eid] = new_e
             self.entity_dict[eid] = new_e
             return new_e
 
@@ -171,34 +281,124 @@ class World(ConcurrentMixin, Entity):
     @with_instance_lock("_World__entity_dict_lock")
     def world_del_entity(self, eid: int) -> Optional[Entity]:
         if eid in self.entity_dict.keys():
-            return self.entity_dict.pop(eid)
+            ent = self.entity_dict.pop(eid)
+            if isinstance(ent, Character):
+                self._kinematics.detach(ent)
+            self._loose.pop(eid, None)
+            return ent
 
     @with_instance_lock("_World__entity_dict_lock")
     def world_get_nearby_entity(
         self, target: int | Entity, radius: float
     ) -> List[Entity]:
         """
-        Return character instances list near the position.
+        Return positional entities list near the position.
 
         All Positional Entity within(not include) the radius will append
-        to return list.
+        to return list, in the order of eid. Characters are found by the
+        spatial index, other entities are scanned, if they are positional
+        when added to the world.
+        """
+
+        center = self.__valid_center_input(target)
+        if center is None:
+            return []
+
+        rows = self._spatial.query_radius(center, radius)
+        return self.__nearby_entities(rows, center, radius, exclude=target)
+
+    @with_instance_lock("_World__entity_dict_lock")
+    def world_get_nearby_entities(
+        self, targets: List[int | Entity], radius: float
+    ) -> List[List[Entity]]:
         """
+        Batched version of world_get_nearby_entity.
 
-        rtn: List[Entity] = []
+        Return one list for each target, an invalid target gets an empty list.
+        """
+
+        centers = [self.__valid_center_input(target) for target in targets]
+        valid = [i for i, center in enumerate(centers) if center is not None]
+        rtn: List[List[Entity]] = [[] for _ in targets]
+        if valid == []:
+            return rtn
+
+        rows_list = self._spatial.query_radius_many(
+            np.stack([centers[i] for i in valid]), radius
+        )
+        for i, rows in zip(valid, rows_list):
+            center = cast(np.ndarray, centers[i])
+            rtn[i] = self.__nearby_entities(rows, center, radius, exclude=targets[i])
+        return rtn
+
+    @with_instance_lock("_World__entity_dict_lock")
+    def world_get_nearest_entity(
+        self, target: int | Entity, k: int = 1
+    ) -> List[Entity]:
+        """
+        Return at most k positional entities nearest to the target,
+        the nearest first.
+        """
+
+        center = self.__valid_center_input(target)
+        if center is None:
+            return []
+
+        rows = self._spatial.query_nearest(center, k + 1)  # target itself may hit
+        rtn = self.__rows_to_entities(rows, exclude=target)
+        if self._loose:
+            rtn += self.__loose_within(center, math.inf, exclude=target)
+            rtn.sort(key=lambda ent: self.__distance_to(ent, center))
+        return rtn[:k]
+
+    def __valid_center_input(self, target: int | Entity) -> Optional[np.ndarray]:
+        """Return the position array of a positional entity in self."""
 
         valid_entity: Optional[Entity] = self.__valid_entity_input(target)
         valid_target = self.__valid_positional_input(valid_entity)
         if valid_target is None:
-            return rtn
+            return None
+        position = valid_target.position
+        return np.array((position.x, position.y, position.z), dtype="float64")
+
+    def __nearby_entities(
+        self, rows: np.ndarray, center: np.ndarray, radius: float, exclude: int | Entity
+    ) -> List[Entity]:
+        """Owners of rows and loose entities within radius, in the order of eid."""
 
-        for ent in self:
-            if isinstance(ent, Positional):
-                if ent != valid_target:  # Pass char itself
-                    dis: float = self._get_natural_distance(ent, valid_target)
-                    if dis - radius < 0:
-                        rtn.append(ent)
+        rtn = self.__rows_to_entities(rows, exclude)
+        if self._loose:
+            rtn += self.__loose_within(center, radius, exclude)
+        rtn.sort(key=lambda ent: ent.eid)
         return rtn
 
+    def __rows_to_entities(
+        self, rows: np.ndarray, exclude: int | Entity
+    ) -> List[Entity]:
+        owners = self._kinematics.owners
+        exclude_eid = exclude if isinstance(exclude, int) else exclude.eid
+        return [owners[row] for row in rows.tolist() if owners[row].eid != exclude_eid]
+
+    def __loose_within(
+        self, center: np.ndarray, radius: float, exclude: int | Entity
+    ) -> List[Entity]:
+        """
+        Scan the positional entities out of the kinematics store, return
+        those within(not include) the radius.
+        """
+
+        exclude_eid = exclude if isinstance(exclude, int) else exclude.eid
+        return [
+            ent
+            for eid, ent in self._loose.items()
+            if eid != exclude_eid and self.__distance_to(ent, center) < radius
+        ]
+
+    @staticmethod
+    def __distance_to(ent: Entity, center: np.ndarray) -> float:
+        p: Vector = cast(Positional, ent).position
+        return math.dist((p.x, p.y, p.z), center.tolist())
+
     @with_instance_lock("_World__entity_dict_lock")
     def world_entity_exists(self, ent: Entity) -> bool:
         return ent in self.entity_dict.values()
@@ -222,7 +422,7 @@ class World(ConcurrentMixin, Entity):
             if not isinstance(source, Entity):
                 return None
 
-            if source not in self:
+            if self.entity_dict.get(source.eid) != source:
                 return None
 
             return source
@@ -253,35 +453,108 @@ class World(ConcurrentMixin, Entity):
             return None
         return self._get_natural_distance(valid1, valid2)
 
+    @with_instance_lock("_World__entity_dict_lock")
+    def world_get_natural_distances(
+        self, pairs: Sequence[Tuple[Entity | int, Entity | int]]
+    ) -> List[Optional[float]]:
+        """
+        Batched version of world_get_natural_distance.
+
+        Pairs of characters in the kinematics store are measured by one numpy
+        operation, a pair with any of character not exists gets None.
+        """
+
+        rtn: List[Optional[float]] = [None] * len(pairs)
+        kin = self._kinematics
+        index: List[int] = []
+        slots: List[Tuple[int, int]] = []
+        for i, pair in enumerate(pairs):
+            valid1, valid2 = map(self.__valid_entity_input, pair)
+            if isinstance(valid1, Character) and isinstance(valid2, Character):
+                if valid1._kin_store is kin and valid2._kin_store is kin:
+                    index.append(i)
+                    slots.append((valid1._kin_slot, valid2._kin_slot))
+                    continue
+            valid1, valid2 = map(self.__valid_positional_input, (valid1, valid2))
+            if (valid1 is not None) and (valid2 is not None):
+                rtn[i] = self._get_natural_distance(valid1, valid2)
+
+        if index:
+            rows = np.array(slots, dtype=np.intp)
+            delta = kin.position[rows[:, 0]] - kin.position[rows[:, 1]]
+            for i, dis in zip(index, np.sqrt((delta * delta).sum(axis=1)).tolist()):
+                rtn[i] = dis
+        return rtn
+
     def __iter__(self) -> Iterator[Entity]:
         return self.entity_dict.values().__iter__()
 
 
 class Continuum(Thread):
-    """World with time"""
+    """
+    World with time
 
-    def __init__(self, world: Optional[World] = None) -> None:
+    If tps(ticks per second) is given, ticks are paced to that rate.
+    When ticks overrun, at most max_catch_up late ticks are run back to back,
+    the rest are skipped. Otherwise ticks run as fast as possible.
+
+    A tick runs in phases:
+        commands: run what submit() queued, in order.
+        world: the world ticks.
+        listeners: call the tick listeners.
+    """
+
+    def __init__(
+        self,
+        world: Optional[World] = None,
+        *,
+        tps: Optional[float] = None,
+        max_catch_up: int = 5,
+        stats_size: int = 1000,
+    ) -> None:
         super().__init__()
         if world is None:
             world = World()
+        if tps is not None and tps <= 0:
+            raise ValueError("tps must be positive.")
         self.world = world
+        self.tps = tps
+        self.max_catch_up = max_catch_up
         self.stop_flag = False
         self.pause_flag = False
         self.is_idle = True  # tick is not running
+        self.__cond = Condition()  # guard flags above
+
+        self.tick_durations: Deque[float] = deque(maxlen=stats_size)
+        self.overrun_count = 0  # ticks took longer than a period
+        self.skipped_count = 0  # ticks dropped by catch-up policy
+
+        self.__listeners: List[Callable[[int], None]] = []
+        # deque.append and popleft are atomic, submit() never takes a lock.
+        self.__commands: Deque[Tuple[Callable[[], Any], Future[Any]]] = deque()
 
     def stop(self) -> None:
         """
         Set pause_flag and stop_flag to True, which will
         cause the run() method terminate.
 
-        Then wait until the thread end.
+        Then wait until the thread end, and release the world's thread pool
+        and tick log file.
 
         Cannot restart!
         """
         self.pause()
-        self.stop_flag = True
+        with self.__cond:
+            self.stop_flag = True
+            self.__cond.notify_all()
         if self.is_alive():
             self.join()
+        with self.__cond:
+            while self.__commands:
+                _, future = self.__commands.popleft()
+                future.cancel()
+        self.world._concurrent_shutdown()
+        self.world.world_tick_log_close()
 
     def run(self) -> None:
         """
@@ -289,25 +562,148 @@ class Continuum(Thread):
         Use `Continuum().start()` method to start the thread non-blockly.
         """
 
-        while not self.stop_flag:  # -> STOP
-            while not self.pause_flag:  # -> PAUSE
+        deadline = time.perf_counter()
+        while True:
+            with self.__cond:
+                if self.pause_flag and not self.stop_flag:  # -> PAUSE
+                    self.__cond.wait_for(
+                        lambda: not self.pause_flag or self.stop_flag
+                    )
+                    deadline = time.perf_counter()  # no catch-up for pause
+                if self.stop_flag:  # -> STOP
+                    break
                 self.is_idle = False  # -> TICK
-                self.world._tick()  # -> TICK
-                self.is_idle = True  # ->IDLE
+
+            try:
+                self._tick_once()  # -> TICK
+            finally:
+                with self.__cond:
+                    self.is_idle = True  # ->IDLE
+                    self.__cond.notify_all()
+
+            if self.tps is not None:
+                deadline = self.__pace(deadline + 1 / self.tps)
         return  # -> EXIT
 
+    def __pace(self, deadline: float) -> float:
+        """
+        Sleep until deadline, return the deadline of next tick.
+
+        Sleep is interrupted by pause() or stop().
+        """
+
+        now = time.perf_counter()
+        if now < deadline:
+            with self.__cond:
+                self.__cond.wait_for(
+                    lambda: self.pause_flag or self.stop_flag,
+                    timeout=deadline - now,
+                )
+            return deadline
+
+        # Overrun, run the late ticks without sleep, but not too many.
+        period = 1 / self.tps  # type: ignore[operator]
+        late = int((now - deadline) / period)
+        if late > self.max_catch_up:
+            self.skipped_count += late - self.max_catch_up
+            return now
+        return deadline
+
+    def submit(self, func: Callable[[], T]) -> Future[T]:
+        """
+        Run func() in the tick thread before the next tick,
+        return a future of its result.
+
+        Commands run in the order submitted, between two ticks, so they
+        never race with the world. Cancel the future to drop a command not
+        run yet, commands not run before stop() are cancelled.
+        """
+
+        future: Future[T] = Future()
+        with self.__cond:  # not appended after stop() drained the queue
+            if self.stop_flag:
+                future.cancel()
+            else:
+                self.__commands.append((func, future))
+        return future
+
+    def _run_commands(self) -> None:
+        """Run the queued commands, those queued meanwhile wait for next tick."""
+
+        commands = self.__commands
+        for _ in range(len(commands)):
+            func, future = commands.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue  # cancelled
+            try:
+                future.set_result(func())
+            except Exception as e:
+                future.set_exception(e)
+
+    def _tick_once(self) -> None:
+        self._run_commands()
+        start = time.perf_counter()
+        self.world._tick(belong=None)
+        duration = time.perf_counter() - start
+        self.tick_durations.append(duration)
+        if self.tps is not None and duration > 1 / self.tps:
+            self.overrun_count += 1
+
+        age = self.world.age
+        for listener in self.__listeners:
+            try:
+                listener(age)
+            except Exception as e:
+                warn(f"Tick listener {listener!r} failed: {e!r}")
+
+    def add_tick_listener(self, listener: Callable[[int], None]) -> None:
+        """
+        Call listener(world.age) after every tick, in the tick thread.
+
+        The tick waits for listeners, they should return quickly.
+        """
+        self.__listeners = self.__listeners + [listener]  # never mutate in place
+
+    def remove_tick_listener(self, listener: Callable[[int], None]) -> None:
+        self.__listeners = [i for i in self.__listeners if i != listener]
+
     def tick(self, num: int = 1) -> None:
         for i in range(num):
-            self.world._tick(belong=None)
+            self._tick_once()
+
+    def tick_stats(self) -> Dict[str, Any]:
+        """
+        Return the percentiles of recent tick durations in seconds,
+        and the overrun and skipped tick counts.
+        """
+
+        durations = sorted(self.tick_durations)
+        rtn: Dict[str, Any] = {
+            "tps": self.tps,
+            "count": len(durations),
+            "overrun": self.overrun_count,
+            "skipped": self.skipped_count,
+            "queued": len(self.__commands),
+        }
+        for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)):
+            rtn[name] = (
+                durations[min(int(q * len(durations)), len(durations) - 1)]
+                if durations
+                else 0.0
+            )
+        return rtn
 
     def pause(self) -> None:
         """Wait until the game pause.
         world._world_lock would release."""
-        self.pause_flag = True
-        while not self.is_idle:
-            pass
+        with self.__cond:
+            self.pause_flag = True
+            self.__cond.notify_all()
+            self.__cond.wait_for(lambda: self.is_idle)
         return
 
     def resume(self) -> None:
         """Resume the game after game pause."""
-        self.pause_flag = False
+        with self.__cond:
+            self.pause_flag = False
+            self.__cond.notify_all()
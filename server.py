@@ -1,23 +1,247 @@
 import asyncio as aio
 import os
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple, TypeVar
+from weakref import WeakKeyDictionary
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
 
 from game import Core
+from pyworld.datamodels.codec import Codec, EncodeMode, negotiate
 from pyworld.datamodels.function_call import (
+    CallBatchRequestModel,
     CallRequestModel,
     CallResultModel,
     ServerResultModel,
 )
-from pyworld.datamodels.property_cache import PropertyCache
+from pyworld.datamodels.property_cache import ChangeTracker
 from pyworld.datamodels.websockets import WSCommand, WSPayload, WSStage
 from pyworld.player import Player
+from pyworld.world import Continuum
+
+T = TypeVar("T")
+
+
+class TickSignal:
+    """
+    Wake coroutines waiting in event loops after ticks of a Continuum.
+
+    Ticks between two wakes of a loop are coalesced into one wake, so that a
+    fast tick loop does not flood the event loop.
+    """
+
+    def __init__(self, ct: Continuum) -> None:
+        self.ct = ct
+        self.__futures: Dict[aio.AbstractEventLoop, aio.Future[int]] = {}
+        self.__pending: Set[aio.AbstractEventLoop] = set()  # wake scheduled
+        self.__lock = Lock()
+        ct.add_tick_listener(self.__on_tick)
+
+    def stop(self) -> None:
+        self.ct.remove_tick_listener(self.__on_tick)
+
+    def __on_tick(self, age: int) -> None:
+        """In the tick thread."""
+        with self.__lock:
+            loops = [loop for loop in self.__futures if loop not in self.__pending]
+            self.__pending.update(loops)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self.__wake, loop)
+            except RuntimeError:  # loop is closed
+                with self.__lock:
+                    self.__futures.pop(loop, None)
+                    self.__pending.discard(loop)
+
+    def __wake(self, loop: aio.AbstractEventLoop) -> None:
+        with self.__lock:
+            self.__pending.discard(loop)
+            future = self.__futures.pop(loop, None)
+        if future is not None and not future.done():
+            future.set_result(self.ct.world.age)
+
+    async def wait(self, after: int) -> int:
+        """Wait until the world is older than after, return its age."""
+        loop = aio.get_running_loop()
+        while True:
+            with self.__lock:
+                future = self.__futures.get(loop)
+                if future is None:
+                    future = self.__futures[loop] = loop.create_future()
+            age = self.ct.world.age  # after the future, no tick is missed
+            if age > after:
+                return age
+            await aio.shield(future)
+
+
+class BlockingPool:
+    """
+    Run blocking work, like pickling or hashing, in a thread pool
+    instead of the event loop.
+
+    At most max_pending functions of an event loop are in the pool at once,
+    others wait in the loop, so that a burst can't queue up in the pool.
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 64) -> None:
+        if workers < 1 or max_pending < 1:
+            raise ValueError("workers and max_pending must be positive.")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="Server-blocking"
+        )
+        self.__limits: WeakKeyDictionary[
+            aio.AbstractEventLoop, aio.Semaphore
+        ] = WeakKeyDictionary()
+        self.running = 0  # submitted to the pool
+        self.waiting = 0  # waiting for max_pending
+
+    async def run(self, func: Callable[[], T]) -> T:
+        loop = aio.get_running_loop()
+        limit = self.__limits.get(loop)
+        if limit is None:
+            limit = self.__limits[loop] = aio.Semaphore(self.max_pending)
+
+        self.waiting += 1
+        try:
+            await limit.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            return await loop.run_in_executor(self.executor, func)
+        finally:
+            self.running -= 1
+            limit.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "running": self.running,
+            "waiting": self.waiting,
+        }
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+class LatencyHistogram:
+    """Latencies counted in fixed buckets, BOUNDS are upper bounds in seconds."""
+
+    BOUNDS: Tuple[float, ...] = (
+        0.0005,
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+    )
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(self.BOUNDS) + 1)  # the last one is +inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.buckets[bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Return the upper bound of the bucket where q of latencies fall in."""
+
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.BOUNDS, self.buckets):
+            seen += n
+            if seen >= rank and seen > 0:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [str(bound) for bound in self.BOUNDS] + ["+inf"]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class StreamState:
+    """What a /ctrl/stream connection has sent."""
+
+    def __init__(self) -> None:
+        self.since: Optional[int] = None  # age of the state sent last
+        self.lock = aio.Lock()  # requests and pushes share the ws
+
+
+class CommandTimeout(aio.TimeoutError):
+    """
+    The tick thread did not finish a command in time.
+
+    dropped is True if the command is cancelled and never runs, False if it
+    was already running, so its result is unknown.
+    """
+
+    def __init__(self, dropped: bool) -> None:
+        super().__init__("dropped" if dropped else "result unknown")
+        self.dropped = dropped
+
+    def describe(self, what: str) -> str:
+        if self.dropped:
+            return "The world does not tick, {} dropped.".format(what)
+        return (
+            "The world does not tick in time, "
+            "{} is running, result unknown.".format(what)
+        )
 
 
 class Server(FastAPI):
+    command_timeout: float = 10.0  # seconds to wait for the tick thread
+
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
-        self.core = Core(os.environ.get("PYWORLD_SAVE_PATH"))
+        tps = os.environ.get("PYWORLD_TPS")
+        self.core = Core(
+            os.environ.get("PYWORLD_SAVE_PATH"),
+            tps=float(tps) if tps else None,
+        )
+        workers = os.environ.get("PYWORLD_WORKERS")
+        max_pending = os.environ.get("PYWORLD_MAX_PENDING")
+        self.blocking = BlockingPool(
+            workers=int(workers) if workers else 4,
+            max_pending=int(max_pending) if max_pending else 64,
+        )
+        self.__register_lock = Lock()
+        # by route path, and "/ctrl/stream <COMMAND>" for each ws request
+        self.latency: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+        self.__route_paths: Dict[Callable[..., Any], str] = {}
+        # encoded /ctrl/list-method responses, by ControlMixin._ctrl_methods_key()
+        self.__methods_responses: Dict[Tuple[type, int, bool], bytes] = {}
+        # the tracker listens first, so that woken coroutines see its update
+        self.tracker = ChangeTracker(self.core.ct)
+        self.tick_signal = TickSignal(self.core.ct)
 
         @self.on_event("startup")
         async def startup_event():
@@ -25,101 +249,193 @@ class Server(FastAPI):
 
         @self.on_event("shutdown")
         async def shutdown_event():
+            self.tick_signal.stop()
+            self.tracker.stop()
             self.core.stop()
+            self.blocking.shutdown()
+
+        @self.middleware("http")
+        async def record_latency(
+            request: Request, call_next: Callable[[Request], Awaitable[Response]]
+        ) -> Response:
+            start = time.perf_counter()
+            response = await call_next(request)
+            path = self.__route_path(request.scope.get("endpoint"))
+            self.latency[path].add(time.perf_counter() - start)
+            return response
+
+        @self.get(path="/metrics")
+        async def metrics() -> Dict[str, Any]:
+            """Latency of endpoints, the blocking pool, ticks, messages and saves."""
+
+            return {
+                "latency": {k: v.to_dict() for k, v in sorted(self.latency.items())},
+                "blocking": self.blocking.stats(),
+                "tick": self.core.ct.tick_stats(),
+                "msg": self.core.ct.world._msg_bus.stats(),
+                "save": self.core.save_stats,
+            }
+
+        @self.get(path="/login")
+        async def login(username: str, passwd: str) -> ServerResultModel:
+            """Check the password once, return a session token for later calls."""
+
+            rtn = ServerResultModel()
+            token = await self.blocking.run(lambda: self.core.login(username, passwd))
+            if token is None:
+                return rtn.passwd_check_fail()
+            return rtn.success({"token": token, "ttl": self.core.sessions.ttl})
+
+        @self.get(path="/logout")
+        async def logout(token: str) -> ServerResultModel:
+            rtn = ServerResultModel()
+            if not self.core.logout(token):
+                return rtn.token_not_valid()
+            return rtn.success("Logged out.")
 
         @self.get(path="/player")
-        async def player_get_info(username: str, passwd: str):
+        async def player_get_info(token: str):
             """Get player info."""
 
             rtn = ServerResultModel()
-            if not self.core.check_login(username, passwd):
-                return rtn.passwd_check_fail()
+            p = self.core.check_token(token)
+            if p is None:
+                return rtn.token_not_valid()
 
-            p = self.core.player_dict[username]
-
-            return ServerResultModel().entity(p)
+            return await self.blocking.run(lambda: ServerResultModel().entity(p))
 
         @self.get(path="/register")
         async def register(username: str, passwd: str) -> ServerResultModel:
             """Register new player."""
             rtn = ServerResultModel()
 
-            if username in self.core.player_dict:
+            p = await self.blocking.run(lambda: self.__register(username, passwd))
+            if p is None:
                 return rtn.name_already_used()
-
-            p = self.core.register(username, passwd)
-            return ServerResultModel().entity(p)
+            return await self.blocking.run(lambda: ServerResultModel().entity(p))
 
         @self.get(path="/ctrl/list-property")
-        async def ctrl_list_properties(username: str, passwd: str) -> ServerResultModel:
+        async def ctrl_list_properties(token: str) -> ServerResultModel:
             """Get all controllable properties."""
 
             rtn = ServerResultModel()
 
-            if not self.core.check_login(username, passwd):
-                return rtn.passwd_check_fail()
+            p = self.core.check_token(token)
+            if p is None:
+                return rtn.token_not_valid()
 
-            p: Player = self.core.player_dict[username]
+            return rtn.success(await self.blocking.run(p.ctrl_list_property))
 
-            return rtn.success(p.ctrl_list_property())
-
-        @self.get(path="/ctrl/list-method")
-        async def ctrl_list_method(username: str, passwd: str) -> ServerResultModel:
+        @self.get(path="/ctrl/list-method", response_model=None)
+        async def ctrl_list_method(token: str) -> ServerResultModel | Response:
             """Get all controllable methods names and docs."""
             rtn = ServerResultModel()
 
-            if not self.core.check_login(username, passwd):
-                return rtn.passwd_check_fail()
+            p = self.core.check_token(token)
+            if p is None:
+                return rtn.token_not_valid()
+
+            return await self.__methods_response(p, signature=False)
 
-            p = self.core.player_dict[username]
+        @self.get(path="/ctrl/list-signature", response_model=None)
+        async def ctrl_list_signature(token: str) -> ServerResultModel | Response:
+            """Get all controllable methods names, docs and signatures."""
+            rtn = ServerResultModel()
+
+            p = self.core.check_token(token)
+            if p is None:
+                return rtn.token_not_valid()
 
-            return rtn.success(p.ctrl_list_method())
+            return await self.__methods_response(p, signature=True)
 
         @self.get(path="/ctrl/get-property/{key_name}")
-        async def ctrl_get_properties(
-            username: str, passwd: str, key_name: str
+        async def ctrl_get_property(
+            key_name: str,
+            token: str,
         ) -> ServerResultModel:
             """Get one specificial properties."""
             rtn = ServerResultModel()
 
-            if not self.core.check_login(username, passwd):
-                return rtn.passwd_check_fail()
-
-            p = self.core.player_dict[username]
+            p = self.core.check_token(token)
+            if p is None:
+                return rtn.token_not_valid()
 
             try:
-                value = p.ctrl_get_property(key_name)
+                value = await self.blocking.run(lambda: p.ctrl_get_property(key_name))
                 rtn.success(value)
             except KeyError as e:
                 rtn.fail(f"Key {key_name} not found.", e)
-            finally:
-                return rtn
+            return rtn
 
-        @self.post(path="/ctrl/call")
-        async def ctrl_call(
-            *, username: str, passwd: str, body: CallRequestModel
+        @self.get(path="/ctrl/get-properties")
+        async def ctrl_get_properties(
+            names: str,
+            token: str,
         ) -> ServerResultModel:
+            """Get some properties at once, names are comma separated."""
             rtn = ServerResultModel()
 
-            if not self.core.check_login(username, passwd):
-                rtn.passwd_check_fail()
+            p = self.core.check_token(token)
+            if p is None:
+                return rtn.token_not_valid()
 
-            if username not in self.core.player_dict:
-                return rtn.name_not_valid()
+            try:
+                values = await self.blocking.run(
+                    lambda: p.ctrl_get_properties(names.split(","))
+                )
+                rtn.success(values)
+            except KeyError as e:
+                rtn.fail(f"Key {e.args[0]} not found.", e)
+            return rtn
 
-            p: Player = self.core.player_dict[username]
+        @self.post(path="/ctrl/call")
+        async def ctrl_call(
+            *,
+            body: CallRequestModel,
+            token: str,
+        ) -> ServerResultModel:
+            rtn = ServerResultModel()
 
-            result: CallResultModel = p.ctrl_safe_call(body)
+            p = self.core.check_token(token)
+            if p is None:
+                return rtn.token_not_valid()
+
+            try:
+                result: CallResultModel = await self.__in_tick(
+                    lambda: p.ctrl_safe_call(body)
+                )
+            except CommandTimeout as e:
+                return rtn.fail(e.describe("call"), e)
             rtn.success(result.to_dict())
             return rtn
 
+        @self.post(path="/ctrl/batch")
+        async def ctrl_batch(
+            *,
+            body: CallBatchRequestModel,
+            token: str,
+        ) -> ServerResultModel:
+            """Call functions in order, return the result of each."""
+            rtn = ServerResultModel()
+
+            p = self.core.check_token(token)
+            if p is None:
+                return rtn.token_not_valid()
+
+            try:
+                results = await self.__in_tick(lambda: p._ctrl_batch_call(body.calls))
+            except CommandTimeout as e:
+                return rtn.fail(e.describe("batch"), e)
+            return rtn.success({"results": [r.to_dict() for r in results]})
+
         @self.websocket(path="/ctrl/stream")
         async def ctrl_stream(
             *,
             ws: WebSocket,
-            username: str,
-            passwd: str,
+            token: Optional[str] = None,
+            codec: Optional[str] = None,
         ) -> None:
+            """codec: names of codecs the client supports, comma separated."""
 
             payload: WSPayload = WSPayload()
 
@@ -129,14 +445,31 @@ class Server(FastAPI):
 
             # STAGE CHECK
             stage = WSStage.LOGIN
-            if not self.core.check_login(username, passwd):
-                payload.close(stage, reason="credential wrong")
+            p = None if token is None else self.core.check_token(token)
+            if p is None:
+                payload.close(stage, reason="token not valid")
                 await payload.send_ws(ws)
                 await ws.close()
+                return
 
-            p: Player = self.core.player_dict[username]
-            cache: PropertyCache = PropertyCache()
+            picked: Codec = negotiate(codec)
+            mode: EncodeMode = picked.mode
+            if codec is not None:
+                await payload.login(picked.name).send_ws(ws, EncodeMode.JSON)
+
+            # the first snapshot reads every property under the tick lock
+            watching = aio.ensure_future(
+                self.blocking.run(lambda: self.tracker.watch(p))
+            )
+            try:
+                await aio.shield(watching)
+            except aio.CancelledError:
+                watching.add_done_callback(lambda f: self.__unwatch_done(f, p))
+                raise
+            state = StreamState()
+            held = False  # state.lock is acquired by this loop
             stop_flag: bool = False
+            push_task: Optional[aio.Task[None]] = None
 
             # STAGE LOOP
             while not stop_flag:
@@ -146,12 +479,16 @@ class Server(FastAPI):
 
                     # STAGE CLIENT_SEND
                     stage = WSStage.CLIENT_SEND
-                    client_req: WSPayload = await WSPayload.from_read_ws(ws)
+                    client_req: WSPayload = await WSPayload.from_read_ws(ws, mode)
                     assert client_req.stage is WSStage.CLIENT_SEND
                     client_cmd = client_req.command
+                    start = time.perf_counter()
 
                     # STAGE SERVER_PREPARE
                     stage = WSStage.SERVER_PREPARE
+                    encoded: Optional[bytes] = None  # sent instead of payload
+                    await state.lock.acquire()
+                    held = True
 
                     match client_cmd:
                         case WSCommand.PING:
@@ -162,16 +499,45 @@ class Server(FastAPI):
                                 stage, reason="Client send the CLOSE command."
                             )
                         case WSCommand.ALL:
-                            payload.all(stage, detail=cache.get_entity_property(ent=p))
+                            state.since, props = self.tracker.snapshot(p)
+                            payload.all(stage, detail=props)
                         case WSCommand.DIFF:
-                            payload.diff(stage, detail=cache.get_diff_property(ent=p))
+                            frame, encoded = self.tracker.encoded(p, state.since, mode)
+                            state.since = frame.age
                         case WSCommand.CMD:
                             client_patch = CallRequestModel(**client_req.detail)
-                            payload.cmd(server_resp=p.ctrl_safe_call(data=client_patch))
+                            resp = await self.__in_tick(
+                                lambda: p.ctrl_safe_call(data=client_patch)
+                            )
+                            payload.cmd(server_resp=resp)
+                        case WSCommand.BATCH:
+                            batch = CallBatchRequestModel.parse_obj(client_req.detail)
+                            results = await self.__in_tick(
+                                lambda: p._ctrl_batch_call(batch.calls)
+                            )
+                            payload.batch(stage, results)
+                        case WSCommand.SUBSCRIBE:
+                            interval, on_change = WSPayload.subscribe_options(
+                                client_req.detail
+                            )
+                            if push_task is not None:
+                                push_task.cancel()
+                                push_task = None
+                            if interval > 0:
+                                push = self.__push(
+                                    ws, mode, state, p, interval, on_change
+                                )
+                                push_task = aio.create_task(push)
+                            payload.subscribe(stage, interval, on_change)
 
                     # STAGE SERVER_SEND
-                    payload.stage = WSStage.SERVER_SEND
-                    await payload.send_ws(ws)
+                    if encoded is not None:
+                        await ws.send_bytes(encoded)
+                    else:
+                        payload.stage = WSStage.SERVER_SEND
+                        await payload.send_ws(ws, mode)
+                    latency = time.perf_counter() - start
+                    self.latency[f"/ctrl/stream {client_cmd.name}"].add(latency)
 
                 except ValueError as e:
                     stop_flag = True
@@ -180,7 +546,10 @@ class Server(FastAPI):
                 except AssertionError as e:
                     stop_flag = True
                     payload.close(stage, "AssertionError", e)
-                    await payload.send_ws(ws)
+                    if not held:
+                        await state.lock.acquire()
+                        held = True
+                    await payload.send_ws(ws, mode)
 
                 except WebSocketDisconnect:
                     stop_flag = True
@@ -191,8 +560,112 @@ class Server(FastAPI):
                     payload.close(stage, "UnexpectedError", e)
 
                 finally:
+                    if held:
+                        state.lock.release()
+                        held = False
                     if stop_flag:
+                        if push_task is not None:
+                            push_task.cancel()
+                        self.tracker.unwatch(p)
                         try:
-                            await aio.wait([ws.close()], timeout=5.0)
+                            await aio.wait_for(ws.close(), timeout=5.0)
                         except Exception:
                             pass
+
+    def __route_path(self, endpoint: Optional[Callable[..., Any]]) -> str:
+        """Return the path of the route of endpoint, "unmatched" if none."""
+
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self.__route_paths:
+            for route in self.routes:
+                route_endpoint = getattr(route, "endpoint", None)
+                if route_endpoint is not None:
+                    self.__route_paths[route_endpoint] = getattr(route, "path", "")
+        return self.__route_paths.get(endpoint, "unmatched")
+
+    def __register(self, username: str, passwd: str) -> Optional[Player]:
+        """Register a player, None if username is used. In the blocking pool."""
+
+        with self.__register_lock:
+            if username in self.core.player_dict:
+                return None
+            return self.core.register(username, passwd)
+
+    def __unwatch_done(self, watching: aio.Future[None], p: Player) -> None:
+        """Pair a watch finished after its stream was cancelled."""
+
+        if not watching.cancelled() and watching.exception() is None:
+            self.tracker.unwatch(p)
+
+    async def __methods_response(self, p: Player, signature: bool) -> Response:
+        """Return the methods of p, encoded once for players of the same class."""
+
+        def encode() -> bytes:
+            methods = p.ctrl_list_signature() if signature else p.ctrl_list_method()
+            return ServerResultModel().success(methods).json().encode()
+
+        key = p._ctrl_methods_key()
+        cache_key = None if key is None else (*key, signature)
+        body = None if cache_key is None else self.__methods_responses.get(cache_key)
+        if body is None:
+            body = await self.blocking.run(encode)
+            if cache_key is not None:
+                self.__methods_responses[cache_key] = body
+        return Response(content=body, media_type="application/json")
+
+    async def __in_tick(self, func: Callable[[], T]) -> T:
+        """
+        Run func in the tick thread between two ticks, see Continuum.submit().
+
+        The event loop is free while waiting. Raise CommandTimeout if the
+        world does not finish func in time, func is dropped if it has not
+        started yet.
+        """
+
+        future = self.core.ct.submit(func)
+        try:
+            return await aio.wait_for(aio.wrap_future(future), self.command_timeout)
+        except aio.TimeoutError:
+            if future.cancel():  # not started, never runs
+                raise CommandTimeout(dropped=True)
+            if future.done():  # finished right at the timeout
+                return future.result()
+            raise CommandTimeout(dropped=False)
+
+    async def __push(
+        self,
+        ws: WebSocket,
+        mode: EncodeMode,
+        state: StreamState,
+        p: Player,
+        interval: int,
+        on_change: bool,
+    ) -> None:
+        """
+        Push the diff of p when the age passes a multiple of interval,
+        skip empty ones if on_change.
+
+        The diff is from what was sent last time, so if the client is slow,
+        the pushes due meanwhile are merged into one instead of queueing up.
+        The same interval makes the same ages, thus connections at the same
+        pace share the encoded diff.
+        """
+
+        world_age = self.core.ct.world.age
+        bucket = self.tracker.age(p) // interval
+        try:
+            while True:
+                world_age = await self.tick_signal.wait(after=world_age)
+                age = self.tracker.age(p)
+                if age // interval == bucket:
+                    continue
+                bucket = age // interval
+
+                async with state.lock:
+                    frame, encoded = self.tracker.encoded(p, state.since, mode)
+                    if not (on_change and frame.since is not None and not frame.diff):
+                        await ws.send_bytes(encoded)
+                    state.since = frame.age
+        except (WebSocketDisconnect, RuntimeError):
+            return  # closed, the receiving loop will clean up
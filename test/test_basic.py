@@ -0,0 +1,47 @@
+import math
+import pickle
+import unittest
+
+import numpy as np
+
+from pyworld.basic import Vector
+
+
+class TestVector(unittest.TestCase):
+    def test_math(self) -> None:
+        a = Vector(1, 2, 3)
+        b = Vector(3, 2, 1)
+        assert a + b == Vector(4, 4, 4)
+        assert a - b == Vector(-2, 0, 2)
+        assert a * 2 == 2 * a == Vector(2, 4, 6)
+        assert a / 2 == Vector(0.5, 1, 1.5)
+        assert Vector.dotproduct(a, b) == 10
+        assert Vector(3, 4, 0).length() == 5
+        assert Vector(0, 0, 2).unit() == Vector(0, 0, 1)
+        assert math.isclose(a.unit().length(), 1)
+
+    def test_zero(self) -> None:
+        assert Vector.zero().is_zero()
+        assert not Vector(0, 0, 1).is_zero()
+        with self.assertRaises(ValueError):
+            Vector.zero().unit()
+
+    def test_ndarray(self) -> None:
+        a = Vector(1, 2, 3)
+        assert a.raw_array.shape == (3, 1)
+        assert Vector.from_ndarray(a.raw_array) == a
+        assert Vector.from_ndarray(np.array([1.0, 2.0, 3.0])) == a
+
+    def test_pickle(self) -> None:
+        a = Vector(1, 2.5, -3)
+        b = pickle.loads(pickle.dumps(a))
+        assert b == a
+        assert a.__getstate__() == {"x": 1, "y": 2.5, "z": -3}
+
+    def test_random(self) -> None:
+        v = Vector.random(10)
+        assert all(-10 <= i <= 10 for i in v)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+from enum import Enum
+
+from pyworld.datamodels.codec import (
+    CODECS,
+    WS_CODECS,
+    BinaryCodec,
+    EncodeMode,
+    JsonCodec,
+    get_codec,
+    negotiate,
+)
+from pyworld.datamodels.function_call import ExceptionModel
+from pyworld.datamodels.status_code import CallStatus
+from pyworld.datamodels.websockets import WSCommand, WSPayload, WSStage
+
+
+class Color(Enum):
+    RED = 1
+
+
+PLAIN = {
+    "none": None,
+    "bool": [True, False],
+    "int": [0, 127, 128, -1, -32, -33, 2**31, -(2**40), 2**64 - 1, 2**127 + 3],
+    "float": [1.5, -0.0],
+    "str": ["", "a" * 31, "é" * 200, "x" * 70000],
+    "list": [[], list(range(20)), list(range(70000))],
+    "dict": {str(i): {"k": i} for i in range(20)},
+}
+
+
+class TestCodec(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        for mode in EncodeMode:
+            codec = get_codec(mode)
+            assert codec.decode(codec.encode(PLAIN)) == PLAIN, mode
+
+    def test_binary(self) -> None:
+        codec = get_codec(EncodeMode.BINARY)
+        assert isinstance(codec, BinaryCodec)
+        # every implementation read each other
+        pure = BinaryCodec()
+        assert codec.decode(pure.encode(PLAIN)) == PLAIN
+        assert pure.decode(codec.encode(PLAIN)) == PLAIN
+
+        assert pure.encode({"a": 1}) == b"\x81\xa1a\x01"  # MessagePack
+        assert pure.decode(pure.encode([b"\x00\xff", (1, 2)])) == [b"\x00\xff", [1, 2]]
+        assert len(pure.encode(PLAIN)) < len(JsonCodec().encode(PLAIN))
+
+    def test_not_plain(self) -> None:
+        value = [Color.RED, CallStatus.SUCCESS, ExceptionModel(exception_name="E")]
+        exception = {"exception_name": "E", "exception_detail": ""}
+        expect = [1, CallStatus.SUCCESS.value, exception]
+        for mode in WS_CODECS:
+            codec = get_codec(mode)
+            assert codec.decode(codec.encode(value)) == expect, mode
+            with self.assertRaises(TypeError):
+                codec.encode(object())
+
+    def test_broken(self) -> None:
+        for codec in (JsonCodec(), BinaryCodec(), CODECS[EncodeMode.BINARY]):
+            b = codec.encode(PLAIN)
+            for broken in (b[:-1], b + b"\x00", b"\xc1"):
+                with self.assertRaises(ValueError):
+                    codec.decode(broken)
+
+    def test_fixext(self) -> None:
+        pure = BinaryCodec()
+        uuid_int = 2**127 - 5  # 16 bytes, a fixext 16
+        b = pure.encode([uuid_int, -(2**64), 2**200])
+        assert b[1] == 0xD8 and b[19] == 0xC7  # fixext 16, ext8 of 9 bytes
+        assert pure.decode(b) == [uuid_int, -(2**64), 2**200]
+        codec = CODECS[EncodeMode.BINARY]
+        assert codec.encode(uuid_int) == pure.encode(uuid_int)
+        assert pure.decode(codec.encode([uuid_int, 2**200])) == [uuid_int, 2**200]
+        assert codec.decode(pure.encode([uuid_int, 2**200])) == [uuid_int, 2**200]
+
+    def test_hostile_length(self) -> None:
+        codec = BinaryCodec()
+        headers = (b"\xdc\xff\xff", b"\xdd\x01\x00\x00\x00", b"\xdd\xff\xff\xff\xff")
+        for header in headers:
+            with self.assertRaises(ValueError):
+                codec.decode(header)
+        with self.assertRaises(ValueError):
+            codec.decode(b"\xdf\xff\xff\xff\xff")
+        with self.assertRaises(ValueError):  # a map entry takes two bytes
+            codec.decode(b"\xdf\x00\x00\x00\x02\x01\x02")
+        assert codec.decode(b"\xdd\x00\x00\x00\x02\x01\x02") == [1, 2]
+
+    def test_negotiate(self) -> None:
+        assert negotiate(None).mode is EncodeMode.JSON
+        assert negotiate("binary,json").mode is EncodeMode.BINARY
+        assert negotiate(" unknown , json").mode is EncodeMode.JSON
+        assert negotiate("b64_pickle_bytes").mode is EncodeMode.JSON
+        with self.assertRaises(ValueError):
+            get_codec("unknown")
+
+
+class TestPayload(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        payload = WSPayload().diff(WSStage.SERVER_SEND, detail={"diff": [1, "a"]})
+        payload.exception = ExceptionModel(exception_name="E", exception_detail="e")
+        for mode in EncodeMode:
+            b = payload.encode(mode)
+            rtn = WSPayload.from_bytes(b, mode)
+            assert isinstance(rtn, WSPayload)
+            assert rtn.stage is WSStage.SERVER_SEND
+            assert rtn.command is WSCommand.DIFF
+            assert rtn.detail == {"diff": [1, "a"]}
+            assert rtn.exception == payload.exception
+        assert payload.as_bytes == payload.encode(EncodeMode.JSON)
+        assert WSPayload.from_bytes(payload.as_bytes, "json") == payload
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(ValueError):
+            WSPayload.from_bytes(b"[1]", EncodeMode.JSON)
+        with self.assertRaises(ValueError):
+            WSPayload.from_bytes(b'{"stage": 1234}', EncodeMode.JSON)
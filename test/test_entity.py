@@ -1,10 +1,15 @@
+import base64
+import json
+import os
 import pickle
+import tempfile
 import unittest
 from threading import Lock
-from typing import Optional
+from typing import List, Optional
 
 from pyworld.basic import Vector
-from pyworld.entity import Entity, with_instance_lock
+from pyworld.datamodels.status_code import CallStatus
+from pyworld.entity import DirtyMixin, Entity, TickLogRecord, with_instance_lock
 from pyworld.modules.equipments.radar import Radar
 from pyworld.player import Player
 from pyworld.world import World
@@ -89,6 +94,177 @@ class TestEntity(unittest.TestCase):
         assert self.t_entity.tick_last_time == 1
 
 
+class TestTickRegistry(unittest.TestCase):
+    class OrderEntity(Entity):
+        def __init__(self) -> None:
+            super().__init__()
+            self.order: List[str] = []
+
+        def _b_tick(self, belong: Optional[World] = None) -> None:
+            self.order.append("b")
+
+        def _a_tick(self, belong: Optional[World] = None) -> None:
+            self.order.append("a")
+
+    def setUp(self) -> None:
+        self.ent = self.OrderEntity()
+
+    def test_order(self) -> None:
+        assert self.OrderEntity._tick_names() == ("_a_tick", "_b_tick", "_report_tick")
+        self.ent._tick()
+        assert self.ent.order == ["a", "b"]
+
+    def test_instance_patch(self) -> None:
+        self.ent._tick()
+        setattr(self.ent, "_c_tick", lambda belong: self.ent.order.append("c"))
+        self.ent._tick()
+        assert self.ent.order == ["a", "b", "a", "b"]  # cached
+        Entity._tick_registry_invalidate()
+        self.ent._tick()
+        assert self.ent.order[-3:] == ["a", "b", "c"]
+
+        delattr(self.ent, "_c_tick")
+        Entity._tick_registry_invalidate()
+        self.ent._tick()
+        assert self.ent.order[-3:] == ["c", "a", "b"]
+
+    def test_class_patch(self) -> None:
+        self.ent._tick()
+        setattr(self.OrderEntity, "_c_tick", lambda s, belong: s.order.append("c"))
+        try:
+            self.ent._tick()
+            assert self.ent.order == ["a", "b", "a", "b", "c"]
+        finally:
+            delattr(self.OrderEntity, "_c_tick")
+        self.ent._tick()
+        assert self.ent.order[5:] == ["a", "b"]
+
+
+class TestTickLog(unittest.TestCase):
+    class FailEntity(Entity):
+        tick_log_size = 3
+
+        def _fail_tick(self, belong: Optional[World] = None) -> None:
+            raise ValueError(f"fail at {self.age}")
+
+    def setUp(self) -> None:
+        self.ent = Entity()
+        self.fail_ent = self.FailEntity()
+
+    def test_no_log(self) -> None:
+        self.ent._tick()
+        assert self.ent.last_tick_log is None
+        assert len(self.ent.tick_log) == 0
+
+    def test_log_flag(self) -> None:
+        self.ent._log_flag = True
+        self.ent._tick()
+        assert self.ent.last_tick_log == TickLogRecord(0, CallStatus.SUCCESS)
+        assert list(self.ent.tick_log) == [self.ent.last_tick_log]
+
+    def test_fail(self) -> None:
+        for i in range(5):
+            self.fail_ent._tick()
+        assert self.fail_ent.age == 5
+        assert [log.age for log in self.fail_ent.tick_log] == [2, 3, 4]
+        log = self.fail_ent.last_tick_log
+        assert log is not None
+        assert log.status == CallStatus.FAIL
+        assert log.exception_name == "ValueError"
+        assert log.exception_detail == "fail at 4"
+        assert 'raise ValueError(f"fail at {self.age}")' in log.traceback
+
+    def test_recover(self) -> None:
+        class FailOnceEntity(Entity):
+            def _fail_tick(self, belong: Optional[World] = None) -> None:
+                if self.age == 0:
+                    raise ValueError("fail at 0")
+
+        ent = FailOnceEntity()
+        ent._tick()
+        assert ent.last_tick_log is not None
+        ent._tick()
+        assert ent.last_tick_log is None
+        assert len(ent.tick_log) == 1
+
+    def test_pickle(self) -> None:
+        self.fail_ent._tick()
+        ent = pickle.loads(pickle.dumps(self.fail_ent))
+        assert ent.tick_log == self.fail_ent.tick_log
+        assert ent.tick_log.maxlen == 3
+
+    def test_spill(self) -> None:
+        world = World()
+        ent = world.world_new_entity(self.FailEntity)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "tick.log")
+            world.world_tick_log_open(path)
+            world._tick()
+            world._tick()
+            world.world_tick_log_close()
+            with open(path, encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f]
+        assert [line["eid"] for line in lines] == [ent.eid, ent.eid]
+        assert lines[1]["status"] == "FAIL"
+        assert lines[1]["exception_detail"] == "fail at 1"
+
+
+class TestDirty(unittest.TestCase):
+    class DirtyEntity(DirtyMixin, Entity):
+        def __init__(self) -> None:
+            super().__init__(eid=-1)
+            self.name = "a"
+            self.items: List[int] = []
+            self._hidden = 0
+
+    def setUp(self) -> None:
+        self.ent = self.DirtyEntity()
+
+    def test_since(self) -> None:
+        stamp, names = self.ent._dirty_since(None)
+        assert names == {"eid", "age", "uuid", "tick_log", "last_tick_log"} | {
+            "name",
+            "items",
+        }
+
+        stamp, names = self.ent._dirty_since(stamp)
+        assert names == {"tick_log", "items"}  # mutable, always reported
+
+        self.ent.name = "b"
+        self.ent._hidden = 1
+        self.ent.age += 1
+        stamp, names = self.ent._dirty_since(stamp)
+        assert names == {"tick_log", "items", "name", "age"}
+
+        del self.ent.name
+        self.ent._dirty_mark("uuid")
+        _, names = self.ent._dirty_since(stamp)
+        assert names == {"tick_log", "items", "name", "uuid"}
+
+    def test_flush(self) -> None:
+        self.ent._dirty_flush()
+        self.ent.name = "b"
+        assert self.ent._dirty_flush() == {"tick_log", "items", "name"}
+        assert self.ent._dirty_flush() == {"tick_log", "items"}
+
+    def test_pickle(self) -> None:
+        stamp = self.ent._dirty_stamp()
+        ent = pickle.loads(pickle.dumps(self.ent))
+        _, names = ent._dirty_since(stamp)  # stamp of another life
+        assert "name" in names and "age" in names
+
+    def test_ref(self) -> None:
+        self.ent.other = Entity()
+        stamp, _ = self.ent._dirty_since(None)
+        _, names = self.ent._dirty_since(stamp)
+        assert "other" in names  # may change in place
+        _, names = self.ent._dirty_since(stamp, lambda ref: True)
+        assert "other" not in names
+        self.ent.other = Entity()
+        _, names = self.ent._dirty_since(stamp, lambda ref: True)
+        assert "other" in names
+
+
 class TestPickleSystem(TestEntity):
     def setUp(self) -> None:
         super().setUp()
@@ -114,3 +290,54 @@ class TestPlayer(unittest.TestCase):
 
     def test_get_property(self):
         assert str(self.player.get_state()["position"]) == "(0, 0, 0)"
+
+    def test_get_properties(self):
+        props = self.player.ctrl_get_properties(["username", "age", "position"])
+        assert pickle.loads(base64.b64decode(props["username"])) == "test"
+        assert pickle.loads(base64.b64decode(props["position"])) == Vector(0, 0, 0)
+        with self.assertRaises(KeyError):
+            self.player.ctrl_get_property("equip_list")  # in _dir_mask
+        with self.assertRaises(KeyError):
+            self.player.ctrl_get_property("_tick_lock")
+
+        assert self.player.ctrl_get_property("username") is props["username"]
+        self.player.username = "other"
+        other = self.player.ctrl_get_property("username")
+        assert pickle.loads(base64.b64decode(other)) == "other"
+        self.player.position = Vector(1, 0, 0)
+        position = self.player.ctrl_get_property("position")
+        assert pickle.loads(base64.b64decode(position)) == Vector(1, 0, 0)
+
+    def test_method_registry(self):
+        methods = self.player._ctrl_methods()
+        assert methods is Player._ctrl_class_methods()  # shared by the class
+        assert "msg_send" in methods and "_tick" not in methods
+        signature = "(target_eid: int, content: bytes) -> int"
+        assert methods["msg_send"].signature == signature
+        assert self.player._ctrl_callable("msg_send")
+        assert not self.player._ctrl_callable("_tick")
+        key = self.player._ctrl_methods_key()
+        assert key is not None
+
+        def echo(input: str) -> str:
+            """Echo."""
+            return input
+
+        self.player.echo = echo
+        assert self.player._ctrl_callable("echo")
+        assert self.player.ctrl_list_method()["echo"] == "Echo."
+        assert self.player.ctrl_list_signature()["echo"]["signature"] == (
+            "(input: str) -> str"
+        )
+        assert self.player._ctrl_methods_key() is None
+        del self.player.echo
+        assert not self.player._ctrl_callable("echo")
+        assert self.player._ctrl_methods_key() == key
+
+        Player.patched = lambda self: None
+        try:
+            assert "patched" in self.player._ctrl_methods()
+            assert self.player._ctrl_methods_key() != key
+        finally:
+            del Player.patched
+        assert "patched" not in self.player._ctrl_methods()
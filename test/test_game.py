@@ -0,0 +1,123 @@
+import os
+import tempfile
+import time
+import unittest
+
+from game import Core
+from pyworld.basic import Vector
+from pyworld.datamodels.function_call import CallRequestModel
+from pyworld.datamodels.status_code import CallStatus
+from pyworld.world import Character
+
+
+class TestCoreSave(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "save.bin")
+        self.core = Core(self.path, tps=200)
+        self.core.register("test", "1")
+        self.char = self.core.ct.world.world_new_entity(
+            Character, pos=Vector(0, 0, 0), velo=Vector(1, 0, 0)
+        )
+
+    def tearDown(self) -> None:
+        self.core.stop(save=False)
+        self.core.save_wait()
+        self.dir.cleanup()
+
+    def test_save(self) -> None:
+        self.core.save()
+        assert self.core.save_stats["count"] == 1
+        assert self.core.save_stats["last_size"] > 0
+        core = Core(self.path)
+        assert "test" in core.player_dict
+
+    def test_background(self) -> None:
+        self.core.start()
+        for i in range(3):
+            self.core.save(background=True)
+        self.core.save_wait()
+        stats = self.core.save_stats
+        assert stats["count"] == 3
+        assert stats["failed"] == 0
+        assert stats["last_pause"] <= stats["last_duration"]
+
+        self.core.ct.pause()
+        self.core.save(background=True)
+        self.core.save_wait()
+        age = self.core.ct.world.age
+        self.core.ct.resume()
+
+        core = Core(self.path)
+        assert core.ct.world.age == age
+        assert "test" in core.player_dict
+        assert core.ct.world.entity_dict[self.char.eid].position == Vector(age, 0, 0)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "fork is not supported")
+    def test_fork(self) -> None:
+        self.core.start()
+        self.core.save(background=True, fork=True)
+        self.core.save_wait()
+        assert self.core.save_stats["failed"] == 0
+
+        def fail(world) -> int:
+            raise RuntimeError("disk full")
+
+        setattr(self.core.store, "save", fail)
+        with self.assertWarns(UserWarning):
+            self.core.save(background=True, fork=True)
+            self.core.save_wait()
+        stats = self.core.save_stats
+        assert stats["failed"] == 1
+        assert "disk full" in stats["last_error"]
+
+        setattr(self.core.store, "save", lambda world: time.sleep(30))
+        with self.assertWarns(UserWarning):
+            self.core.save(background=True, fork=True, timeout=0.5)
+            self.core.save_wait()
+        assert stats["failed"] == 2
+        assert "timed out" in stats["last_error"]
+        assert stats["last_duration"] < 10
+
+
+class TestCoreBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.core = Core(os.path.join(self.dir.name, "save.bin"))
+        self.player = self.core.register("test", "1")
+        ages = []
+        setattr(self.player, "record", lambda: ages.append(self.core.ct.world.age))
+        self.ages = ages
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_call_at_tick(self) -> None:
+        calls = [
+            CallRequestModel(func_name="record", kwargs={}),
+            CallRequestModel(func_name="record", kwargs={"x": 1}),
+            CallRequestModel(func_name="record", kwargs={}),
+        ]
+        future = self.core.call_at_tick(self.player, calls)
+        assert not future.done()
+        self.core.ct.tick()
+        results = future.result(timeout=0)
+        assert [r.status for r in results] == [
+            CallStatus.SUCCESS,
+            CallStatus.FAIL,
+            CallStatus.SUCCESS,
+        ]
+        assert self.ages == [0, 0]  # before the tick
+
+        dropped = self.core.call_at_tick(self.player, calls)
+        dropped.cancel()
+        self.core.ct.tick()
+        assert self.ages == [0, 0]
+
+        pending = self.core.call_at_tick(self.player, calls)
+        self.core.stop(save=False)
+        assert pending.cancelled()
+
+
+if __name__ == "__main__":
+    unittest.main()
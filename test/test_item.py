@@ -0,0 +1,100 @@
+import pickle
+import threading
+import unittest
+from dataclasses import dataclass, field
+
+from pyworld.basic import Vector
+from pyworld.modules.item import Cargo, CargoMixin, Item
+from pyworld.world import World
+
+
+@dataclass
+class Ore(Item):
+    mass: int = field(default=2, init=False)
+
+
+@dataclass
+class Gem(Item):
+    mass: int = field(default=1, init=False)
+
+
+class Holder(CargoMixin):
+    pass
+
+
+class TestCargo(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cargo: Cargo = Cargo(Ore().to_stack(3), Gem().to_stack(5))
+
+    def test_totals(self) -> None:
+        cargo = self.cargo
+        assert (cargo.count, cargo.mass) == (8, 11)
+        cargo._append(Ore().to_stack(2))
+        assert (cargo.count, cargo.mass) == (10, 15)
+        half = cargo["Gem"]._split(2)
+        assert (cargo.count, cargo.mass) == (8, 13)
+        cargo._append(half)
+        assert cargo._pop("Ore") is not None
+        assert (cargo.count, cargo.mass) == (5, 5)
+        cargo["Ore"] = Ore().to_stack(1)
+        del cargo["Gem"]
+        assert (cargo.count, cargo.mass) == (1, 2)
+        cargo._totals_check()
+
+    def test_check(self) -> None:
+        self.cargo["Ore"].num = 100  # not by _gather or _split
+        with self.assertRaises(AssertionError):
+            self.cargo._totals_check()
+
+    def test_pickle(self) -> None:
+        cargo: Cargo = pickle.loads(pickle.dumps(self.cargo))
+        assert (cargo.count, cargo.mass) == (8, 11)
+        cargo._totals_check()
+
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self) -> None:
+        world = World()
+        self.a: Holder = world.world_new_entity(
+            Holder, pos=Vector(0, 0, 0), cargo_max_slots=-1
+        )
+        self.b: Holder = world.world_new_entity(
+            Holder, pos=Vector(0, 0, 0), cargo_max_slots=1
+        )
+        self.a._cargo_add(Ore().to_stack(3))
+        self.a._cargo_add(Gem().to_stack(5))
+
+    def test_transfer(self) -> None:
+        assert self.a._cargo_transfer(self.b, {"Ore": 3, "Gem": 0})
+        assert "Ore" not in self.a.cargo and self.b.cargo["Ore"].num == 3
+        assert self.b._cargo_transfer(self.a, {"Ore": 1})
+        assert (self.a.cargo.count, self.b.cargo.count) == (6, 2)
+        for holder in (self.a, self.b):
+            holder.cargo._totals_check()
+
+    def test_all_or_nothing(self) -> None:
+        assert not self.a._cargo_transfer(self.b, {"Ore": 1, "Gem": 6})
+        assert not self.a._cargo_transfer(self.b, {"Ore": 1, "Gem": 1})  # slots
+        assert not self.a._cargo_transfer(self.b, {"Iron": 1})
+        assert (self.a.cargo.count, self.b.cargo.count) == (8, 0)
+        with self.assertRaises(ValueError):
+            self.a._cargo_transfer(self.a, {"Ore": 1})
+
+    def test_opposite(self) -> None:
+        self.b.cargo_max_slots = -1
+        self.b._cargo_add(Ore().to_stack(3))
+
+        def move(src: Holder, dst: Holder) -> None:
+            for _ in range(500):
+                src._cargo_transfer(dst, {"Ore": 1})
+
+        threads = [
+            threading.Thread(target=move, args=(self.a, self.b)),
+            threading.Thread(target=move, args=(self.b, self.a)),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+        assert not any(t.is_alive() for t in threads)
+        assert self.a.cargo.count + self.b.cargo.count == 11
@@ -1,16 +1,24 @@
+import asyncio
 import os
 import unittest
 import base64
 import pickle
+import time
+from typing import Any, Dict, List
 
 from fastapi.testclient import TestClient
 
-from pyworld.datamodels.function_call import CallRequestModel
+from pyworld.basic import Vector
+from pyworld.datamodels.codec import EncodeMode
+from pyworld.datamodels.function_call import CallBatchRequestModel, CallRequestModel
+from pyworld.datamodels.property_cache import ChangeTracker
 from pyworld.datamodels.status_code import CallStatus
+from pyworld.datamodels.websockets import WSCommand, WSPayload, WSStage
 from pyworld.modules.equipments.radar import Radar
 from pyworld.modules.item import Item
 from pyworld.player import Player
-from server import Server
+from pyworld.world import Continuum
+from server import BlockingPool, LatencyHistogram, Server, TickSignal
 
 
 class TargetItem(Item):
@@ -28,6 +36,12 @@ class TestServer(unittest.TestCase):
             "passwd": "1",
         }
 
+    def auth(self) -> Dict[str, str]:
+        """Query params with a session token of the registered test player."""
+        token = self.server.core.login(**self.params)
+        assert token is not None
+        return {"token": token}
+
     def tearDown(self) -> None:
         try:
             self.server.core.stop()
@@ -44,7 +58,7 @@ class TestServer(unittest.TestCase):
 
         player_s = self.world.world_get_entity(int(eid)).get_state()
         player_c = response.json()["detail"]
-        compare_list = ["uuid", "eid", "username", "passwd"]
+        compare_list = ["uuid", "eid", "username"]
         for entry in compare_list:
             assert player_s[entry] == player_c[entry]
 
@@ -56,13 +70,14 @@ class TestServer(unittest.TestCase):
             cls=Radar,
         )
         player_s._equip_add(radar)
-        response = self.client.get("/ctrl/list-property", params=self.params)
+        response = self.client.get("/ctrl/list-property", params=self.auth())
         assert response.status_code == 200
         assert response.json()["status"] == CallStatus.SUCCESS.value
         player_c = response.json()["detail"]
-        compare_list = ["uuid", "eid", "username", "passwd"]
+        compare_list = ["uuid", "eid", "username"]
         for entry in compare_list:
             assert player_s.get_state()[entry] == player_c[entry]
+        assert "passwd" not in player_c
 
     def test_ctrl_get_property(self) -> None:
         eid = self.server.core.register(**self.params).eid
@@ -72,17 +87,38 @@ class TestServer(unittest.TestCase):
             cls=Radar,
         )
         assert player_s._equip_add(radar)
-        response = self.client.get("/ctrl/get-property/equip_list", params=self.params)
+        response = self.client.get("/ctrl/get-property/equip_list", params=self.auth())
         assert response.status_code == 200
         assert response.json()['status'] == 5
 
-        response = self.client.get("/ctrl/get-property/uuid", params=self.params)
+        response = self.client.get("/ctrl/get-property/uuid", params=self.auth())
         assert response.status_code == 200
         assert response.json()['status'] == 3
         uuid_b = base64.decodebytes(response.json()['detail'].encode('utf-8'))
         uuid = pickle.loads(uuid_b)
         assert uuid == player_s.uuid
 
+    def test_ctrl_get_properties(self) -> None:
+        eid = self.server.core.register(**self.params).eid
+        player_s: Player = self.world.world_get_entity(eid)
+        params = dict(self.auth(), names="uuid,username,position")
+        response = self.client.get("/ctrl/get-properties", params=params)
+        assert response.json()["status"] == CallStatus.SUCCESS.value
+        detail = {
+            k: pickle.loads(base64.b64decode(v))
+            for k, v in response.json()["detail"].items()
+        }
+        assert detail == {
+            "uuid": player_s.uuid,
+            "username": "test",
+            "position": player_s.position,
+        }
+
+        for names in ("uuid,equip_list", "uuid,_tick_lock", "uuid,nope"):
+            params = dict(self.auth(), names=names)
+            response = self.client.get("/ctrl/get-properties", params=params)
+            assert response.json()["status"] == CallStatus.FAIL.value
+
     def test_ctrl_get_method(self) -> None:
         def you_got_me():
             """
@@ -99,7 +135,7 @@ class TestServer(unittest.TestCase):
         setattr(player_s, "you_got_me", you_got_me)
         setattr(player_s, "_not_see_me", _not_see_me)
 
-        response = self.client.get("/ctrl/get-method", params=self.params)
+        response = self.client.get("/ctrl/get-method", params=self.auth())
         assert response.status_code == 200
         assert response.json()["status"] == CallStatus.SUCCESS.value
         player_method_c = response.json()["detail"]
@@ -111,6 +147,21 @@ class TestServer(unittest.TestCase):
         delattr(player_s, "you_got_me")
         delattr(player_s, "_not_see_me")
 
+    def test_list_method(self) -> None:
+        self.server.core.register(**self.params)
+        first = self.client.get("/ctrl/list-method", params=self.auth())
+        second = self.client.get("/ctrl/list-method", params=self.auth())
+        assert first.content == second.content
+        assert first.json()["status"] == CallStatus.SUCCESS.value
+        assert "msg_send" in first.json()["detail"]
+
+        response = self.client.get("/ctrl/list-signature", params=self.auth())
+        detail = response.json()["detail"]
+        assert detail["msg_send"]["signature"].startswith("(target_eid: int")
+
+        response = self.client.get("/ctrl/list-method", params={"token": "x"})
+        assert response.json()["status"] == CallStatus.FAIL.value
+
     def test_call(self) -> None:
         eid = self.server.core.register(**self.params).eid
         player_s: Player = self.world.world_get_entity(eid)
@@ -122,12 +173,296 @@ class TestServer(unittest.TestCase):
 
         request = CallRequestModel(func_name="echo", kwargs={"input": "Hello World"})
         response = self.client.post(
-            "/ctrl/call", params=self.params, json=request.dict()
+            "/ctrl/call", params=self.auth(), json=request.dict()
         )
         assert response.status_code == 200
         result = response.json()
         assert response.json()["status"] == CallStatus.SUCCESS.value
         assert result["detail"]["detail"] == "Hello World"
 
+    def test_call_timeout(self) -> None:
+        eid = self.server.core.register(**self.params).eid
+        player_s: Player = self.world.world_get_entity(eid)
+        setattr(player_s, "nap", lambda: time.sleep(0.5))
+        self.server.command_timeout = 0.1
+        request = CallRequestModel(func_name="nap", kwargs={})
+
+        response = self.client.post(
+            "/ctrl/call", params=self.auth(), json=request.dict()
+        )
+        assert response.json()["status"] == CallStatus.FAIL.value
+        assert "result unknown" in response.json()["detail"]
+
+        self.server.core.ct.pause()
+        response = self.client.post(
+            "/ctrl/call", params=self.auth(), json=request.dict()
+        )
+        assert "dropped" in response.json()["detail"]
+        self.server.core.ct.resume()
+
+    def test_batch(self) -> None:
+        eid = self.server.core.register(**self.params).eid
+        player_s: Player = self.world.world_get_entity(eid)
+        setattr(player_s, "echo", lambda input: input)
+
+        calls = [
+            CallRequestModel(func_name="echo", kwargs={"input": "a"}),
+            CallRequestModel(func_name="echo", kwargs={}),
+            CallRequestModel(func_name="echo", kwargs={"input": "b"}),
+        ]
+        body = CallBatchRequestModel(calls=calls)
+        response = self.client.post(
+            "/ctrl/batch", params=self.auth(), json=body.dict()
+        )
+        assert response.json()["status"] == CallStatus.SUCCESS.value
+        results = response.json()["detail"]["results"]
+        assert [r["status"] for r in results] == [
+            CallStatus.SUCCESS.value,
+            CallStatus.FAIL.value,
+            CallStatus.SUCCESS.value,
+        ]
+        assert results[2]["detail"] == "b"
+
+        with self.client.websocket_connect("/ctrl/stream", params=self.auth()) as ws:
+            req = WSPayload(stage=WSStage.CLIENT_SEND, command=WSCommand.BATCH)
+            req.detail = {"calls": [c.dict() for c in calls]}
+            ws.send_bytes(req.as_bytes)
+            resp = WSPayload.from_bytes(ws.receive_bytes(), EncodeMode.JSON)
+            assert resp.command is WSCommand.BATCH
+            assert [r["detail"] for r in resp.detail["results"]][::2] == ["a", "b"]
+
+            req = WSPayload(stage=WSStage.CLIENT_SEND, command=WSCommand.CMD)
+            req.detail = calls[0].dict()
+            ws.send_bytes(req.as_bytes)
+            resp = WSPayload.from_bytes(ws.receive_bytes(), EncodeMode.JSON)
+            assert resp.command is WSCommand.CMD
+            assert resp.detail["detail"] == "a"
+
     def test_ws(self) -> None:
-        pass
+        self.server.core.register(**self.params)
+        diff = WSPayload(stage=WSStage.CLIENT_SEND, command=WSCommand.DIFF)
+
+        # no offer, JSON without the login payload
+        with self.client.websocket_connect("/ctrl/stream", params=self.auth()) as ws:
+            ws.send_bytes(diff.encode(EncodeMode.JSON))
+            resp = WSPayload.from_bytes(ws.receive_bytes(), EncodeMode.JSON)
+            assert resp.command is WSCommand.DIFF
+            assert resp.stage is WSStage.SERVER_SEND
+            assert resp.detail["diff"][0][0] == "add"
+
+        # pickle is never picked
+        params = dict(self.auth(), codec="b64_pickle_bytes,binary")
+        with self.client.websocket_connect("/ctrl/stream", params=params) as ws:
+            login = WSPayload.from_bytes(ws.receive_bytes(), EncodeMode.JSON)
+            assert login.stage is WSStage.LOGIN
+            assert login.detail == {"codec": "binary"}
+
+            ws.send_bytes(diff.encode(EncodeMode.BINARY))
+            resp = WSPayload.from_bytes(ws.receive_bytes(), EncodeMode.BINARY)
+            assert resp.command is WSCommand.DIFF
+            assert resp.detail["diff"][0][0] == "add"
+
+    def test_token(self) -> None:
+        self.server.core.register(**self.params)
+        wrong = dict(self.params, passwd="2")
+        response = self.client.get("/login", params=wrong)
+        assert response.json()["status"] == CallStatus.FAIL.value
+
+        response = self.client.get("/login", params=self.params)
+        assert response.json()["status"] == CallStatus.SUCCESS.value
+        token = response.json()["detail"]["token"]
+        player = self.server.core.player_dict["test"]
+        assert player.passwd != "1"  # hashed
+        assert "passwd" not in player.ctrl_list_property()
+        with self.assertRaises(KeyError):
+            player.ctrl_get_property("passwd")
+
+        request = CallRequestModel(func_name="ctrl_list_method", kwargs={})
+        response = self.client.post(
+            "/ctrl/call", params={"token": token}, json=request.dict()
+        )
+        assert response.json()["status"] == CallStatus.SUCCESS.value
+        response = self.client.post(
+            "/ctrl/call", params={"token": token[:-1]}, json=request.dict()
+        )
+        assert response.json()["status"] == CallStatus.FAIL.value
+
+        diff = WSPayload(stage=WSStage.CLIENT_SEND, command=WSCommand.DIFF)
+        params = {"token": token}
+        with self.client.websocket_connect("/ctrl/stream", params=params) as ws:
+            ws.send_bytes(diff.encode(EncodeMode.JSON))
+            resp = WSPayload.from_bytes(ws.receive_bytes(), EncodeMode.JSON)
+            assert resp.command is WSCommand.DIFF
+
+        response = self.client.get("/logout", params={"token": token})
+        assert response.json()["status"] == CallStatus.SUCCESS.value
+        response = self.client.get("/player", params={"token": token})
+        assert response.json()["status"] == CallStatus.FAIL.value
+
+        # credentials are only accepted by /login and /register
+        response = self.client.get("/player", params=self.params)
+        assert response.status_code == 422
+        with self.client.websocket_connect("/ctrl/stream", params=self.params) as ws:
+            resp = WSPayload.from_bytes(ws.receive_bytes(), EncodeMode.JSON)
+            assert resp.command is WSCommand.CLOSE
+
+    def test_metrics(self) -> None:
+        self.server.core.register(**self.params)
+        self.client.get("/login", params=self.params)
+        self.client.get("/ctrl/get-property/uuid", params=self.auth())
+        with self.client.websocket_connect("/ctrl/stream", params=self.auth()) as ws:
+            req = WSPayload(stage=WSStage.CLIENT_SEND, command=WSCommand.PING)
+            ws.send_bytes(req.as_bytes)
+            ws.receive_bytes()
+
+        metrics = self.client.get("/metrics").json()
+        latency = metrics["latency"]
+        assert latency["/login"]["count"] == 1
+        assert latency["/ctrl/get-property/{key_name}"]["count"] == 1
+        assert latency["/ctrl/stream PING"]["count"] == 1
+        assert metrics["blocking"]["workers"] == 4
+        assert "queued" in metrics["tick"]
+        assert metrics["msg"]["routed"] == 0
+
+    def test_ws_subscribe(self) -> None:
+        self.server.core.register(**self.params)
+        with self.client.websocket_connect("/ctrl/stream", params=self.auth()) as ws:
+
+            def send(command: WSCommand, detail: Dict[str, Any] = {}) -> None:
+                req = WSPayload(stage=WSStage.CLIENT_SEND, command=command)
+                req.detail = detail
+                ws.send_bytes(req.as_bytes)
+
+            def receive() -> WSPayload:
+                return WSPayload.from_bytes(ws.receive_bytes(), EncodeMode.JSON)
+
+            send(WSCommand.SUBSCRIBE, {"interval": 3, "on_change": False})
+            ack = receive()
+            assert ack.command is WSCommand.SUBSCRIBE
+            assert ack.detail == {"interval": 3, "on_change": False}
+
+            pushes = [receive() for _ in range(4)]
+            assert all(push.command is WSCommand.DIFF for push in pushes)
+            assert pushes[0].detail["since"] is None
+            assert pushes[0].detail["diff"][0][0] == "add"
+            for last, push in zip(pushes, pushes[1:]):
+                # ticks are not paced, a slow client may fall out of history
+                assert push.detail["since"] in (last.detail["age"], None)
+                assert push.detail["age"] // 3 > last.detail["age"] // 3
+
+            # stop pushing, the pushes already sent come before the ack
+            send(WSCommand.SUBSCRIBE, {"interval": 0})
+            while receive().command is not WSCommand.SUBSCRIBE:
+                pass
+            send(WSCommand.PING)
+            assert receive().command is WSCommand.PING
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self) -> None:
+        hist = LatencyHistogram()
+        assert hist.to_dict()["p50"] == 0.0
+        for seconds in [0.0001] * 8 + [0.003, 20.0]:
+            hist.add(seconds)
+        d = hist.to_dict()
+        assert d["count"] == 10 and d["max"] == 20.0
+        assert d["p50"] == 0.0005
+        assert d["p90"] == 0.005
+        assert d["p99"] == 20.0
+        assert d["buckets"]["0.0005"] == 8 and d["buckets"]["+inf"] == 1
+
+    def test_pool(self) -> None:
+        pool = BlockingPool(workers=4, max_pending=2)
+        running = []
+        peak = []
+
+        def work() -> int:
+            running.append(1)
+            peak.append(len(running))
+            time.sleep(0.02)
+            running.pop()
+            return 1
+
+        async def main() -> List[int]:
+            return await asyncio.gather(*(pool.run(work) for _ in range(6)))
+
+        try:
+            assert asyncio.run(main()) == [1] * 6
+        finally:
+            pool.shutdown()
+        assert max(peak) <= 2
+        assert pool.stats()["running"] == pool.stats()["waiting"] == 0
+
+
+class TestTickSignal(unittest.TestCase):
+    def test_coalesce(self) -> None:
+        ct = Continuum()
+        signal = TickSignal(ct)
+
+        async def main() -> int:
+            waiting = asyncio.create_task(signal.wait(after=0))
+            await asyncio.sleep(0)  # start waiting
+            ct.tick(3)  # in the loop thread, woken after this
+            return await waiting
+
+        assert asyncio.run(main()) == 3
+        signal.stop()
+
+
+class TestChangeTracker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.ct = Continuum()
+        self.tracker = ChangeTracker(self.ct)
+        world = self.ct.world
+        self.player: Player = world.world_new_entity(
+            cls=Player, pos=Vector(0, 0, 0), username="a", passwd="", world=world
+        )
+
+    def tearDown(self) -> None:
+        self.tracker.stop()
+
+    def test_delta(self) -> None:
+        self.tracker.watch(self.player)
+        age, props = self.tracker.snapshot(self.player)
+        assert age == 0 and props["age"] == "0"
+
+        full = self.tracker.delta(self.player, None)
+        assert full.since is None and full.age == 0
+        assert full.diff[0][0] == "add"
+        assert self.tracker.delta(self.player, 0).diff == []
+
+        self.ct.tick(2)
+        frame = self.tracker.delta(self.player, 0)
+        assert (frame.since, frame.age) == (0, 2)
+        assert frame.diff == [
+            ("change", "age", ("0", "1")),
+            ("change", "age", ("1", "2")),
+        ]
+        assert self.tracker.delta(self.player, 1).diff == [frame.diff[1]]
+
+    def test_shared(self) -> None:
+        self.tracker.watch(self.player)
+        self.tracker.watch(self.player)
+        self.ct.tick()
+        frame, a = self.tracker.encoded(self.player, 0, EncodeMode.JSON)
+        _, b = self.tracker.encoded(self.player, 0, EncodeMode.JSON)
+        assert a is b
+        payload = WSPayload.from_bytes(a, EncodeMode.JSON)
+        diff = [["change", "age", ["0", "1"]]]
+        assert payload.detail == {"diff": diff, "age": 1, "since": 0}
+        _, c = self.tracker.encoded(self.player, 0, EncodeMode.BINARY)
+        assert WSPayload.from_bytes(c, EncodeMode.BINARY) == payload
+
+        self.tracker.unwatch(self.player)
+        self.ct.tick()
+        assert self.tracker.age(self.player) == 2
+        self.tracker.unwatch(self.player)
+        with self.assertRaises(KeyError):
+            self.tracker.age(self.player)
+
+    def test_history(self) -> None:
+        self.tracker.history_size = 2
+        self.tracker.watch(self.player)
+        self.ct.tick(3)
+        assert self.tracker.delta(self.player, 0).since is None  # resync
+        assert self.tracker.delta(self.player, 1).since == 1
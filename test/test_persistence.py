@@ -0,0 +1,145 @@
+import os
+import pickle
+import tempfile
+import unittest
+from dataclasses import dataclass, field
+
+from pyworld.basic import Vector
+from pyworld.modules.equipments.radar import Radar
+from pyworld.modules.item import Item
+from pyworld.msgbus import MsgEntry
+from pyworld.persistence import WorldStore
+from pyworld.player import Player
+from pyworld.world import Character, World
+
+
+@dataclass
+class Coal(Item):
+    mass: int = field(default=1, init=False)
+
+
+class TestWorldStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "save.bin")
+        self.store = WorldStore(self.path, compact_every=3)
+
+        self.world = World()
+        self.player: Player = self.world.world_new_entity(
+            cls=Player,
+            pos=Vector(0, 0, 0),
+            username="test",
+            passwd="1",
+            world=self.world,
+        )
+        self.radar: Radar = self.world.world_new_entity(cls=Radar)
+        self.player._equip_add(self.radar)
+        self.char = self.world.world_new_entity(
+            cls=Character, pos=Vector(1, 0, 0), velo=Vector(0, 1, 0)
+        )
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def load(self) -> World:
+        return WorldStore(self.path).load()
+
+    def test_base(self) -> None:
+        self.store.save(self.world)
+        assert not os.path.exists(self.store.delta_path)
+        world = self.load()
+        player = world.player_dict["test"]
+        assert player is world.entity_dict[self.player.eid]
+        assert player.equip_list[0] is world.entity_dict[self.radar.eid]
+        assert player.equip_list[0].owner is player
+        assert world.entity_count == self.world.entity_count
+
+    def test_delta(self) -> None:
+        size_base = self.store.save(self.world)
+        self.world._tick()
+        self.world._tick()
+        self.player.msg_inbox.extend([MsgEntry(1, 0, b"hello")])
+        size_delta = self.store.save(self.world)
+        assert os.path.exists(self.store.delta_path)
+        assert size_delta < size_base
+
+        self.world.world_del_entity(self.char.eid)
+        new_char = self.world.world_new_entity(Character, pos=Vector(5, 5, 5))
+        self.store.save(self.world)
+
+        world = self.load()
+        assert world.age == 2
+        assert list(world.entity_dict) == list(self.world.entity_dict)
+        assert world.entity_dict[new_char.eid].position == Vector(5, 5, 5)
+        inbox = world.player_dict["test"].msg_inbox
+        assert list(inbox) == [MsgEntry(1, 0, b"hello")]
+        world._tick()  # kinematics store is rebuilt
+        assert world.entity_dict[new_char.eid].age == 1
+
+    def test_dirty(self) -> None:
+        self.store.save(self.world)
+        self.player.passwd = "2"
+        data, base = self.store.capture(self.world)
+        fields = pickle.loads(data)["fields"][self.player.eid]
+        assert "passwd" in fields
+        assert "username" not in fields
+
+        self.player.passwd = "1"
+        self.store.save(self.world)
+        world = self.load()
+        assert world.player_dict["test"].passwd == "1"
+
+    def test_dirty_equipment(self) -> None:
+        self.store.save(self.world)
+        self.radar.radius = 2
+        data, base = self.store.capture(self.world)
+        fields = pickle.loads(data)["fields"][self.radar.eid]
+        assert "radius" in fields
+        assert "owner" not in fields  # an entity, only changed by assignment
+
+    def test_snapshot(self) -> None:
+        self.store.save(self.world)
+        self.player.msg_channels.add("a")  # in place
+        snapshot = self.store.snapshot(self.world)
+        self.world._tick()  # ticks go on before packing
+        self.player.msg_channels.add("b")
+        self.player.cargo._append(Coal().to_stack(1))
+        self.player.position = Vector(9, 9, 9)
+        self.store.write(*self.store.pack(snapshot))
+
+        world = self.load()
+        player = world.player_dict["test"]
+        assert world.age == 0
+        assert player.msg_channels == {"a"}
+        assert player.cargo.count == 0
+        assert player.position == Vector(0, 0, 0)
+        assert world.entity_dict[self.char.eid].position == Vector(1, 0, 0)
+
+    def test_dirty_inline_entity(self) -> None:
+        self.store.save(self.world)
+        self.player.cargo._append(Coal().to_stack(5))  # not in entity_dict
+        self.store.save(self.world)
+        cargo = self.load().player_dict["test"].cargo
+        assert cargo.count == 5 and cargo["Coal"].num == 5
+
+    def test_compact(self) -> None:
+        for i in range(4):
+            self.world._tick()
+            self.store.save(self.world)
+        assert os.path.exists(self.store.delta_path)
+        self.world._tick()
+        self.store.save(self.world)  # the 5th save is compacted
+        assert not os.path.exists(self.store.delta_path)
+        world = self.load()
+        assert world.age == 5
+        assert world.entity_dict[self.char.eid].position == Vector(1, 5, 0)
+
+    def test_legacy(self) -> None:
+        with open(self.path, mode="wb") as f:
+            pickle.dump(self.world, f, protocol=5)
+        world = self.load()
+        assert world.player_dict["test"].username == "test"
+
+
+if __name__ == "__main__":
+    unittest.main()
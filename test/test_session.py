@@ -0,0 +1,64 @@
+import time
+import unittest
+
+from pyworld.datamodels.session import (
+    SessionTable,
+    hash_passwd,
+    is_passwd_hash,
+    verify_passwd,
+)
+
+
+class TestPasswd(unittest.TestCase):
+    def test_hash(self) -> None:
+        stored = hash_passwd("1", iterations=10)
+        assert is_passwd_hash(stored)
+        assert stored != hash_passwd("1", iterations=10)  # salted
+        assert verify_passwd(stored, "1")
+        assert not verify_passwd(stored, "2")
+        assert not verify_passwd(stored[:-3], "1")
+
+    def test_plain(self) -> None:
+        assert verify_passwd("1", "1")
+        assert not verify_passwd("1", "2")
+
+
+class TestSessionTable(unittest.TestCase):
+    def test_issue(self) -> None:
+        table = SessionTable()
+        a = table.issue("a")
+        b = table.issue("a")
+        assert a != b
+        assert table.get(a) == "a"
+        assert table.get("nope") is None
+        assert table.revoke(a)
+        assert not table.revoke(a)
+        assert table.get(a) is None
+        assert table.revoke_user("a") == 1
+        assert len(table) == 0
+
+    def test_lru(self) -> None:
+        table = SessionTable(max_size=2)
+        a = table.issue("a")
+        b = table.issue("b")
+        table.get(a)  # b is the least recently used
+        c = table.issue("c")
+        assert table.get(b) is None
+        assert table.get(a) == "a"
+        assert table.get(c) == "c"
+
+    def test_expire(self) -> None:
+        table = SessionTable(ttl=0.2)
+        a = table.issue("a")
+        b = table.issue("b")
+        time.sleep(0.12)
+        assert table.get(a) == "a"  # used, expires later
+        time.sleep(0.12)
+        assert table.get(b) is None
+        assert table.purge() == 0
+        time.sleep(0.25)
+        assert table.purge() == 1
+
+
+if __name__ == "__main__":
+    unittest.main()
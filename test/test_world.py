@@ -1,8 +1,18 @@
+import math
+import pickle
+import random
+import threading
+import time
 import unittest
+from concurrent.futures import Future
+from typing import List
 
 from pyworld.basic import Vector
 from pyworld.entity import Entity
-from pyworld.world import Character, Continuum, World
+from pyworld.modules.message import MsgMixin
+from pyworld.msgbus import MsgDrop, MsgEntry, MsgInbox, MsgPayload, MsgStatus
+from pyworld.spatial import BruteForceIndex
+from pyworld.world import Character, Continuum, World, mark_isolate
 
 
 class TestEntity(Entity):
@@ -14,6 +24,14 @@ class TestEntity(Entity):
         self._test_target = True
 
 
+class Beacon(Entity):
+    """Positional, but not a Character."""
+
+    def __init__(self, pos: Vector, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.position = pos
+
+
 class TestWorld(unittest.TestCase):
     def setUp(self) -> None:
         self.ct: Continuum = Continuum()
@@ -150,6 +168,17 @@ class TestWorld(unittest.TestCase):
         assert self.ct.world.world_get_natural_distance(self.char1, char6) == 5
         assert self.ct.world.world_get_natural_distance(self.char1, char7) == 13
 
+    def test_get_natural_distances(self) -> None:
+        world = self.ct.world
+        pairs = [
+            (self.char1, self.char2),
+            (self.char1.eid, self.char3.eid),
+            (self.char1, self.test_ent),
+            (self.char1, 1000),
+        ]
+        assert world.world_get_natural_distances(pairs) == [1, 10, None, None]
+        assert world.world_get_natural_distances([]) == []
+
 
 class TestCharacter(unittest.TestCase):
     def setUp(self) -> None:
@@ -166,3 +195,409 @@ class TestCharacter(unittest.TestCase):
         )
         self.ct.world._tick()
         assert c_move.position == Vector(0, 0, 1)
+
+
+class Messenger(MsgMixin, Character):
+    pass
+
+
+class TestMsgBus(unittest.TestCase):
+    def setUp(self) -> None:
+        self.world = World()
+        self.a: Messenger = self.world.world_new_entity(Messenger, pos=Vector(0, 0, 0))
+        self.b: Messenger = self.world.world_new_entity(Messenger, pos=Vector(3, 4, 0))
+        self.far: Messenger = self.world.world_new_entity(
+            Messenger, pos=Vector(1000, 0, 0)
+        )
+        self.char: Character = self.world.world_new_entity(
+            Character, pos=Vector(1, 0, 0)
+        )
+
+    def result(self, sender: Messenger, msg_id: int) -> MsgStatus:
+        return MsgStatus[sender.msg_receipt(msg_id)["result"]]
+
+    @staticmethod
+    def contents(receiver: Messenger) -> List[bytes]:
+        return [entry.content for entry in receiver.msg_inbox]
+
+    def test_route(self) -> None:
+        ids = [
+            self.a.msg_send(self.far.eid, b"far"),  # a miss won't stall the rest
+            self.a.msg_send(self.b.eid, b"1"),
+            self.a.msg_send(self.char.eid, b"no inbox"),
+            self.a.msg_send(1000, b"nobody"),
+            self.a.msg_send(self.b.eid, b"2"),
+        ]
+        self.b.msg_send(self.a.eid, b"3")
+        self.world._tick()
+
+        assert self.contents(self.b) == [b"1", b"2"]
+        assert self.contents(self.a) == [b"3"]
+        assert [self.result(self.a, i) for i in ids] == [
+            MsgStatus.NOT_FOUND,
+            MsgStatus.SENT,
+            MsgStatus.NO_INBOX,
+            MsgStatus.NOT_FOUND,
+            MsgStatus.SENT,
+        ]
+
+        stats = self.world._msg_bus.stats()
+        assert stats["routed"] == 6
+        assert stats["counts"] == {"SENT": 3, "NOT_FOUND": 2, "NO_INBOX": 1}
+        self.world._tick()  # routed payloads are not sent again
+        assert self.contents(self.b) == [b"1", b"2"]
+        assert self.world._msg_bus.stats()["routed"] == 0
+
+    def test_ensure(self) -> None:
+        msg_id = self.a.msg_send_ensure(self.far.eid, b"ensure")
+        tried = []
+        for age in range(8):
+            self.world._tick()
+            if self.world._msg_bus.stats()["routed"]:
+                tried.append(age)
+        assert tried == [0, 1, 3, 7]  # backoff 1, 2, 4 ticks
+        assert self.result(self.a, msg_id) is MsgStatus.ENSURE
+        assert self.a.msg_retry[0][0] == 15
+
+        self.far.position = Vector(0, 0, 1)
+        for _ in range(8):
+            self.world._tick()
+        assert self.result(self.a, msg_id) is MsgStatus.SENT
+        assert self.contents(self.far) == [b"ensure"]
+        assert self.world._msg_bus.stats()["latency_max"] == 5
+
+    def test_receipts(self) -> None:
+        self.a.msg_receipt_size = 2
+        ids = [self.a.msg_send(self.b.eid, b"") for _ in range(3)]
+        assert self.a.msg_receipt(ids[0])["result"] == "PENDING"
+        self.world._tick()
+        assert self.a.msg_outbox == []
+        with self.assertRaises(KeyError):
+            self.a.msg_receipt(ids[0])
+        assert self.a.msg_receipt(ids[2]) == {
+            "msg_id": ids[2],
+            "target_eid": self.b.eid,
+            "result": "SENT",
+            "try_times": 1,
+            "delivered": 1,
+        }
+
+    def test_broadcast(self) -> None:
+        near: Messenger = self.world.world_new_entity(Messenger, pos=Vector(0, 2, 0))
+        near.msg_subscribe("team")
+        all_id = self.a.msg_broadcast(b"all")
+        near_id = self.a.msg_broadcast(b"near", radius=4)
+        team_id = self.a.msg_multicast("team", b"team")
+        self.world._tick()
+
+        assert self.contents(self.a) == []  # not to sender itself
+        assert self.contents(self.b) == [b"all"]
+        assert self.contents(near) == [b"all", b"near", b"team"]
+        assert self.contents(self.far) == []
+        assert self.a.msg_receipt(all_id)["delivered"] == 2
+        assert self.a.msg_receipt(near_id)["delivered"] == 1
+        assert self.a.msg_receipt(team_id)["delivered"] == 1
+        # the content buffer is shared
+        assert list(self.b.msg_inbox)[0].content is list(near.msg_inbox)[0].content
+
+        assert near.msg_unsubscribe("team") == []
+        team_id = self.a.msg_multicast("team", b"team")
+        self.world._tick()
+        assert self.result(self.a, team_id) is MsgStatus.NOT_FOUND
+
+
+    def test_inbox_read_ack(self) -> None:
+        ids = [self.a.msg_send(self.b.eid, bytes([i])) for i in range(3)]
+        self.world._tick()
+        read = self.b.msg_read(2)
+        assert [m["msg_id"] for m in read["messages"]] == ids[:2]
+        assert read["messages"][0]["sender_eid"] == self.a.eid
+        assert read["messages"][1]["content"] == "AQ=="
+        assert read["unread"] == 3
+        assert self.b.msg_read(2) == read  # kept until acked
+
+        assert self.b.msg_ack(ids[1]) == 2
+        assert self.b.msg_ack(ids[1]) == 0
+        assert self.contents(self.b) == [b"\x02"]
+        assert "msg_inbox" in self.b._dir_mask
+
+    def test_legacy_inbox(self) -> None:
+        self.b.__dict__["msg_inbox"] = [b"old"]
+        sent = MsgPayload(self.a.eid, b"", 1.0, result=MsgStatus.SENT)
+        self.b.__dict__["msg_outbox"] = [sent]
+        del self.b.__dict__["msg_retry"], self.b.__dict__["msg_receipts"]
+        b: Messenger = pickle.loads(pickle.dumps(self.b))
+        assert list(b.msg_inbox) == [MsgEntry(0, -1, b"old")]
+        assert b.msg_outbox == [] and b.msg_receipt(sent.msg_id)["result"] == "SENT"
+
+    def test_inbox_drop(self) -> None:
+        inbox = MsgInbox(capacity=2)
+        inbox.extend(MsgEntry(i, 0, b"") for i in range(3))
+        assert [e.msg_id for e in inbox] == [1, 2] and inbox.dropped == 1
+
+        inbox = MsgInbox(capacity=2, drop=MsgDrop.NEWEST)
+        inbox.extend(MsgEntry(i, 0, b"") for i in range(3))
+        assert [e.msg_id for e in inbox] == [0, 1] and inbox.dropped == 1
+        inbox = pickle.loads(pickle.dumps(inbox))
+        assert [e.msg_id for e in inbox] == [0, 1] and inbox.dropped == 1
+
+
+class IsolateEntity(Entity):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.count = 0
+
+    @mark_isolate
+    def _count_tick(self, belong: World) -> None:
+        self.count += 1
+
+
+class TestConcurrent(unittest.TestCase):
+    def setUp(self) -> None:
+        self.ct = Continuum()
+        self.ct.world.concurrent_configure(max_workers=4, chunk_min=8)
+        self.ents = [
+            self.ct.world.world_new_entity(cls=IsolateEntity) for i in range(100)
+        ]
+
+    def tearDown(self) -> None:
+        self.ct.stop()
+
+    def test_chunks(self) -> None:
+        self.ct.world._tick()
+        for ent in self.ents:
+            assert ent.count == 1
+        stats = self.ct.world.concurrent_stats()
+        assert stats["queue_depth"] == 100
+        assert stats["chunks"] == 4
+
+    def test_inline(self) -> None:
+        self.ct.world.concurrent_configure(chunk_min=1000)
+        self.ct.world._tick()
+        assert self.ct.world.concurrent_stats()["chunks"] == 1
+        for ent in self.ents:
+            assert ent.count == 1
+
+    def test_shutdown(self) -> None:
+        self.ct.world._tick()
+        self.ct.stop()
+        self.ct.world._tick()  # a new pool is created when needed
+        assert self.ct.world.concurrent_stats()["chunks"] == 4
+        for ent in self.ents:
+            assert ent.count == 2
+
+
+class TestKinematics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.world = World()
+        self.chars = [
+            self.world.world_new_entity(
+                cls=Character, pos=Vector(i, 0, 0), velo=Vector(0, 0, 1)
+            )
+            for i in range(100)
+        ]
+
+    def test_integrate(self) -> None:
+        self.chars[0].acceleration = Vector(1, 0, 0)
+        self.world._tick()
+        self.world._tick()
+        assert self.chars[0].position == Vector(2, 0, 2)
+        assert self.chars[0].acceleration == Vector(0, 0, 0)
+        assert self.chars[0].velocity == Vector(1, 0, 1)
+        assert self.chars[99].position == Vector(99, 0, 2)
+
+    def test_del_entity(self) -> None:
+        self.world.world_del_entity(self.chars[0].eid)
+        assert len(self.world._kinematics) == 99
+        self.world._tick()
+        assert self.chars[0].position == Vector(0, 0, 0)  # left the world
+        assert self.chars[99].position == Vector(99, 0, 1)
+
+    def test_pickle(self) -> None:
+        self.world._tick()
+        world: World = pickle.loads(pickle.dumps(self.world))
+        assert len(world._kinematics) == 100
+        world._tick()
+        assert world.entity_dict[100].position == Vector(99, 0, 2)
+        assert self.chars[99].position == Vector(99, 0, 1)
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        random.seed(0)
+        self.world = World()
+        self.chars = [
+            self.world.world_new_entity(
+                cls=Character,
+                pos=Vector(*(random.uniform(-100, 100) for i in range(3))),
+                velo=Vector(*(random.uniform(-5, 5) for i in range(3))),
+            )
+            for i in range(300)
+        ]
+
+    def brute_nearby(self, char: Character, radius: float) -> List[Entity]:
+        return [
+            ent
+            for ent in self.chars
+            if ent is not char and (ent.position - char.position).length() < radius
+        ]
+
+    def test_radius(self) -> None:
+        for tick in range(3):
+            for char in self.chars[:30]:
+                for radius in (0, 5, 30, 500):
+                    assert self.world.world_get_nearby_entity(
+                        char, radius
+                    ) == self.brute_nearby(char, radius)
+            self.world._tick()
+
+    def test_many(self) -> None:
+        targets = self.chars[:10] + [-1]
+        result = self.world.world_get_nearby_entities(targets, 40)
+        assert result[-1] == []
+        for char, nearby in zip(self.chars[:10], result):
+            assert nearby == self.brute_nearby(char, 40)
+
+    def test_nearest(self) -> None:
+        for char in self.chars[:30]:
+            nearest = self.world.world_get_nearest_entity(char, k=5)
+            brute = sorted(
+                self.brute_nearby(char, math.inf),
+                key=lambda ent: (ent.position - char.position).length(),
+            )
+            assert nearest == brute[:5]
+
+    def test_brute_force_index(self) -> None:
+        class BruteWorld(World):
+            spatial_index = BruteForceIndex
+
+        world = BruteWorld()
+        a = world.world_new_entity(Character, pos=Vector(0, 0, 0))
+        b = world.world_new_entity(Character, pos=Vector(0, 3, 4))
+        assert world.world_get_nearby_entity(a, 5) == []
+        assert world.world_get_nearby_entity(a, 5.1) == [b]
+        assert world.world_get_nearest_entity(b) == [a]
+
+    def test_positional_entity(self) -> None:
+        char = self.chars[0]
+        pos = char.position + Vector(1, 0, 0)
+        beacon = self.world.world_new_entity(Beacon, pos=pos)
+        assert beacon in self.world.world_get_nearby_entity(char, 1.5)
+        assert beacon not in self.world.world_get_nearby_entity(char, 0.5)
+        assert self.world.world_get_nearest_entity(char) == [beacon]
+        assert char in self.world.world_get_nearby_entity(beacon, 1.5)
+        nearby = self.world.world_get_nearby_entity(char, 500)
+        assert nearby == sorted(nearby, key=lambda ent: ent.eid)
+
+        world: World = pickle.loads(pickle.dumps(self.world))
+        assert beacon.eid in world._loose
+        self.world.world_del_entity(beacon.eid)
+        assert beacon not in self.world.world_get_nearby_entity(char, 1.5)
+
+
+class TestContinuum(unittest.TestCase):
+    def test_tps(self) -> None:
+        ct = Continuum(tps=50)
+        ct.start()
+        time.sleep(0.4)
+        ct.stop()
+        assert 10 <= ct.world.age <= 30
+        stats = ct.tick_stats()
+        assert stats["count"] == ct.world.age
+        assert stats["p50"] <= stats["p99"] <= stats["max"]
+
+    def test_pause(self) -> None:
+        ct = Continuum(tps=200)
+        ct.start()
+        time.sleep(0.05)
+        ct.pause()
+        age = ct.world.age
+        time.sleep(0.05)
+        assert ct.world.age == age
+        ct.resume()
+        time.sleep(0.05)
+        ct.stop()
+        assert ct.world.age > age
+
+    def test_catch_up(self) -> None:
+        ct = Continuum(tps=1000, max_catch_up=2)
+        slow = ct.world.world_new_entity(IsolateEntity)
+        setattr(slow, "_slow_tick", lambda belong: time.sleep(0.01))
+        ct.start()
+        time.sleep(0.1)
+        ct.stop()
+        stats = ct.tick_stats()
+        assert stats["overrun"] == ct.world.age
+        assert stats["skipped"] > 0
+
+    def test_tick_listener(self) -> None:
+        ct = Continuum()
+        ages = []
+
+        def broken(age: int) -> None:
+            raise RuntimeError("broken listener")
+
+        ct.add_tick_listener(broken)
+        ct.add_tick_listener(ages.append)
+        with self.assertWarns(UserWarning):
+            ct.tick(2)
+        assert ages == [1, 2]
+
+        ct.remove_tick_listener(ages.append)
+        ct.remove_tick_listener(broken)
+        ct.tick()
+        assert ages == [1, 2]
+
+    def test_submit(self) -> None:
+        ct = Continuum()
+        seen = []
+
+        def later() -> None:
+            seen.append(("later", ct.world.age))
+
+        def command(name: str) -> int:
+            seen.append((name, ct.world.age))
+            ct.submit(later)  # waits for the next tick
+            return ct.world.age
+
+        a = ct.submit(lambda: command("a"))
+        broken = ct.submit(lambda: 1 // 0)
+        dropped = ct.submit(lambda: command("dropped"))
+        dropped.cancel()
+        b = ct.submit(lambda: command("b"))
+        assert ct.tick_stats()["queued"] == 4
+        ct.tick()
+        assert a.result(timeout=0) == 0 and b.result(timeout=0) == 0
+        with self.assertRaises(ZeroDivisionError):
+            broken.result(timeout=0)
+        assert seen == [("a", 0), ("b", 0)]
+        ct.tick()
+        assert seen[2:] == [("later", 1), ("later", 1)]
+
+        ct.start()
+        assert ct.submit(lambda: "run").result(timeout=5) == "run"
+        ct.pause()
+        pending = ct.submit(lambda: "never")
+        ct.stop()
+        assert pending.cancelled()
+        assert ct.submit(lambda: "stopped").cancelled()
+
+    def test_submit_stop(self) -> None:
+        """Every command submitted around stop() is run or cancelled."""
+        ct = Continuum()
+        ct.start()
+        futures: List[Future[int]] = []
+
+        def submit() -> None:
+            while not ct.stop_flag:
+                futures.append(ct.submit(lambda: 1))
+            futures.append(ct.submit(lambda: 1))
+
+        threads = [threading.Thread(target=submit) for _ in range(4)]
+        for t in threads:
+            t.start()
+        time.sleep(0.05)
+        ct.stop()
+        for t in threads:
+            t.join()
+        assert all(f.done() for f in futures)